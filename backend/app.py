@@ -60,18 +60,27 @@ def create_app():
     
     return app, kb
 
-# 创建应用实例
-app, kb = create_app()
+def create_wsgi_app():
+    """WSGI服务器使用的应用工厂，例如 gunicorn 'app:create_wsgi_app()'"""
+    app, _ = create_app()
+    return app
 
+# 应用只在启动服务时创建：多进程批量编码的工作进程（spawn）会重新导入主模块，
+# 导入时不能创建知识库、初始化语义索引
 if __name__ == '__main__':
+    app, kb = create_app()
     print("🚀 启动 RAG 系统服务器 - 重构优化版本")
     print(f"📚 知识库文档数量: {len(kb.documents)}")
     
     # 检查语义搜索功能
     try:
         from sentence_transformers import SentenceTransformer
-        import faiss
-        embedding_status = '✓ 已启用' if kb.embedding_model else '✗ 模型加载失败'
+        if kb.semantic_ready:
+            embedding_status = '✓ 已启用'
+        elif not kb.semantic_initialized.is_set():
+            embedding_status = '⏳ 后台加载中（就绪前只做关键词检索，进度见 /ready）'
+        else:
+            embedding_status = '✗ 模型加载失败'
     except ImportError:
         embedding_status = '✗ 未安装依赖'
     
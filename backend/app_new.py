@@ -60,10 +60,15 @@ def create_app():
     
     return app, kb
 
-# 创建应用实例
-app, kb = create_app()
+def create_wsgi_app():
+    """WSGI服务器使用的应用工厂，例如 gunicorn 'app_new:create_wsgi_app()'"""
+    app, _ = create_app()
+    return app
 
+# 应用只在启动服务时创建：多进程批量编码的工作进程（spawn）会重新导入主模块，
+# 导入时不能创建知识库、初始化语义索引
 if __name__ == '__main__':
+    app, kb = create_app()
     print("🚀 启动 RAG 系统服务器 - 重构优化版本")
     print(f"📚 知识库文档数量: {len(kb.documents)}")
     
@@ -17,3 +17,77 @@ class Config:
     
     # 知识库配置
     KNOWLEDGE_BASE_PATH = 'knowledge_base'
+    
+    # 嵌入向量缓存配置（按(模型名, 文本哈希)缓存，超出容量按最近使用时间淘汰）
+    EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv('EMBEDDING_CACHE_MAX_ENTRIES', 200000))
+    
+    # 语义向量索引配置
+    # 索引类型：auto（按块数自动选择）/ flat / ivf_flat / ivf_pq / hnsw / numpy
+    SEMANTIC_INDEX_TYPE = os.getenv('SEMANTIC_INDEX_TYPE', 'auto')
+    # 索引后端：auto（安装了faiss时用FAISS，否则用NumPy暴力检索）/ numpy（强制NumPy暴力检索）
+    SEMANTIC_INDEX_BACKEND = os.getenv('SEMANTIC_INDEX_BACKEND', 'auto')
+    # 索引中向量的存储模式：float32 / float16 / int8（标量量化）/ pq（乘积量化，NumPy后端改用int8）
+    # 文档存储中的块向量始终保留float32，用于重建索引和精确检索
+    SEMANTIC_VECTOR_STORAGE = os.getenv('SEMANTIC_VECTOR_STORAGE', 'float32')
+    SEMANTIC_INDEX_NPROBE = int(os.getenv('SEMANTIC_INDEX_NPROBE', 16))  # IVF检索时探查的聚类数
+    SEMANTIC_INDEX_EF_SEARCH = int(os.getenv('SEMANTIC_INDEX_EF_SEARCH', 64))  # HNSW检索时的候选队列长度
+    SEMANTIC_INDEX_TRAIN_SAMPLE = int(os.getenv('SEMANTIC_INDEX_TRAIN_SAMPLE', 100000))  # IVF训练样本数
+    
+    # 向量存储报告接口（/health/vector_storage）：需要临时构建各存储模式的索引，开销大，默认关闭；
+    # 开启后抽样查询数和k有上限，块数超过上限时在随机抽取的块上评估
+    VECTOR_STORAGE_REPORT_ENABLED = os.getenv('VECTOR_STORAGE_REPORT_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+    VECTOR_STORAGE_REPORT_MAX_QUERIES = int(os.getenv('VECTOR_STORAGE_REPORT_MAX_QUERIES', 200))
+    VECTOR_STORAGE_REPORT_MAX_K = int(os.getenv('VECTOR_STORAGE_REPORT_MAX_K', 50))
+    VECTOR_STORAGE_REPORT_MAX_CHUNKS = int(os.getenv('VECTOR_STORAGE_REPORT_MAX_CHUNKS', 20000))
+    
+    # 离线模式：只从本地缓存加载嵌入模型，不尝试在线下载
+    EMBEDDING_OFFLINE = os.getenv('EMBEDDING_OFFLINE', 'false').lower() in ('1', 'true', 'yes')
+    
+    # 全量重建语义索引时的多进程批量编码：工作进程数（0或1时在当前进程中编码，每个进程各加载一份模型）、
+    # 每批块数（批内按长度排序以减少填充）、启用多进程编码的最少块数
+    BULK_ENCODE_WORKERS = int(os.getenv('BULK_ENCODE_WORKERS', 0))
+    BULK_ENCODE_BATCH_SIZE = int(os.getenv('BULK_ENCODE_BATCH_SIZE', 64))
+    BULK_ENCODE_MIN_CHUNKS = int(os.getenv('BULK_ENCODE_MIN_CHUNKS', 1000))
+    
+    # 增删文档后延迟保存语义索引的秒数，期间的多次增删合并为一次写盘（0表示每次增删后立即保存）
+    SEMANTIC_SAVE_DELAY = float(os.getenv('SEMANTIC_SAVE_DELAY', 5))
+    
+    # 启动时在后台线程中加载嵌入模型和语义索引，完成前只提供关键词检索（关闭时启动过程等待初始化完成）
+    BACKGROUND_STARTUP = os.getenv('BACKGROUND_STARTUP', 'true').lower() in ('1', 'true', 'yes')
+    
+    # 新上传文档的块在后台线程中编码并加入向量索引（关闭时上传请求等待编码完成；
+    # 启动时的语义初始化尚未完成时仍排入后台队列，上传请求不等待初始化）
+    BACKGROUND_EMBEDDING = os.getenv('BACKGROUND_EMBEDDING', 'true').lower() in ('1', 'true', 'yes')
+    
+    # 检索结果缓存配置（LRU+TTL，知识库增删文档后自动失效；容量为0时关闭）
+    SEARCH_CACHE_MAX_ENTRIES = int(os.getenv('SEARCH_CACHE_MAX_ENTRIES', 1000))
+    SEARCH_CACHE_TTL = int(os.getenv('SEARCH_CACHE_TTL', 300))  # 秒
+    
+    # 查询编码配置：并发查询在时间窗口内合并为一批编码（窗口<=0时不合并），并缓存最近查询的向量
+    QUERY_ENCODER_BATCH_WINDOW_MS = float(os.getenv('QUERY_ENCODER_BATCH_WINDOW_MS', 5))
+    QUERY_ENCODER_MAX_BATCH_SIZE = int(os.getenv('QUERY_ENCODER_MAX_BATCH_SIZE', 32))
+    QUERY_EMBEDDING_MEMO_SIZE = int(os.getenv('QUERY_EMBEDDING_MEMO_SIZE', 2048))
+    
+    # 两阶段检索：第一阶段按BM25和关键词命中保留的候选文档数，片段抽取、重排序等只在候选上进行
+    SEARCH_CANDIDATE_COUNT = int(os.getenv('SEARCH_CANDIDATE_COUNT', 100))
+    
+    # 批量搜索接口单次请求的最大查询数
+    SEARCH_BATCH_MAX_QUERIES = int(os.getenv('SEARCH_BATCH_MAX_QUERIES', 1000))
+    # 搜索接口参数上限：每个查询返回的结果数、IVF索引的nprobe、HNSW索引的ef_search
+    SEARCH_MAX_RESULTS_LIMIT = int(os.getenv('SEARCH_MAX_RESULTS_LIMIT', 100))
+    SEARCH_NPROBE_LIMIT = int(os.getenv('SEARCH_NPROBE_LIMIT', 1024))
+    SEARCH_EF_SEARCH_LIMIT = int(os.getenv('SEARCH_EF_SEARCH_LIMIT', 4096))
+    
+    # 检索分支并行配置：语义分支与词法分支在共享线程池中并行执行，超时的分支被跳过
+    SEARCH_BRANCH_WORKERS = int(os.getenv('SEARCH_BRANCH_WORKERS', 8))
+    SEMANTIC_BRANCH_TIMEOUT = float(os.getenv('SEMANTIC_BRANCH_TIMEOUT', 5.0))  # 秒
+    LEXICAL_BRANCH_TIMEOUT = float(os.getenv('LEXICAL_BRANCH_TIMEOUT', 5.0))  # 秒
+    
+    # 检索速度档位：fast（只做精确关键词检索）/ balanced（跳过模糊匹配）/ thorough（全部阶段）
+    # 各档位的默认时间预算（毫秒，0为不限时），到达截止时间后跳过剩余的可选阶段
+    SEARCH_DEFAULT_PROFILE = os.getenv('SEARCH_DEFAULT_PROFILE', 'thorough')
+    SEARCH_PROFILE_BUDGETS_MS = {
+        'fast': int(os.getenv('SEARCH_FAST_BUDGET_MS', 200)),
+        'balanced': int(os.getenv('SEARCH_BALANCED_BUDGET_MS', 1000)),
+        'thorough': int(os.getenv('SEARCH_THOROUGH_BUDGET_MS', 0)),
+    }
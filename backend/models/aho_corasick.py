@@ -0,0 +1,220 @@
+"""
+Aho-Corasick 多模式匹配模块
+一次扫描文本即可找出所有出现的模式，模式可按键（如文档ID）增量增删
+"""
+import threading
+from collections import deque
+
+
+class AhoCorasick:
+    """可增量维护的 Aho-Corasick 自动机
+
+    每个节点记录失败链接指向它的节点（失败树的反向边）。新增模式时只为新节点建立失败链接，
+    并把最长后缀变为新节点的已有节点改指向它；删除模式时清除结束标记，剪除不再属于任何模式的节点，
+    指向被剪节点的失败链接改指向次长的后缀。增删只触及受影响的节点，不整体重建；
+    增删与匹配由锁互斥，可在多线程中使用。
+    """
+
+    def __init__(self):
+        self.goto = {0: {}}  # 节点 -> {字符: 子节点}
+        self.parent = {0: None}  # 节点 -> (父节点, 字符)
+        self.depth = {0: 0}  # 节点 -> 对应字符串的长度
+        self.fail = {0: 0}  # 节点 -> 失败链接（最长的真后缀节点）
+        self.fail_children = {}  # 节点 -> 失败链接指向它的节点（没有时不建条目）
+        self.output_link = {0: -1}  # 节点 -> 沿失败链最近的模式结束节点
+        self.node_pattern = {0: None}  # 节点 -> 在此结束的模式
+        self.pattern_keys = {}  # 模式 -> {键: 引用计数}
+        self.key_patterns = {}  # 键 -> 模式列表（用于按键删除）
+        self._next_node = 1
+        self._lock = threading.Lock()
+
+    @classmethod
+    def build(cls, items):
+        """由 [(键, 模式列表)] 一次性构建自动机：先插入全部模式，再按BFS统一建立链接（启动时批量加载使用）"""
+        automaton = cls()
+        for key, patterns in items:
+            automaton._add_patterns(key, patterns, automaton._insert_path)
+        automaton._link_all()
+        return automaton
+
+    def add(self, key, patterns):
+        """为键加入一组模式"""
+        with self._lock:
+            self._add_patterns(key, patterns, self._insert)
+
+    def _add_patterns(self, key, patterns, insert):
+        patterns = [pattern for pattern in patterns if pattern]
+        self.key_patterns.setdefault(key, []).extend(patterns)
+        for pattern in patterns:
+            keys = self.pattern_keys.get(pattern)
+            if keys is None:
+                keys = self.pattern_keys[pattern] = {}
+                insert(pattern)
+            keys[key] = keys.get(key, 0) + 1
+
+    def remove(self, key):
+        """移除键的全部模式"""
+        with self._lock:
+            for pattern in self.key_patterns.pop(key, []):
+                keys = self.pattern_keys.get(pattern)
+                if keys is None or key not in keys:
+                    continue
+                keys[key] -= 1
+                if keys[key] <= 0:
+                    del keys[key]
+                if not keys:
+                    del self.pattern_keys[pattern]
+                    self._delete(pattern)
+
+    def _insert(self, pattern):
+        node = 0
+        for char in pattern:
+            child = self.goto[node].get(char)
+            if child is None:
+                child = self._new_node(node, char)
+            node = child
+        if self.node_pattern[node] is None:
+            self.node_pattern[node] = pattern
+            # 失败链上没有更近结束节点的后代，输出链接改为指向该节点
+            self._refresh_outputs(self.fail_children.get(node, ()))
+
+    def _insert_path(self, pattern):
+        """只插入字典树节点，不建立链接（批量构建后由 _link_all 统一建立）"""
+        node = 0
+        for char in pattern:
+            child = self.goto[node].get(char)
+            if child is None:
+                child = self._create_node(node, char)
+                self.goto[node][char] = child
+            node = child
+        self.node_pattern[node] = pattern
+
+    def _link_all(self):
+        """BFS 建立全部节点的失败链接和输出链接"""
+        queue = deque([0])
+        while queue:
+            node = queue.popleft()
+            for char, child in self.goto[node].items():
+                fail_node = 0
+                if node:
+                    fail_node = self.fail[node]
+                    while fail_node and char not in self.goto[fail_node]:
+                        fail_node = self.fail[fail_node]
+                    fail_node = self.goto[fail_node].get(char, 0)
+                self._set_fail(child, fail_node)
+                self.output_link[child] = self._output_of(fail_node)
+                queue.append(child)
+
+    def _create_node(self, parent, char):
+        node = self._next_node
+        self._next_node += 1
+        self.goto[node] = {}
+        self.parent[node] = (parent, char)
+        self.depth[node] = self.depth[parent] + 1
+        self.output_link[node] = -1
+        self.node_pattern[node] = None
+        return node
+
+    def _new_node(self, parent, char):
+        """在 parent 下插入字符为 char 的新节点，建立它的失败链接并修正受影响的已有节点"""
+        node = self._create_node(parent, char)
+
+        # 沿父节点的失败链找第一个有 char 子节点的节点（根的子节点指向根）
+        fail_node = 0
+        if parent:
+            fail_node = self.fail[parent]
+            while fail_node and char not in self.goto[fail_node]:
+                fail_node = self.fail[fail_node]
+            fail_node = self.goto[fail_node].get(char, 0)
+        self._set_fail(node, fail_node)
+        self.output_link[node] = self._output_of(fail_node)
+        self.goto[parent][char] = node
+
+        # 以父节点的串为后缀的节点（父节点的失败子树）若有 char 子节点，该子节点的最长后缀变为新节点；
+        # 它们失败子树中更深的节点经由该子节点已有更长的后缀，不受影响
+        stack = list(self.fail_children.get(parent, ()))
+        while stack:
+            suffix_node = stack.pop()
+            affected = self.goto[suffix_node].get(char)
+            if affected is None:
+                stack.extend(self.fail_children.get(suffix_node, ()))
+            elif self.depth[self.fail[affected]] < self.depth[node]:
+                self._set_fail(affected, node)
+                self._refresh_outputs((affected,))
+        return node
+
+    def _delete(self, pattern):
+        """清除模式的结束标记，并剪除不再属于任何模式的叶子节点"""
+        node = 0
+        for char in pattern:
+            node = self.goto[node].get(char)
+            if node is None:
+                return
+        self.node_pattern[node] = None
+        self._refresh_outputs(self.fail_children.get(node, ()))
+        while node and not self.goto[node] and self.node_pattern[node] is None:
+            parent, _ = self.parent[node]
+            self._remove_node(node)
+            node = parent
+
+    def _remove_node(self, node):
+        """删除叶子节点；失败链接指向它的节点改指向它的失败链接（次长的后缀），输出链接不变"""
+        parent, char = self.parent.pop(node)
+        del self.goto[parent][char]
+        fail_node = self.fail.pop(node)
+        self._discard_fail_child(fail_node, node)
+        for child in self.fail_children.pop(node, ()):
+            self.fail[child] = fail_node
+            self.fail_children.setdefault(fail_node, set()).add(child)
+        del self.goto[node]
+        del self.depth[node]
+        del self.output_link[node]
+        del self.node_pattern[node]
+
+    def _set_fail(self, node, fail_node):
+        old = self.fail.get(node)
+        if old is not None:
+            self._discard_fail_child(old, node)
+        self.fail[node] = fail_node
+        self.fail_children.setdefault(fail_node, set()).add(node)
+
+    def _discard_fail_child(self, fail_node, node):
+        children = self.fail_children.get(fail_node)
+        if children is not None:
+            children.discard(node)
+            if not children:
+                del self.fail_children[fail_node]
+
+    def _output_of(self, node):
+        """经过节点时最近的模式结束节点（节点自身或它的输出链接）"""
+        return node if self.node_pattern[node] is not None else self.output_link[node]
+
+    def _refresh_outputs(self, nodes):
+        """重新计算这些节点及其失败子树的输出链接，遇到模式结束节点时停止向下"""
+        stack = list(nodes)
+        while stack:
+            node = stack.pop()
+            self.output_link[node] = self._output_of(self.fail[node])
+            if self.node_pattern[node] is None:
+                stack.extend(self.fail_children.get(node, ()))
+
+    def find(self, text):
+        """扫描文本，返回出现过的模式 {模式: {键: 引用计数}}"""
+        found = {}
+        with self._lock:
+            node = 0
+            for char in text:
+                while node and char not in self.goto[node]:
+                    node = self.fail[node]
+                node = self.goto[node].get(char, 0)
+
+                match_node = self._output_of(node)
+                while match_node > 0:
+                    pattern = self.node_pattern[match_node]
+                    if pattern not in found:
+                        found[pattern] = dict(self.pattern_keys[pattern])
+                    match_node = self.output_link[match_node]
+        return found
+
+    def __len__(self):
+        return len(self.pattern_keys)
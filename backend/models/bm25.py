@@ -0,0 +1,140 @@
+"""
+BM25检索模块
+基于倒排索引中的词频统计打分，文档增删时统计随倒排索引增量更新
+"""
+import math
+import numpy as np
+
+try:
+    from scipy import sparse
+    SCIPY_AVAILABLE = True
+except ImportError:
+    SCIPY_AVAILABLE = False
+
+
+class BM25Scorer:
+    """Okapi BM25 打分器"""
+
+    def __init__(self, inverted_index, k1=1.5, b=0.75):
+        self.index = inverted_index
+        self.k1 = k1
+        self.b = b
+        self._posting_cache = {}  # 词项 -> (文档ID数组, 词频数组, 文档长度数组)，供批量打分复用
+        self._posting_cache_version = None
+
+    def idf(self, term):
+        """BM25 逆文档频率（平滑版本，保证非负）"""
+        n = len(self.index)
+        df = self.index.document_frequency(term)
+        return math.log(1 + (n - df + 0.5) / (df + 0.5))
+
+    def score(self, query_terms, doc_ids=None):
+        """计算查询对各文档的BM25分数，只遍历查询词的倒排列表
+
+        返回 {文档ID: 归一化分数}，归一化以该查询可能达到的最高分为基准，结果落在0~1之间
+        """
+        query_terms = list(dict.fromkeys(query_terms))
+        if not query_terms or not len(self.index):
+            return {}
+
+        avgdl = self.index.average_document_length() or 1
+        scores = {}
+        max_possible = 0
+        for term in query_terms:
+            postings = self.index.get_postings(term)
+            if not postings:
+                continue
+            idf = self.idf(term)
+            max_possible += idf * (self.k1 + 1)
+            for doc_id, tf in postings.items():
+                if doc_ids is not None and doc_id not in doc_ids:
+                    continue
+                doc_length = self.index.document_lengths.get(doc_id, 0)
+                norm = self.k1 * (1 - self.b + self.b * doc_length / avgdl)
+                scores[doc_id] = scores.get(doc_id, 0) + idf * tf * (self.k1 + 1) / (tf + norm)
+
+        if max_possible <= 0:
+            return {}
+        return {doc_id: score / max_possible for doc_id, score in scores.items()}
+
+    def _posting_arrays(self, term):
+        """词项倒排列表的数组形式，倒排索引变化后缓存整体失效"""
+        if self._posting_cache_version != self.index.version:
+            self._posting_cache = {}
+            self._posting_cache_version = self.index.version
+        arrays = self._posting_cache.get(term)
+        if arrays is None:
+            postings = self.index.get_postings(term)
+            doc_ids = np.fromiter(postings.keys(), dtype='int64', count=len(postings))
+            tfs = np.fromiter(postings.values(), dtype='float64', count=len(postings))
+            doc_lengths = np.array([self.index.document_lengths.get(doc_id, 0) for doc_id in postings],
+                                   dtype='float64')
+            arrays = self._posting_cache[term] = (doc_ids, tfs, doc_lengths)
+        return arrays
+
+    def score_many(self, queries_terms, min_score=None):
+        """批量计算多个查询的BM25分数
+
+        查询-词项矩阵与词项-文档权重矩阵做一次稀疏矩阵乘法，查询之间共享的词项只计算一次权重；
+        返回与 queries_terms 一一对应的 {文档ID: 归一化分数}，给定 min_score 时只保留高于它的分数
+        """
+        queries_terms = [list(dict.fromkeys(terms)) for terms in queries_terms]
+        if not SCIPY_AVAILABLE:
+            results = [self.score(terms) for terms in queries_terms]
+            if min_score is not None:
+                results = [{doc_id: score for doc_id, score in scores.items() if score > min_score}
+                           for scores in results]
+            return results
+        if not len(self.index):
+            return [{} for _ in queries_terms]
+
+        term_rows = {}
+        for terms in queries_terms:
+            for term in terms:
+                if term not in term_rows and self.index.get_postings(term):
+                    term_rows[term] = len(term_rows)
+        if not term_rows:
+            return [{} for _ in queries_terms]
+
+        # 词项-文档权重矩阵，按词项的倒排数组向量化计算
+        avgdl = self.index.average_document_length() or 1
+        idfs = {}
+        rows, doc_id_parts, weight_parts = [], [], []
+        for term, row in term_rows.items():
+            idf = idfs[term] = self.idf(term)
+            doc_ids, tfs, doc_lengths = self._posting_arrays(term)
+            norms = self.k1 * (1 - self.b + self.b * doc_lengths / avgdl)
+            rows.append(np.full(len(doc_ids), row))
+            doc_id_parts.append(doc_ids)
+            weight_parts.append(idf * tfs * (self.k1 + 1) / (tfs + norms))
+        doc_ids, cols = np.unique(np.concatenate(doc_id_parts), return_inverse=True)
+        term_doc = sparse.csr_matrix((np.concatenate(weight_parts), (np.concatenate(rows), cols)),
+                                     shape=(len(term_rows), len(doc_ids)))
+
+        # 查询-词项矩阵，同时计算每个查询可能达到的最高分
+        query_rows, query_cols = [], []
+        max_possible = np.zeros(len(queries_terms))
+        for query_index, terms in enumerate(queries_terms):
+            for term in terms:
+                row = term_rows.get(term)
+                if row is not None:
+                    query_rows.append(query_index)
+                    query_cols.append(row)
+                    max_possible[query_index] += idfs[term] * (self.k1 + 1)
+        query_term = sparse.csr_matrix((np.ones(len(query_rows)), (query_rows, query_cols)),
+                                       shape=(len(queries_terms), len(term_rows)))
+
+        scores = (query_term @ term_doc).tocsr()
+        results = []
+        for query_index in range(len(queries_terms)):
+            if max_possible[query_index] <= 0:
+                results.append({})
+                continue
+            start, end = scores.indptr[query_index], scores.indptr[query_index + 1]
+            values = scores.data[start:end] / max_possible[query_index]
+            columns = scores.indices[start:end]
+            if min_score is not None:
+                keep = values > min_score
+                values, columns = values[keep], columns[keep]
+            results.append(dict(zip(doc_ids[columns].tolist(), values.tolist())))
+        return results
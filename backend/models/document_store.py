@@ -0,0 +1,488 @@
+"""
+文档存储模块
+基于SQLite的文档存储，按文档增删，正文按需读取
+"""
+import os
+import json
+import sqlite3
+import threading
+import numpy as np
+from datetime import datetime
+
+
+class DocumentStore:
+    """SQLite文档存储：每个线程使用独立连接，WAL模式下读写互不阻塞"""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        self._local = threading.local()
+        self._init_schema()
+
+    def _connect(self):
+        """获取当前线程的数据库连接"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('PRAGMA foreign_keys=ON')
+            self._local.conn = conn
+        return conn
+
+    def _init_schema(self):
+        """初始化表结构"""
+        conn = self._connect()
+        with conn:
+            # AUTOINCREMENT 保证删除后文档ID不会被复用
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS documents (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    filename TEXT NOT NULL,
+                    content TEXT NOT NULL,
+                    content_length INTEGER NOT NULL,
+                    created_at TEXT NOT NULL
+                )
+            ''')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS chunks (
+                    id INTEGER PRIMARY KEY,
+                    document_id INTEGER NOT NULL REFERENCES documents(id) ON DELETE CASCADE,
+                    text TEXT NOT NULL
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_chunks_document ON chunks(document_id)')
+            # 块级倒排索引的持久化形式：每个块的词频统计（块ID与向量索引共享）
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS chunk_terms (
+                    chunk_id INTEGER NOT NULL REFERENCES chunks(id) ON DELETE CASCADE,
+                    term TEXT NOT NULL,
+                    tf INTEGER NOT NULL,
+                    PRIMARY KEY (chunk_id, term)
+                ) WITHOUT ROWID
+            ''')
+            # 计数器：块ID只增不减，删除文档后也不会复用（HNSW索引中的墓碑仍占用旧ID）
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS counters (
+                    name TEXT PRIMARY KEY,
+                    value INTEGER NOT NULL
+                )
+            ''')
+            # 倒排索引的持久化形式：每个文档的词频统计
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS document_terms (
+                    document_id INTEGER NOT NULL REFERENCES documents(id) ON DELETE CASCADE,
+                    term TEXT NOT NULL,
+                    tf INTEGER NOT NULL,
+                    PRIMARY KEY (document_id, term)
+                ) WITHOUT ROWID
+            ''')
+            # 预先切分好的句子（只保存可用作片段的句子）及句子级词项倒排
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS sentences (
+                    document_id INTEGER NOT NULL REFERENCES documents(id) ON DELETE CASCADE,
+                    sentence_index INTEGER NOT NULL,
+                    text TEXT NOT NULL,
+                    text_lower TEXT NOT NULL,
+                    PRIMARY KEY (document_id, sentence_index)
+                ) WITHOUT ROWID
+            ''')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS sentence_terms (
+                    document_id INTEGER NOT NULL REFERENCES documents(id) ON DELETE CASCADE,
+                    term TEXT NOT NULL,
+                    sentence_indexes TEXT NOT NULL,
+                    PRIMARY KEY (document_id, term)
+                ) WITHOUT ROWID
+            ''')
+
+            # 旧库升级：记录文档词法索引的版本，版本落后的文档会被重新索引
+            columns = {row['name'] for row in conn.execute('PRAGMA table_info(documents)')}
+            if 'index_version' not in columns:
+                conn.execute('ALTER TABLE documents ADD COLUMN index_version INTEGER NOT NULL DEFAULT 0')
+            # 旧库升级：块向量与块文本一起保存，切换或重训向量索引时无需重新编码
+            columns = {row['name'] for row in conn.execute('PRAGMA table_info(chunks)')}
+            if 'embedding' not in columns:
+                conn.execute('ALTER TABLE chunks ADD COLUMN embedding BLOB')
+
+    @staticmethod
+    def _metadata(row):
+        """行记录转换为不含正文的文档元数据"""
+        return {
+            'id': row['id'],
+            'filename': row['filename'],
+            'created_at': row['created_at'],
+            'content_length': row['content_length']
+        }
+
+    def add_document(self, filename, content, created_at=None, doc_id=None):
+        """插入一个文档，返回文档元数据"""
+        created_at = created_at or datetime.now().isoformat()
+        conn = self._connect()
+        with conn:
+            cursor = conn.execute(
+                'INSERT INTO documents (id, filename, content, content_length, created_at) '
+                'VALUES (?, ?, ?, ?, ?)',
+                (doc_id, filename, content, len(content), created_at)
+            )
+        return {
+            'id': cursor.lastrowid,
+            'filename': filename,
+            'created_at': created_at,
+            'content_length': len(content)
+        }
+
+    def delete_document(self, doc_id):
+        """删除一个文档及其语义块"""
+        conn = self._connect()
+        with conn:
+            cursor = conn.execute('DELETE FROM documents WHERE id = ?', (doc_id,))
+        return cursor.rowcount > 0
+
+    def get_document(self, doc_id):
+        """按ID获取文档（包含正文）"""
+        row = self._connect().execute(
+            'SELECT id, filename, content, content_length, created_at FROM documents WHERE id = ?',
+            (doc_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        doc = self._metadata(row)
+        doc['content'] = row['content']
+        return doc
+
+    def get_content(self, doc_id):
+        """按ID获取文档正文"""
+        row = self._connect().execute(
+            'SELECT content FROM documents WHERE id = ?', (doc_id,)
+        ).fetchone()
+        return row['content'] if row else None
+
+    def iter_documents(self, doc_ids=None, batch_size=64):
+        """流式遍历文档（包含正文），避免一次性把全部正文读入内存"""
+        conn = self._connect()
+        if doc_ids is None:
+            cursor = conn.execute(
+                'SELECT id, filename, content, content_length, created_at FROM documents ORDER BY id'
+            )
+            yield from self._iter_cursor(cursor, batch_size)
+            return
+
+        doc_ids = list(doc_ids)
+        for start in range(0, len(doc_ids), batch_size):
+            batch = doc_ids[start:start + batch_size]
+            placeholders = ','.join('?' * len(batch))
+            cursor = conn.execute(
+                f'SELECT id, filename, content, content_length, created_at FROM documents '
+                f'WHERE id IN ({placeholders}) ORDER BY id',
+                batch
+            )
+            yield from self._iter_cursor(cursor, batch_size)
+
+    def _iter_cursor(self, cursor, batch_size):
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            for row in rows:
+                doc = self._metadata(row)
+                doc['content'] = row['content']
+                yield doc
+
+    def list_documents(self):
+        """列出所有文档元数据（不含正文）"""
+        rows = self._connect().execute(
+            'SELECT id, filename, content_length, created_at FROM documents ORDER BY id'
+        ).fetchall()
+        return [self._metadata(row) for row in rows]
+
+    def replace_chunks(self, doc_id, chunk_ids, texts, embeddings=None):
+        """写入文档的块及其向量（覆盖该文档已有的块），并推进块ID计数器"""
+        if embeddings is None:
+            embeddings = [None] * len(chunk_ids)
+        conn = self._connect()
+        with conn:
+            conn.execute('DELETE FROM chunks WHERE document_id = ?', (doc_id,))
+            conn.executemany(
+                'INSERT INTO chunks (id, document_id, text, embedding) VALUES (?, ?, ?, ?)',
+                [(int(chunk_id), doc_id, text, self._vector_blob(vector))
+                 for chunk_id, text, vector in zip(chunk_ids, texts, embeddings)]
+            )
+            if len(chunk_ids):
+                conn.execute(
+                    "INSERT INTO counters (name, value) VALUES ('next_chunk_id', ?) "
+                    "ON CONFLICT(name) DO UPDATE SET value = MAX(value, excluded.value)",
+                    (int(max(chunk_ids)) + 1,)
+                )
+
+    def next_chunk_id(self):
+        """下一个可分配的块ID（没有记录时为0）"""
+        row = self._connect().execute(
+            "SELECT value FROM counters WHERE name = 'next_chunk_id'"
+        ).fetchone()
+        return row['value'] if row else 0
+
+    def get_document_chunks(self, doc_id):
+        """文档的全部块 [(块ID, 块文本)]，按块ID排序"""
+        rows = self._connect().execute(
+            'SELECT id, text FROM chunks WHERE document_id = ? ORDER BY id', (doc_id,)
+        ).fetchall()
+        return [(row['id'], row['text']) for row in rows]
+
+    def get_chunk_ranges(self):
+        """各文档的块ID区间 {文档ID: (起始块ID, 结束块ID)}，左闭右开"""
+        rows = self._connect().execute(
+            'SELECT document_id, MIN(id) AS start_id, MAX(id) + 1 AS end_id FROM chunks GROUP BY document_id'
+        ).fetchall()
+        return {row['document_id']: (row['start_id'], row['end_id']) for row in rows}
+
+    def replace_chunk_terms(self, doc_id, chunk_ids, term_counts):
+        """写入文档各块的词频统计（覆盖该文档已有的统计），term_counts 与 chunk_ids 一一对应"""
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                'DELETE FROM chunk_terms WHERE chunk_id IN (SELECT id FROM chunks WHERE document_id = ?)',
+                (doc_id,)
+            )
+            conn.executemany(
+                'INSERT INTO chunk_terms (chunk_id, term, tf) VALUES (?, ?, ?)',
+                [(int(chunk_id), term, tf)
+                 for chunk_id, counts in zip(chunk_ids, term_counts) for term, tf in counts.items()]
+            )
+
+    def iter_chunk_terms(self):
+        """按块遍历词频统计，产出 (块ID, 文档ID, {词项: 词频})"""
+        cursor = self._connect().execute(
+            'SELECT t.chunk_id, c.document_id, t.term, t.tf FROM chunk_terms t '
+            'JOIN chunks c ON c.id = t.chunk_id ORDER BY t.chunk_id'
+        )
+        current_id = None
+        current_document = None
+        term_counts = {}
+        while True:
+            rows = cursor.fetchmany(5000)
+            if not rows:
+                break
+            for row in rows:
+                if row['chunk_id'] != current_id:
+                    if current_id is not None:
+                        yield current_id, current_document, term_counts
+                    current_id = row['chunk_id']
+                    current_document = row['document_id']
+                    term_counts = {}
+                term_counts[row['term']] = row['tf']
+        if current_id is not None:
+            yield current_id, current_document, term_counts
+
+    @staticmethod
+    def _vector_blob(vector):
+        return None if vector is None else np.asarray(vector, dtype='float32').tobytes()
+
+    def get_chunks(self, chunk_ids):
+        """按块ID批量获取语义块，返回 {块ID: {document_id, filename, text}}"""
+        chunk_ids = [int(chunk_id) for chunk_id in chunk_ids]
+        if not chunk_ids:
+            return {}
+        placeholders = ','.join('?' * len(chunk_ids))
+        rows = self._connect().execute(
+            f'SELECT c.id, c.document_id, d.filename, c.text FROM chunks c '
+            f'JOIN documents d ON d.id = c.document_id WHERE c.id IN ({placeholders})',
+            chunk_ids
+        ).fetchall()
+        return {
+            row['id']: {
+                'document_id': row['document_id'],
+                'filename': row['filename'],
+                'text': row['text']
+            }
+            for row in rows
+        }
+
+    def count_chunks(self):
+        """语义块总数"""
+        return self._connect().execute('SELECT COUNT(*) FROM chunks').fetchone()[0]
+
+    def set_chunk_embeddings(self, chunk_ids, embeddings):
+        """补写语义块的向量"""
+        conn = self._connect()
+        with conn:
+            conn.executemany(
+                'UPDATE chunks SET embedding = ? WHERE id = ?',
+                [(self._vector_blob(vector), int(chunk_id)) for chunk_id, vector in zip(chunk_ids, embeddings)]
+            )
+
+    def clear_chunk_embeddings(self):
+        """清除全部块向量（嵌入模型变化后重新编码）"""
+        conn = self._connect()
+        with conn:
+            conn.execute('UPDATE chunks SET embedding = NULL')
+
+    def chunks_without_embeddings(self, chunk_limit=None):
+        """没有保存向量的语义块 [(块ID, 块文本)]，chunk_limit 给定时只取块ID小于它的块"""
+        if chunk_limit is None:
+            rows = self._connect().execute(
+                'SELECT id, text FROM chunks WHERE embedding IS NULL ORDER BY id'
+            ).fetchall()
+        else:
+            rows = self._connect().execute(
+                'SELECT id, text FROM chunks WHERE embedding IS NULL AND id < ? ORDER BY id', (int(chunk_limit),)
+            ).fetchall()
+        return [(row['id'], row['text']) for row in rows]
+
+    def count_chunk_embeddings(self):
+        """已保存向量的语义块总数"""
+        return self._connect().execute(
+            'SELECT COUNT(*) FROM chunks WHERE embedding IS NOT NULL'
+        ).fetchone()[0]
+
+    def iter_chunk_embeddings(self, batch_size=10000):
+        """按块ID顺序分批遍历块向量，产出 (块ID数组, 向量矩阵)"""
+        cursor = self._connect().execute(
+            'SELECT id, embedding FROM chunks WHERE embedding IS NOT NULL ORDER BY id'
+        )
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            chunk_ids = np.array([row['id'] for row in rows], dtype='int64')
+            vectors = np.vstack([np.frombuffer(row['embedding'], dtype='float32') for row in rows])
+            yield chunk_ids, vectors
+
+    def get_chunk_embeddings_in_ranges(self, chunk_ranges):
+        """读取若干块ID区间（左闭右开）内的块向量，返回 (块ID数组, 向量矩阵)"""
+        conn = self._connect()
+        chunk_ids = []
+        vectors = []
+        for start, end in chunk_ranges:
+            rows = conn.execute(
+                'SELECT id, embedding FROM chunks WHERE id >= ? AND id < ? AND embedding IS NOT NULL',
+                (int(start), int(end))
+            ).fetchall()
+            for row in rows:
+                chunk_ids.append(row['id'])
+                vectors.append(np.frombuffer(row['embedding'], dtype='float32'))
+        if not vectors:
+            return np.zeros(0, dtype='int64'), None
+        return np.array(chunk_ids, dtype='int64'), np.vstack(vectors)
+
+    def sample_chunk_embeddings(self, sample_size, with_ids=False):
+        """随机抽取块向量作为向量索引的训练样本；with_ids 为True时返回 (块ID数组, 向量矩阵)"""
+        rows = self._connect().execute(
+            'SELECT id, embedding FROM chunks WHERE embedding IS NOT NULL ORDER BY RANDOM() LIMIT ?',
+            (sample_size,)
+        ).fetchall()
+        if not rows:
+            return (None, None) if with_ids else None
+        vectors = np.vstack([np.frombuffer(row['embedding'], dtype='float32') for row in rows])
+        if with_ids:
+            return np.array([row['id'] for row in rows], dtype='int64'), vectors
+        return vectors
+
+    def replace_lexical_index(self, doc_id, term_counts, sentences, sentence_postings, index_version):
+        """在一个事务中写入文档的词频统计、句子和句子级词项倒排（覆盖已有数据）
+
+        sentences 为 [(句子序号, 句子, 小写句子)]，sentence_postings 为 {词项: [句子序号]}
+        """
+        conn = self._connect()
+        with conn:
+            conn.execute('DELETE FROM document_terms WHERE document_id = ?', (doc_id,))
+            conn.execute('DELETE FROM sentences WHERE document_id = ?', (doc_id,))
+            conn.execute('DELETE FROM sentence_terms WHERE document_id = ?', (doc_id,))
+            conn.executemany(
+                'INSERT INTO document_terms (document_id, term, tf) VALUES (?, ?, ?)',
+                [(doc_id, term, tf) for term, tf in term_counts.items()]
+            )
+            conn.executemany(
+                'INSERT INTO sentences (document_id, sentence_index, text, text_lower) VALUES (?, ?, ?, ?)',
+                [(doc_id, index, text, text_lower) for index, text, text_lower in sentences]
+            )
+            conn.executemany(
+                'INSERT INTO sentence_terms (document_id, term, sentence_indexes) VALUES (?, ?, ?)',
+                [(doc_id, term, ','.join(map(str, indexes))) for term, indexes in sentence_postings.items()]
+            )
+            conn.execute('UPDATE documents SET index_version = ? WHERE id = ?', (index_version, doc_id))
+
+    def outdated_document_ids(self, index_version):
+        """词法索引版本落后的文档ID"""
+        rows = self._connect().execute(
+            'SELECT id FROM documents WHERE index_version < ? ORDER BY id', (index_version,)
+        ).fetchall()
+        return [row['id'] for row in rows]
+
+    def get_sentence_postings(self, doc_id, terms):
+        """获取文档中若干词项所在的句子序号 {词项: 句子序号集合}"""
+        terms = list(terms)
+        if not terms:
+            return {}
+        placeholders = ','.join('?' * len(terms))
+        rows = self._connect().execute(
+            f'SELECT term, sentence_indexes FROM sentence_terms '
+            f'WHERE document_id = ? AND term IN ({placeholders})',
+            [doc_id] + terms
+        ).fetchall()
+        return {row['term']: {int(index) for index in row['sentence_indexes'].split(',')} for row in rows}
+
+    def get_sentences(self, doc_id, sentence_indexes):
+        """按序号获取文档的句子 [(句子序号, 句子, 小写句子)]，按序号排序"""
+        sentence_indexes = sorted(sentence_indexes)
+        if not sentence_indexes:
+            return []
+        placeholders = ','.join('?' * len(sentence_indexes))
+        rows = self._connect().execute(
+            f'SELECT sentence_index, text, text_lower FROM sentences '
+            f'WHERE document_id = ? AND sentence_index IN ({placeholders}) ORDER BY sentence_index',
+            [doc_id] + sentence_indexes
+        ).fetchall()
+        return [(row['sentence_index'], row['text'], row['text_lower']) for row in rows]
+
+    def iter_document_terms(self):
+        """按文档遍历词频统计，产出 (文档ID, {词项: 词频})"""
+        cursor = self._connect().execute(
+            'SELECT document_id, term, tf FROM document_terms ORDER BY document_id'
+        )
+        current_id = None
+        term_counts = {}
+        while True:
+            rows = cursor.fetchmany(5000)
+            if not rows:
+                break
+            for row in rows:
+                if row['document_id'] != current_id:
+                    if current_id is not None:
+                        yield current_id, term_counts
+                    current_id = row['document_id']
+                    term_counts = {}
+                term_counts[row['term']] = row['tf']
+        if current_id is not None:
+            yield current_id, term_counts
+
+    def migrate_from_json(self, json_path, next_document_id=None):
+        """从旧版 documents.json 导入文档（保留原文档ID），导入后重命名原文件"""
+        with open(json_path, 'r', encoding='utf-8') as f:
+            documents = json.load(f)
+
+        conn = self._connect()
+        with conn:
+            for doc in documents:
+                conn.execute(
+                    'INSERT OR IGNORE INTO documents (id, filename, content, content_length, created_at) '
+                    'VALUES (?, ?, ?, ?, ?)',
+                    (doc['id'], doc['filename'], doc['content'], len(doc['content']),
+                     doc.get('created_at') or doc.get('upload_time') or datetime.now().isoformat())
+                )
+
+            # 延续旧的ID计数器，已删除文档的ID同样不会被复用
+            if next_document_id:
+                row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'documents'").fetchone()
+                if row is None:
+                    conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('documents', ?)",
+                                 (next_document_id - 1,))
+                elif row['seq'] < next_document_id - 1:
+                    conn.execute("UPDATE sqlite_sequence SET seq = ? WHERE name = 'documents'",
+                                 (next_document_id - 1,))
+
+        os.replace(json_path, json_path + '.migrated')
+        return len(documents)
@@ -0,0 +1,52 @@
+"""
+模糊词项索引模块
+词表上的字符二元组(bigram)索引，用于快速找出与查询词相似的词项
+"""
+from difflib import SequenceMatcher
+
+
+class NGramTermIndex:
+    """字符n-gram词项索引：先用共享n-gram召回候选词，再用SequenceMatcher精确验证"""
+
+    def __init__(self, n=2):
+        self.n = n
+        self.gram_terms = {}  # n-gram -> 包含该n-gram的词项集合
+
+    def _grams(self, term):
+        """提取带首尾标记的n-gram，使单字词和词首词尾也能参与匹配"""
+        padded = '\x02' + term + '\x03'
+        return {padded[i:i + self.n] for i in range(len(padded) - self.n + 1)}
+
+    def add_term(self, term):
+        for gram in self._grams(term):
+            self.gram_terms.setdefault(gram, set()).add(term)
+
+    def remove_term(self, term):
+        for gram in self._grams(term):
+            terms = self.gram_terms.get(gram)
+            if terms is None:
+                continue
+            terms.discard(term)
+            if not terms:
+                del self.gram_terms[gram]
+
+    def similar_terms(self, query_word, threshold=0.7):
+        """返回与查询词相似度超过阈值的词项 {词项: 相似度}（不含查询词本身）"""
+        candidates = set()
+        for gram in self._grams(query_word):
+            candidates.update(self.gram_terms.get(gram, ()))
+        candidates.discard(query_word)
+
+        matches = {}
+        query_length = len(query_word)
+        for term in candidates:
+            # 相似度上界 2*min(a,b)/(a+b)，长度差距过大时直接跳过
+            if 2 * min(query_length, len(term)) / (query_length + len(term)) <= threshold:
+                continue
+            matcher = SequenceMatcher(None, query_word, term)
+            if matcher.quick_ratio() <= threshold:
+                continue
+            similarity = matcher.ratio()
+            if similarity > threshold:
+                matches[term] = similarity
+        return matches
@@ -0,0 +1,73 @@
+"""
+倒排索引模块
+词项 -> {文档ID: 词频}，按文档增量维护
+"""
+from models.fuzzy_index import NGramTermIndex
+
+
+class InvertedIndex:
+    """内存倒排索引"""
+
+    def __init__(self):
+        self.postings = {}  # 词项 -> {文档ID: 词频}
+        self.document_terms = {}  # 文档ID -> 词项列表（用于删除）
+        self.document_lengths = {}  # 文档ID -> 词项总数
+        self.total_length = 0  # 所有文档词项总数，用于计算平均文档长度
+        self.term_index = NGramTermIndex()  # 词表的n-gram索引，用于模糊匹配
+        self.version = 0  # 每次增删文档递增，供派生的缓存判断是否失效
+
+    def add_document(self, doc_id, term_counts):
+        """加入一个文档的词频统计，已存在时先移除旧数据"""
+        if doc_id in self.document_terms:
+            self.remove_document(doc_id)
+
+        for term, tf in term_counts.items():
+            term_postings = self.postings.get(term)
+            if term_postings is None:
+                term_postings = self.postings[term] = {}
+                self.term_index.add_term(term)
+            term_postings[doc_id] = tf
+        self.document_terms[doc_id] = list(term_counts)
+        self.document_lengths[doc_id] = sum(term_counts.values())
+        self.total_length += self.document_lengths[doc_id]
+        self.version += 1
+
+    def remove_document(self, doc_id):
+        """移除一个文档，只触及该文档包含的词项"""
+        for term in self.document_terms.pop(doc_id, []):
+            term_postings = self.postings.get(term)
+            if term_postings is None:
+                continue
+            term_postings.pop(doc_id, None)
+            if not term_postings:
+                del self.postings[term]
+                self.term_index.remove_term(term)
+        self.total_length -= self.document_lengths.pop(doc_id, 0)
+        self.version += 1
+
+    def get_postings(self, term):
+        """获取词项的倒排列表 {文档ID: 词频}"""
+        return self.postings.get(term, {})
+
+    def contains(self, term, doc_id):
+        """文档是否包含词项"""
+        return doc_id in self.postings.get(term, {})
+
+    def document_frequency(self, term):
+        """包含词项的文档数"""
+        return len(self.postings.get(term, {}))
+
+    def average_document_length(self):
+        """平均文档长度"""
+        return self.total_length / len(self.document_terms) if self.document_terms else 0
+
+    def similar_terms(self, query_word, threshold=0.7):
+        """词表中与查询词相似度超过阈值的词项 {词项: 相似度}"""
+        return self.term_index.similar_terms(query_word, threshold)
+
+    def vocabulary(self):
+        """语料词表"""
+        return self.postings.keys()
+
+    def __len__(self):
+        return len(self.document_terms)
@@ -3,68 +3,254 @@
 """
 import os
 import json
+import atexit
 import re
 import jieba
 import jieba.posseg as pseg
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
 import numpy as np
-from difflib import SequenceMatcher
 import math
+import copy
+import time
+import queue
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
 from datetime import datetime
 from flask import current_app
 
 try:
     from sentence_transformers import SentenceTransformer
-    import faiss
     EMBEDDING_AVAILABLE = True
 except ImportError:
     EMBEDDING_AVAILABLE = False
 
+from config import Config
 from stage2_config import stage2_config, prompt_builder, quality_assessor
-from services.embedding_service import load_embedding_model_smart
+from services.embedding_service import load_embedding_model_smart, manifest_model_path
+from services.embedding_cache import EmbeddingCache, text_hash
+from services.bulk_encoder import BulkEncoder
+from services.result_cache import ResultCache
+from services.query_encoder import QueryEncoder
+from services.search_budget import SearchBudget
+from services.startup_phases import StartupPhases
+from utils.rw_lock import ReadWriteLock
+from models.document_store import DocumentStore
+from models.inverted_index import InvertedIndex
+from models.bm25 import BM25Scorer
+from models.aho_corasick import AhoCorasick
+from models.vector_index import (FAISS_AVAILABLE, FAISS_INDEX_TYPES, create_vector_index, load_vector_index,
+                                 choose_index_type, default_nlist, exact_search, merge_top_k, recall_at_k)
+
+# 语义分块参数（持久化的语义索引以此为标记，参数变化后会自动重建）
+CHUNK_SIZE = 300
+CHUNK_OVERLAP = 50
+SEMANTIC_INDEX_FORMAT_VERSION = 1
+
+# 词法索引（词频统计、句子切分、分块及块级词频）的版本，版本落后的文档在启动时重新索引
+# （修改 CHUNK_SIZE / CHUNK_OVERLAP 时也需要递增）
+LEXICAL_INDEX_VERSION = 2
 
 class KnowledgeBase:
     """知识库管理类"""
     
     def __init__(self, knowledge_base_path='knowledge_base', upload_folder='uploads'):
-        self.documents = []
-        self.tfidf_vectorizer = None
-        self.tfidf_matrix = None
-        self.processed_contents = []
-        self.filename_patterns = {}  # 存储文件名模式，用于智能匹配
+        self.documents = []  # 文档元数据（不含正文，正文按需从文档存储读取）
+        self.documents_by_id = {}  # 文档ID -> 文档元数据
+        self.inverted_index = InvertedIndex()  # 词项倒排索引，用于关键词打分
+        self.bm25_scorer = BM25Scorer(self.inverted_index)  # 基于倒排索引统计的稀疏检索
+        # 块级倒排索引：与向量索引使用相同的分块和块ID，片段直接按块ID读取
+        self.chunk_index = InvertedIndex()
+        self.chunk_bm25_scorer = BM25Scorer(self.chunk_index)
+        self.chunk_documents = {}  # 块ID -> 文档ID
+        # 内存词法索引（文档级/块级倒排索引、块到文档的映射）的读写锁：增删文档持写锁，
+        # 检索遍历倒排列表时持读锁，并发检索之间互不阻塞；分词等不读索引的计算在锁外进行
+        self.lexical_index_lock = ReadWriteLock()
+        self.document_chunk_ranges = {}  # 文档ID -> (起始块ID, 结束块ID)，左闭右开
+        self.next_chunk_id = 0
+        # 并发上传、删除时文档列表、文档ID索引和块ID分配的锁（只保护内存中的修改，不包含写库和分词）
+        self.document_lock = threading.Lock()
+        self.filename_patterns = AhoCorasick()  # 文件名模式自动机，用于智能匹配
+        self.filename_lookup = {}  # 小写完整文件名 -> 文档ID集合
         self.knowledge_base_path = knowledge_base_path
         self.upload_folder = upload_folder
+        self.document_store = DocumentStore(os.path.join(knowledge_base_path, 'knowledge_base.db'))
         
         # 语义嵌入相关
         self.embedding_model = None
-        self.document_embeddings = None
+        self.embedding_model_name = None
+        self.embedding_cache = None
+        self.query_encoder = None  # 查询向量的记忆与微批编码
         self.embedding_index = None
-        self.document_chunks = []  # 存储文档分块信息
-        
+        self.semantic_chunk_ranges = {}  # 已收录到向量索引中的文档块区间 文档ID -> (起始块ID, 结束块ID)
+        # 语义初始化期间删除的文档块区间：构建或加载中的索引可能已收录这些块，初始化结束的对账时移除
+        self.init_deleted_chunk_ranges = {}
+        # 语义索引的写操作（增删文档、重建、保存）串行执行；向量索引的读写锁：原地增删持写锁，
+        # 检索持读锁，并发检索之间互不阻塞
+        self.semantic_update_lock = threading.RLock()
+        self.vector_index_lock = ReadWriteLock()
+        self.encode_stats = None  # 最近一次补齐块向量（全量构建）的编码统计
+        # 增删文档后的语义索引保存延迟进行，一段时间内的多次增删合并为一次写盘
+        self.semantic_save_timer = None
+        atexit.register(self.flush_semantic_index)
+        
+        # 新文档的块在后台线程中编码并加入向量索引，上传请求无需等待
+        self.embedding_queue = queue.Queue()
+        self.embedding_worker = None
+        self.embedding_worker_lock = threading.Lock()
+        self.indexing_states = {}  # 文档ID -> 语义索引状态 pending / embedding / failed（不在其中的为 ready）
+        self.indexing_errors = {}  # 文档ID -> 语义索引失败原因
+        
+        # 启动分阶段进行：词法索引在构造时同步加载（加载后即可关键词检索），
+        # 嵌入模型和语义索引在后台初始化，完成前检索只走词法分支
+        self.startup = StartupPhases(('lexical_index', 'embedding_model', 'semantic_index'))
+        self.semantic_ready = False  # 语义检索是否可用
+        self.semantic_initialized = threading.Event()  # 后台初始化结束（无论成功与否）
+        self.startup_thread = None
+        
+        # 检索结果缓存：知识库版本号在增删文档时递增，旧版本的缓存条目自动失效
+        self.generation = 0
+        self.result_cache = ResultCache(Config.SEARCH_CACHE_MAX_ENTRIES, Config.SEARCH_CACHE_TTL)
+        # 语义/词法检索分支共享的线程池
+        self.search_executor = ThreadPoolExecutor(max_workers=Config.SEARCH_BRANCH_WORKERS,
+                                                  thread_name_prefix='search-branch')
+        
+        self.startup.start('lexical_index')
         self.load_knowledge_base()
         # 初始化jieba分词
         jieba.setLogLevel(jieba.logging.INFO)
         self._build_filename_patterns()
+        self.startup.finish('lexical_index', documents=len(self.documents))
         
-        # 初始化语义嵌入模型
-        if EMBEDDING_AVAILABLE:
-            self._init_embedding_model()
-        else:
+        # 初始化语义嵌入模型（默认在后台线程中进行，不阻塞服务启动）
+        if not EMBEDDING_AVAILABLE:
             print("跳过语义嵌入模型初始化")
+            self.startup.skip('embedding_model', '未安装 sentence-transformers')
+            self.startup.skip('semantic_index', '未安装 sentence-transformers')
+            self.semantic_initialized.set()
+        elif Config.BACKGROUND_STARTUP:
+            self.startup_thread = threading.Thread(target=self._initialize_semantic_search,
+                                                   name='semantic-startup', daemon=True)
+            self.startup_thread.start()
+        else:
+            self._initialize_semantic_search()
     
     def load_knowledge_base(self):
-        """加载知识库"""
+        """加载知识库（只加载文档元数据，正文留在文档存储中）"""
+        self._migrate_legacy_documents()
+        try:
+            self.documents = self.document_store.list_documents()
+            self.documents_by_id = {doc['id']: doc for doc in self.documents}
+            self._load_inverted_index()
+        except Exception as e:
+            print(f"加载知识库失败: {e}")
+            self.documents = []
+            self.documents_by_id = {}
+    
+    def _migrate_legacy_documents(self):
+        """将旧版 documents.json 导入文档存储"""
         kb_file = os.path.join(self.knowledge_base_path, 'documents.json')
-        if os.path.exists(kb_file):
+        if not os.path.exists(kb_file):
+            return
+        
+        next_document_id = None
+        meta_file = os.path.join(self.knowledge_base_path, 'kb_meta.json')
+        if os.path.exists(meta_file):
             try:
-                with open(kb_file, 'r', encoding='utf-8') as f:
-                    self.documents = json.load(f)
-                self._rebuild_search_index()
-            except:
-                self.documents = []
-        else:
-            self.documents = []
+                with open(meta_file, 'r', encoding='utf-8') as f:
+                    next_document_id = int(json.load(f).get('next_document_id', 1))
+            except Exception as e:
+                print(f"读取知识库元数据失败: {e}")
+        
+        try:
+            count = self.document_store.migrate_from_json(kb_file, next_document_id)
+            if os.path.exists(meta_file):
+                os.replace(meta_file, meta_file + '.migrated')
+            print(f"✓ 已将 {count} 个文档从 documents.json 迁移到文档存储")
+        except Exception as e:
+            print(f"× 迁移 documents.json 失败: {e}")
+    
+    def _load_inverted_index(self):
+        """从文档存储加载文档级和块级倒排索引，词法索引缺失或版本落后的文档（旧数据）补建一次"""
+        outdated_ids = set(self.document_store.outdated_document_ids(LEXICAL_INDEX_VERSION))
+        for doc_id, term_counts in self.document_store.iter_document_terms():
+            if doc_id in self.documents_by_id and doc_id not in outdated_ids:
+                self.inverted_index.add_document(doc_id, term_counts)
+        
+        # 块ID区间以文档存储中的块为准；旧版知识库的块ID计数器记录在语义索引元数据中
+        self.document_chunk_ranges = self.document_store.get_chunk_ranges()
+        self.next_chunk_id = max([self.document_store.next_chunk_id(), self._legacy_next_chunk_id()] +
+                                 [end for _, end in self.document_chunk_ranges.values()])
+        for chunk_id, doc_id, term_counts in self.document_store.iter_chunk_terms():
+            if doc_id in self.documents_by_id and doc_id not in outdated_ids:
+                self.chunk_index.add_document(chunk_id, term_counts)
+                self.chunk_documents[chunk_id] = doc_id
+        
+        missing_ids = [doc['id'] for doc in self.documents
+                       if doc['id'] not in self.inverted_index.document_terms]
+        if missing_ids:
+            print(f"正在为 {len(missing_ids)} 个文档建立词法索引...")
+            for doc in self.document_store.iter_documents(missing_ids):
+                self._index_document_text(doc)
+    
+    def _legacy_next_chunk_id(self):
+        """旧版语义索引元数据中记录的块ID计数器"""
+        meta_path = self._semantic_index_paths()['chunks']
+        if not os.path.exists(meta_path):
+            return 0
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                return int(json.load(f).get('next_chunk_id', 0))
+        except Exception as e:
+            print(f"读取语义索引元数据失败: {e}")
+            return 0
+    
+    def _tokenize_for_index(self, content):
+        """为倒排索引分词：搜索引擎模式额外切出长词中的子词，贴近子串匹配的效果"""
+        return Counter(word for word in jieba.lcut_for_search(content.lower()) if word.strip())
+    
+    def _split_sentences(self, content):
+        """切分句子，返回可用作片段的句子 [(句子序号, 句子, 小写句子)]"""
+        sentences = []
+        for index, sentence in enumerate(re.split(r'[。！？\n]', content)):
+            sentence = sentence.strip()
+            if len(sentence) < 10:  # 跳过过短的句子
+                continue
+            sentences.append((index, sentence, sentence.lower()))
+        return sentences
+    
+    def _index_document_text(self, doc):
+        """为单个文档建立词法索引（词频统计、句子及句子级词项倒排、分块及块级词频）并持久化"""
+        term_counts = self._tokenize_for_index(doc['content'])
+        
+        sentences = self._split_sentences(doc['content'])
+        sentence_postings = {}
+        for index, _, sentence_lower in sentences:
+            for term in self._tokenize_for_index(sentence_lower):
+                sentence_postings.setdefault(term, []).append(index)
+        
+        chunk_ids, chunks = self._assign_document_chunks(doc)
+        chunk_term_counts = [self._tokenize_for_index(chunk) for chunk in chunks]
+        self.document_store.replace_chunk_terms(doc['id'], chunk_ids, chunk_term_counts)
+        
+        # 版本号最后写入：中途失败的文档下次启动时会重新索引
+        self.document_store.replace_lexical_index(doc['id'], term_counts, sentences,
+                                                  sentence_postings, LEXICAL_INDEX_VERSION)
+        with self.lexical_index_lock.write():
+            self.inverted_index.add_document(doc['id'], term_counts)
+            for chunk_id, counts in zip(chunk_ids, chunk_term_counts):
+                self.chunk_index.add_document(chunk_id, counts)
+                self.chunk_documents[chunk_id] = doc['id']
+    
+    def _assign_document_chunks(self, doc):
+        """为文档分块：文档存储中已有相同的块时沿用其块ID（及已保存的向量），否则分配新的块ID并写入"""
+        chunks = self._split_document_into_chunks(doc['content'])
+        existing = self.document_store.get_document_chunks(doc['id'])
+        if existing and [text for _, text in existing] == chunks:
+            return [chunk_id for chunk_id, _ in existing], chunks
+        
+        chunk_ids = self._allocate_document_chunks(doc['id'], len(chunks))
+        self.document_store.replace_chunks(doc['id'], chunk_ids, chunks)
+        return chunk_ids, chunks
     
     def _init_embedding_model(self):
         """初始化语义嵌入模型 - 智能加载：优先本地缓存，无缓存时在线加载"""
@@ -79,25 +265,91 @@ class KnowledgeBase:
             ]
             
             # 使用智能加载函数
-            self.embedding_model = load_embedding_model_smart(
+            self.embedding_model, self.embedding_model_name = load_embedding_model_smart(
                 model_name=preferred_models[0],
-                fallback_models=preferred_models[1:]
+                fallback_models=preferred_models[1:],
+                return_model_name=True,
+                offline=Config.EMBEDDING_OFFLINE,
+                manifest_path=self._embedding_manifest_path()
             )
             
             if self.embedding_model is None:
-                print("× 所有嵌入模型加载失败，将使用TF-IDF作为备选")
+                print("× 所有嵌入模型加载失败，将使用BM25关键词检索作为备选")
+                self.startup.fail('embedding_model', '所有嵌入模型加载失败')
                 return
             
             print("✓ 嵌入模型初始化成功")
+            self.startup.finish('embedding_model', model_name=self.embedding_model_name)
+            
+            self.query_encoder = QueryEncoder(
+                self.embedding_model,
+                batch_window_ms=Config.QUERY_ENCODER_BATCH_WINDOW_MS,
+                max_batch_size=Config.QUERY_ENCODER_MAX_BATCH_SIZE,
+                memo_size=Config.QUERY_EMBEDDING_MEMO_SIZE
+            )
             
-            # 重建语义索引
-            self._build_semantic_index()
+            self.embedding_cache = EmbeddingCache(
+                os.path.join(self.knowledge_base_path, 'embedding_cache.db'),
+                max_entries=Config.EMBEDDING_CACHE_MAX_ENTRIES
+            )
             
         except Exception as e:
             print(f"× 嵌入模型初始化失败: {e}")
             self.embedding_model = None
+            self.startup.fail('embedding_model', e)
+    
+    def _embedding_manifest_path(self):
+        """嵌入模型清单路径（记录上次成功加载的模型及其本地路径）"""
+        return os.path.join(self.knowledge_base_path, 'embedding_model.json')
+    
+    def _initialize_semantic_search(self):
+        """语义检索初始化：加载嵌入模型，再加载或构建语义索引，完成后语义分支才参与检索
+        
+        期间新增的文档照常进入后台编码队列（等待初始化结束后处理），删除的文档只从词法索引移除，
+        最后在语义索引锁内再对账一次，补上初始化期间的增删
+        """
+        self.startup.start('embedding_model')
+        self._init_embedding_model()
+        if self.embedding_model is None:
+            self.startup.skip('semantic_index', '嵌入模型不可用，只提供关键词检索')
+            self.semantic_initialized.set()
+            return
+        
+        self.startup.start('semantic_index')
+        try:
+            # 优先加载磁盘上的语义索引，标记不匹配时才重建
+            if not self._load_semantic_index():
+                self._build_semantic_index()
+                self._save_semantic_index()
+            
+            with self.semantic_update_lock:
+                if self.embedding_index is not None:
+                    self._reconcile_semantic_index()
+                self.semantic_ready = True
+                # 之前缓存的是只有词法分支的结果
+                self.generation += 1
+            self.startup.finish('semantic_index',
+                                chunks=self.embedding_index.ntotal if self.embedding_index is not None else 0,
+                                encoding=self.encode_stats)
+            print("✓ 语义检索已就绪")
+        except Exception as e:
+            print(f"× 语义索引初始化失败: {e}")
+            self.startup.fail('semantic_index', e)
+        finally:
+            self.semantic_initialized.set()
     
-    def _split_document_into_chunks(self, content, chunk_size=300, overlap=50):
+    def get_startup_status(self):
+        """启动状态：词法索引加载后即可服务，语义检索在后台初始化完成后启用"""
+        return {
+            'lexical_ready': self.startup.status('lexical_index') == 'ready',
+            'semantic_ready': self.semantic_ready,
+            'initializing': not self.semantic_initialized.is_set(),
+            'current_phase': self.startup.current(),
+            'search_mode': 'hybrid' if self.semantic_ready else 'lexical_only',
+            'phases': self.startup.report()
+        }
+    
+    def _split_document_into_chunks(self, content, chunk_size=CHUNK_SIZE, overlap=CHUNK_OVERLAP):
         """将文档分割成语义块"""
         # 按句子分割
         sentences = re.split(r'[。！？\n]', content)
@@ -145,107 +397,610 @@ class KnowledgeBase:
         
         return overlapped_chunks
     
+    def _encode_texts(self, texts, show_progress_bar=False):
+        """编码文本为归一化向量，优先使用嵌入缓存，只为缓存中没有的文本调用模型"""
+        if self.embedding_cache is None:
+            return self.embedding_model.encode(texts, show_progress_bar=show_progress_bar,
+                                               normalize_embeddings=True).astype('float32')
+        
+        hashes = [text_hash(text) for text in texts]
+        cached = self.embedding_cache.get_many(self.embedding_model_name, hashes)
+        
+        # 去重后只编码未命中的文本
+        pending = {}
+        for hash_value, text in zip(hashes, texts):
+            if hash_value not in cached and hash_value not in pending:
+                pending[hash_value] = text
+        
+        if pending:
+            if len(pending) < len(texts):
+                print(f"嵌入缓存命中 {len(texts) - len(pending)} 个，需编码 {len(pending)} 个")
+            new_embeddings = self.embedding_model.encode(list(pending.values()),
+                                                         show_progress_bar=show_progress_bar,
+                                                         normalize_embeddings=True).astype('float32')
+            self.embedding_cache.put_many(self.embedding_model_name, list(pending), new_embeddings)
+            cached.update(zip(pending, new_embeddings))
+        
+        return np.vstack([cached[hash_value] for hash_value in hashes]).astype('float32')
+    
+    def _allocate_document_chunks(self, doc_id, count):
+        """为文档分配连续的块ID，返回块ID列表"""
+        with self.document_lock:
+            start_id = self.next_chunk_id
+            self.next_chunk_id += count
+            self.document_chunk_ranges[doc_id] = (start_id, self.next_chunk_id)
+        return list(range(start_id, start_id + count))
+    
+    def _release_document_chunks(self, doc_id):
+        """从块级倒排索引中移除文档的块，返回被释放的ID区间（块记录随文档一起从文档存储删除）"""
+        chunk_range = self.document_chunk_ranges.pop(doc_id, None)
+        if chunk_range:
+            for chunk_id in range(*chunk_range):
+                self.chunk_index.remove_document(chunk_id)
+                self.chunk_documents.pop(chunk_id, None)
+        return chunk_range
+    
+    def _target_index_type(self, num_chunks):
+        """目标向量索引类型：配置为auto时按块数自动选择；未安装faiss或指定numpy后端时使用NumPy暴力检索"""
+        if Config.SEMANTIC_INDEX_BACKEND == 'numpy' or not FAISS_AVAILABLE:
+            if Config.SEMANTIC_INDEX_TYPE in FAISS_INDEX_TYPES and not FAISS_AVAILABLE:
+                print(f"未安装faiss，向量索引类型 {Config.SEMANTIC_INDEX_TYPE} 改用NumPy暴力检索")
+            return 'numpy'
+        if Config.SEMANTIC_INDEX_TYPE != 'auto':
+            return Config.SEMANTIC_INDEX_TYPE
+        current_type = self.embedding_index.index_type if self.embedding_index is not None else None
+        return choose_index_type(num_chunks, current_type)
+    
+    def _vector_index_options(self):
+        """检索参数的默认值"""
+        return {
+            'nprobe': Config.SEMANTIC_INDEX_NPROBE,
+            'ef_search': Config.SEMANTIC_INDEX_EF_SEARCH
+        }
+    
+    def _vector_storage(self, index_type, storage=None):
+        """索引实际使用的向量存储模式：ivf_pq 固定为pq，NumPy索引不支持pq时改用int8"""
+        storage = storage or Config.SEMANTIC_VECTOR_STORAGE
+        if index_type == 'ivf_pq':
+            return 'pq'
+        if index_type == 'numpy' and storage == 'pq':
+            return 'int8'
+        return storage
+    
+    def _create_vector_index(self, dimension, index_type, storage=None, **kwargs):
+        """按索引类型创建空的向量索引（FAISS索引或NumPy暴力检索索引）"""
+        return create_vector_index(dimension, index_type, storage=self._vector_storage(index_type, storage),
+                                   **kwargs, **self._vector_index_options())
+    
     def _build_semantic_index(self):
-        """构建语义向量索引"""
+        """全量构建语义向量索引（启动时索引缺失或模型变化时使用，增删文档走增量更新）
+        
+        块由词法索引统一切分，这里只为全部块重新编码（大多命中嵌入缓存）并建立向量索引
+        """
         if not self.embedding_model or not self.documents:
             return
         
         print("正在构建语义向量索引...")
+        self.semantic_chunk_ranges = {}
+        # 只收录构建开始前已分配的块；构建期间上传的文档在初始化结束时的对账中加入
+        chunk_limit = self.next_chunk_id
+        try:
+            self.document_store.clear_chunk_embeddings()
+            
+            # 无需训练的索引（暴力检索、HNSW的float32存储）边编码边加入；
+            # IVF和量化存储需要训练样本，全部编码完成后再训练并填充
+            index_type = self._target_index_type(self.document_store.count_chunks())
+            index = None
+            if not index_type.startswith('ivf'):
+                index = self._create_vector_index(self.embedding_model.get_sentence_embedding_dimension(), index_type)
+                if not index.is_trained:
+                    index = None
+            self._backfill_chunk_embeddings(show_progress_bar=True, chunk_limit=chunk_limit, index=index)
+            
+            if index is not None:
+                self.embedding_index = index if index.ntotal else None
+            else:
+                index_type = self._target_index_type(self.document_store.count_chunk_embeddings())
+                self._rebuild_vector_index(index_type)
+            if self.embedding_index is None:
+                return
+            self.semantic_chunk_ranges = self._chunk_ranges_below(chunk_limit)
+            
+            print(f"✓ 语义索引构建完成，类型: {index_type}，维度: {self.embedding_index.dimension}")
+            
+        except Exception as e:
+            print(f"× 语义索引构建失败: {e}")
+            self.embedding_index = None
+    
+    def _rebuild_vector_index(self, index_type):
+        """用文档存储中的块向量重建向量索引（切换索引类型或重新训练，无需重新编码）"""
+        total = self.document_store.count_chunk_embeddings()
+        if total == 0:
+            self.embedding_index = None
+            return
+        
+        print(f"正在重建向量索引，类型: {index_type}，存储: {self._vector_storage(index_type)}，共 {total} 个文档块...")
+        index = self._train_vector_index(index_type)
+        self.embedding_index = index
+        print(f"✓ 向量索引重建完成，共 {index.ntotal} 个文档块")
+    
+    def _train_vector_index(self, index_type, storage=None):
+        """用文档存储中的块向量训练并填充一个新的向量索引（量化类型在随机样本上训练）"""
+        total = self.document_store.count_chunk_embeddings()
+        sample = self.document_store.sample_chunk_embeddings(Config.SEMANTIC_INDEX_TRAIN_SAMPLE)
+        nlist = default_nlist(total) if index_type.startswith('ivf') else None
+        index = self._create_vector_index(sample.shape[1], index_type, storage=storage, nlist=nlist)
+        if not index.is_trained:
+            index.train(sample)
+        for chunk_ids, vectors in self.document_store.iter_chunk_embeddings():
+            index.add(vectors, chunk_ids)
+        return index
+    
+    def _build_sample_vector_index(self, index_type, storage, chunk_ids, vectors):
+        """在给定的块向量上临时构建索引（向量存储报告在抽样的块上评估时使用）"""
+        nlist = default_nlist(len(vectors)) if index_type.startswith('ivf') else None
+        index = self._create_vector_index(vectors.shape[1], index_type, storage=storage, nlist=nlist)
+        if not index.is_trained:
+            index.train(vectors[:Config.SEMANTIC_INDEX_TRAIN_SAMPLE])
+        index.add(vectors, chunk_ids)
+        return index
+    
+    def _maintain_vector_index(self):
+        """块数跨过自动选择阈值、索引类型或存储模式配置变化、墓碑过多或训练样本过少时重建向量索引"""
+        if self.embedding_index is None:
+            return
+        target_type = self._target_index_type(self.embedding_index.ntotal)
+        storage_changed = self.embedding_index.get_config().get('storage') != self._vector_storage(target_type)
+        if target_type != self.embedding_index.index_type or storage_changed or self.embedding_index.needs_rebuild():
+            self._rebuild_vector_index(target_type)
+    
+    def _chunk_ranges_below(self, chunk_limit):
+        """块ID全部小于 chunk_limit 的非空文档块区间"""
+        return {doc_id: chunk_range for doc_id, chunk_range in self.document_chunk_ranges.items()
+                if chunk_range[0] < chunk_range[1] <= chunk_limit}
+    
+    def _backfill_chunk_embeddings(self, show_progress_bar=False, chunk_limit=None, index=None):
+        """为没有保存向量的块生成向量（全量构建或旧版数据，通常大多命中嵌入缓存）
+        
+        块数达到 BULK_ENCODE_MIN_CHUNKS 且配置了多个工作进程时使用多进程批量编码；
+        给定 index 时向量在保存的同时加入该索引
+        """
+        pending = self.document_store.chunks_without_embeddings(chunk_limit)
+        if not pending:
+            return
+        print(f"正在为 {len(pending)} 个文档块生成嵌入向量...")
+        started = time.perf_counter()
         
-        # 清空现有的块数据
-        self.document_chunks = []
+        if Config.BULK_ENCODE_WORKERS > 1 and len(pending) >= Config.BULK_ENCODE_MIN_CHUNKS:
+            try:
+                self.encode_stats = self._bulk_encode_chunks(pending, index)
+                print(f"✓ 多进程编码完成：编码 {self.encode_stats['chunks']} 个文档块"
+                      f"（嵌入缓存命中 {self.encode_stats['cache_hits']} 个），"
+                      f"{self.encode_stats['seconds']:.1f} 秒，{self.encode_stats['chunks_per_second']} 块/秒")
+                return
+            except Exception as e:
+                # 已完成的批次已保存（并加入索引），剩余的块在当前进程中编码
+                print(f"× 多进程编码失败，改为在当前进程中编码: {e}")
+                pending = self.document_store.chunks_without_embeddings(chunk_limit)
+                if not pending:
+                    return
+        
+        chunk_ids = [chunk_id for chunk_id, _ in pending]
+        embeddings = self._encode_texts([text for _, text in pending], show_progress_bar=show_progress_bar)
+        self._store_chunk_embeddings(chunk_ids, embeddings, index)
+        seconds = time.perf_counter() - started
+        self.encode_stats = {
+            'workers': 1,
+            'chunks': len(pending),
+            'seconds': round(seconds, 3),
+            'chunks_per_second': round(len(pending) / seconds, 1) if seconds > 0 else None
+        }
+        print(f"✓ 编码完成：{len(pending)} 个文档块，{seconds:.1f} 秒，{self.encode_stats['chunks_per_second']} 块/秒")
+    
+    def _bulk_encode_chunks(self, pending, index=None):
+        """多进程批量编码 [(块ID, 文本)]：先取嵌入缓存，其余按长度排序分批交给工作进程，
+        每批完成即写入缓存、文档存储和索引，返回编码统计"""
+        chunk_ids = [chunk_id for chunk_id, _ in pending]
+        texts = [text for _, text in pending]
+        positions = list(range(len(texts)))
+        hashes = None
+        cache_hits = 0
+        
+        if self.embedding_cache is not None:
+            hashes = [text_hash(text) for text in texts]
+            cached = self.embedding_cache.get_many(self.embedding_model_name, hashes)
+            hits = [i for i in positions if hashes[i] in cached]
+            if hits:
+                self._store_chunk_embeddings([chunk_ids[i] for i in hits],
+                                             np.vstack([cached[hashes[i]] for i in hits]).astype('float32'), index)
+            cache_hits = len(hits)
+            positions = [i for i in positions if hashes[i] not in cached]
+        
+        # 工作进程只从模型清单记录的本地目录加载模型，不在子进程中解析模型或联网下载
+        model_path = manifest_model_path(self._embedding_manifest_path(), self.embedding_model_name)
+        if positions and model_path is None:
+            raise RuntimeError(f"模型清单中没有 {self.embedding_model_name} 的本地模型目录")
+        encoder = BulkEncoder(model_path, Config.BULK_ENCODE_WORKERS, Config.BULK_ENCODE_BATCH_SIZE)
+        if positions:
+            print(f"多进程编码 {len(positions)} 个文档块（嵌入缓存命中 {cache_hits} 个），"
+                  f"{encoder.workers} 个工作进程，每批 {encoder.batch_size} 个")
+        progress_step = max(1, len(positions) // encoder.batch_size // 10)
+        for batch_positions, embeddings in encoder.encode([texts[i] for i in positions]):
+            batch = [positions[i] for i in batch_positions]
+            if hashes is not None:
+                self.embedding_cache.put_many(self.embedding_model_name, [hashes[i] for i in batch], embeddings)
+            self._store_chunk_embeddings([chunk_ids[i] for i in batch], embeddings, index)
+            if encoder.batches % progress_step == 0:
+                report = encoder.report()
+                print(f"  已编码 {report['chunks']}/{len(positions)} 个文档块，{report['chunks_per_second']} 块/秒")
+        
+        return dict(encoder.report(), cache_hits=cache_hits)
+    
+    def _store_chunk_embeddings(self, chunk_ids, embeddings, index=None):
+        """保存块向量，给定索引时一并加入"""
+        self.document_store.set_chunk_embeddings(chunk_ids, embeddings)
+        if index is not None:
+            index.add(embeddings, np.array(chunk_ids, dtype='int64'))
+    
+    def _add_document_to_semantic_index(self, doc_id):
+        """增量地将单个文档的块（由词法索引切分并分配块ID）编码后加入向量索引"""
+        chunk_ids, embeddings = self._encode_document_chunks(doc_id)
+        self._index_document_embeddings(doc_id, chunk_ids, embeddings)
+    
+    def _encode_document_chunks(self, doc_id):
+        """编码单个文档的块，返回 (块ID列表, 向量矩阵)，文档没有块时向量为None"""
+        document_chunks = self.document_store.get_document_chunks(doc_id)
+        if not document_chunks:
+            return [], None
+        chunk_ids = [chunk_id for chunk_id, _ in document_chunks]
+        return chunk_ids, self._encode_texts([text for _, text in document_chunks])
+    
+    def _index_document_embeddings(self, doc_id, chunk_ids, embeddings):
+        """保存文档的块向量并加入向量索引"""
+        if not chunk_ids:
+            return
         
-        # 为每个文档创建语义块
-        all_chunks = []
-        for doc in self.documents:
-            chunks = self._split_document_into_chunks(doc['content'])
-            for chunk in chunks:
-                chunk_info = {
-                    'text': chunk,
-                    'document_id': doc['id'],
-                    'filename': doc['filename'],
-                    'chunk_index': len(all_chunks)
-                }
-                self.document_chunks.append(chunk_info)
-                all_chunks.append(chunk)
+        self.document_store.set_chunk_embeddings(chunk_ids, embeddings)
+        if self.embedding_index is None:
+            self.embedding_index = self._create_vector_index(embeddings.shape[1],
+                                                             self._target_index_type(len(chunk_ids)))
+        with self.vector_index_lock.write():
+            self.embedding_index.add(embeddings, np.array(chunk_ids, dtype='int64'))
+        # 收录区间由块ID得出：删除文档时先移除块区间再取 semantic_update_lock，此时文档可能已不在
+        # document_chunk_ranges 中，收录的区间由删除流程随后从向量索引中移除
+        self.semantic_chunk_ranges[doc_id] = (chunk_ids[0], chunk_ids[-1] + 1)
+        print(f"✓ 语义索引新增 {len(chunk_ids)} 个文档块")
+    
+    def _remove_document_from_semantic_index(self, doc_id):
+        """增量地从向量索引中移除单个文档的块"""
+        chunk_range = self.semantic_chunk_ranges.pop(doc_id, None)
+        if not chunk_range or self.embedding_index is None:
+            return
+        
+        with self.vector_index_lock.write():
+            removed = self.embedding_index.remove_range(*chunk_range)
+        print(f"✓ 语义索引移除 {removed} 个文档块")
+    
+    def _queue_document_embedding(self, doc_id):
+        """将新文档的块编码排入后台队列（关闭后台编码时在当前线程中完成）
+        
+        启动时的语义初始化尚未完成时，即使关闭了后台编码也排入后台队列，上传请求不等待初始化
+        """
+        self.indexing_states[doc_id] = 'pending'
+        if not Config.BACKGROUND_EMBEDDING and self.semantic_initialized.is_set():
+            self._embed_documents([doc_id])
+            return
+        
+        if self.embedding_worker is None:
+            with self.embedding_worker_lock:
+                if self.embedding_worker is None:
+                    self.embedding_worker = threading.Thread(target=self._run_embedding_worker,
+                                                             name='document-embedding', daemon=True)
+                    self.embedding_worker.start()
+        self.embedding_queue.put(doc_id)
+    
+    def _run_embedding_worker(self):
+        """后台线程：取出队列中已有的全部文档一起处理，整批处理完后再维护和保存一次向量索引"""
+        while True:
+            doc_ids = [self.embedding_queue.get()]
+            while True:
+                try:
+                    doc_ids.append(self.embedding_queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._embed_documents(doc_ids)
+            finally:
+                for _ in doc_ids:
+                    self.embedding_queue.task_done()
+    
+    def _embed_documents(self, doc_ids):
+        """编码一批文档的块并加入向量索引，逐个更新文档的索引状态
+        
+        启动时的后台初始化结束后才开始处理；初始化失败（只有关键词检索）时直接结束
+        """
+        self.semantic_initialized.wait()
+        if not self.semantic_ready:
+            for doc_id in doc_ids:
+                self.indexing_states.pop(doc_id, None)
+            return
+        
+        added = False
+        for doc_id in doc_ids:
+            if doc_id not in self.documents_by_id or doc_id in self.semantic_chunk_ranges:
+                # 排队期间文档已被删除，或已在初始化时收录
+                self.indexing_states.pop(doc_id, None)
+                continue
+            
+            self.indexing_states[doc_id] = 'embedding'
+            try:
+                # 编码在锁外进行，不阻塞删除文档和检索
+                chunk_ids, embeddings = self._encode_document_chunks(doc_id)
+                with self.semantic_update_lock:
+                    if doc_id in self.documents_by_id and doc_id not in self.semantic_chunk_ranges:
+                        self._index_document_embeddings(doc_id, chunk_ids, embeddings)
+                        added = True
+                self.indexing_states.pop(doc_id, None)
+                self.indexing_errors.pop(doc_id, None)
+                self.generation += 1
+            except Exception as e:
+                print(f"× 文档 {doc_id} 的语义索引失败: {e}")
+                self.indexing_states[doc_id] = 'failed'
+                self.indexing_errors[doc_id] = str(e)
+        
+        if added:
+            with self.semantic_update_lock:
+                try:
+                    self._maintain_vector_index()
+                    self._schedule_semantic_save()
+                except Exception as e:
+                    print(f"更新语义索引失败: {e}")
+    
+    def get_indexing_state(self, doc_id):
+        """文档的语义索引状态：pending（排队中）/ embedding（编码中）/ ready（已可检索）/ failed（失败）
+        
+        文档入库后立即可以关键词检索，状态只反映语义向量索引；启动时的语义初始化完成前为 pending，
+        未启用语义检索时为 ready
+        """
+        default_state = 'ready' if self.semantic_initialized.is_set() else 'pending'
+        return self.indexing_states.get(doc_id, default_state)
+    
+    def _semantic_index_paths(self, index_type=None):
+        """语义索引相关文件路径（NumPy索引与FAISS索引使用不同的文件）"""
+        index_file = 'semantic_index.npy' if index_type == 'numpy' else 'semantic_index.faiss'
+        return {
+            'index': os.path.join(self.knowledge_base_path, index_file),
+            'chunks': os.path.join(self.knowledge_base_path, 'semantic_chunks.json'),
+            # 旧版的嵌入矩阵文件，块向量现已保存在文档存储中
+            'legacy_embeddings': os.path.join(self.knowledge_base_path, 'semantic_embeddings.npz')
+        }
+    
+    def _semantic_index_tag(self):
+        """语义索引标记：模型或分块参数变化时持久化的索引失效"""
+        return {
+            'format_version': SEMANTIC_INDEX_FORMAT_VERSION,
+            'model_name': self.embedding_model_name,
+            'chunk_size': CHUNK_SIZE,
+            'chunk_overlap': CHUNK_OVERLAP
+        }
+    
+    def _save_semantic_index(self):
+        """将向量索引和块元数据保存到知识库目录（块向量已在文档存储中）"""
+        if self.embedding_index is None:
+            return
         
-        if not all_chunks:
+        paths = self._semantic_index_paths(self.embedding_index.index_type)
+        try:
+            # 先写临时文件再替换，避免中途失败留下不一致的文件
+            tmp_index = paths['index'] + '.tmp'
+            self.embedding_index.save(tmp_index)
+            os.replace(tmp_index, paths['index'])
+            
+            # 块元数据最后写入，它的标记决定整套文件是否可用
+            tmp_chunks = paths['chunks'] + '.tmp'
+            with open(tmp_chunks, 'w', encoding='utf-8') as f:
+                json.dump({
+                    'tag': self._semantic_index_tag(),
+                    'dimension': int(self.embedding_index.dimension),
+                    'index': self.embedding_index.get_config(),
+                    'next_chunk_id': self.next_chunk_id,
+                    'chunk_ranges': {str(doc_id): list(chunk_range)
+                                     for doc_id, chunk_range in self.semantic_chunk_ranges.items()}
+                }, f, ensure_ascii=False)
+            os.replace(tmp_chunks, paths['chunks'])
+            
+            # 切换了索引后端时删除另一种格式的旧索引文件
+            other_type = 'flat' if self.embedding_index.index_type == 'numpy' else 'numpy'
+            for stale_path in (self._semantic_index_paths(other_type)['index'], paths['legacy_embeddings']):
+                if os.path.exists(stale_path):
+                    os.remove(stale_path)
+        except Exception as e:
+            print(f"× 保存语义索引失败: {e}")
+    
+    def _schedule_semantic_save(self):
+        """增删文档后延迟保存语义索引：SEMANTIC_SAVE_DELAY 秒内的多次增删合并为一次写盘（调用方持有 semantic_update_lock）
+        
+        进程在保存前退出时，下次启动的对账按文档存储补齐（块向量已在文档存储和嵌入缓存中，无需重新编码）
+        """
+        if Config.SEMANTIC_SAVE_DELAY <= 0:
+            self._save_semantic_index()
             return
+        if self.semantic_save_timer is None:
+            self.semantic_save_timer = threading.Timer(Config.SEMANTIC_SAVE_DELAY, self.flush_semantic_index)
+            self.semantic_save_timer.daemon = True
+            self.semantic_save_timer.start()
+    
+    def flush_semantic_index(self):
+        """立即保存尚未写盘的语义索引（延迟保存到期和进程退出时调用）"""
+        with self.semantic_update_lock:
+            timer, self.semantic_save_timer = self.semantic_save_timer, None
+            if timer is None:
+                return
+            timer.cancel()
+            self._save_semantic_index()
+    
+    def _load_semantic_index(self):
+        """从磁盘加载语义索引，标记不匹配或文件缺失时返回False"""
+        paths = self._semantic_index_paths()
+        if not os.path.exists(paths['chunks']):
+            return False
         
         try:
-            # 生成嵌入向量
-            print(f"正在为 {len(all_chunks)} 个文档块生成嵌入向量...")
-            self.document_embeddings = self.embedding_model.encode(all_chunks, 
-                                                                  show_progress_bar=True,
-                                                                  normalize_embeddings=True)
+            with open(paths['chunks'], 'r', encoding='utf-8') as f:
+                meta = json.load(f)
             
-            # 构建FAISS索引
-            dimension = self.document_embeddings.shape[1]
-            self.embedding_index = faiss.IndexFlatIP(dimension)  # 使用内积相似度
-            self.embedding_index.add(self.document_embeddings.astype('float32'))
+            if meta.get('tag') != self._semantic_index_tag():
+                print("语义索引标记不匹配（模型或分块参数已变化），需要重建")
+                return False
             
-            print(f"✓ 语义索引构建完成，维度: {dimension}")
+            # 旧版元数据把块文本存放在JSON中，块现已由词法索引统一切分，按新的块重建
+            if 'chunks' in meta:
+                print("旧版语义索引格式，需要重建")
+                return False
             
+            self.semantic_chunk_ranges = {int(doc_id): tuple(chunk_range)
+                                          for doc_id, chunk_range in meta['chunk_ranges'].items()}
+            chunk_limit = self.next_chunk_id
+            self._backfill_chunk_embeddings(chunk_limit=chunk_limit)
+            
+            # 旧版元数据没有索引配置，对应FAISS暴力检索索引
+            index_type = (meta.get('index') or {}).get('index_type', 'flat')
+            paths = self._semantic_index_paths(index_type)
+            loadable = index_type == 'numpy' or FAISS_AVAILABLE
+            if loadable and os.path.exists(paths['index']):
+                self.embedding_index = load_vector_index(paths['index'], meta.get('index'),
+                                                         **self._vector_index_options())
+            else:
+                # 索引文件丢失（或保存的是FAISS索引而faiss未安装）时用文档存储中的块向量重建，无需重新编码
+                self._rebuild_vector_index(self._target_index_type(self.document_store.count_chunk_embeddings()))
+                if self.embedding_index is None:
+                    return False
+                # 补齐向量后，加载开始前已分配的块都已在重建的索引中
+                self.semantic_chunk_ranges = self._chunk_ranges_below(chunk_limit)
         except Exception as e:
-            print(f"× 语义索引构建失败: {e}")
+            print(f"× 加载语义索引失败: {e}")
             self.embedding_index = None
-            self.document_embeddings = None
+            self.semantic_chunk_ranges = {}
+            return False
+        
+        with self.semantic_update_lock:
+            self._reconcile_semantic_index()
+        print(f"✓ 已从磁盘加载语义索引，类型: {self.embedding_index.index_type}，"
+              f"共 {self.embedding_index.ntotal} 个文档块")
+        return True
     
-    def _semantic_search(self, query, k=10):
-        """执行语义搜索"""
-        if not self.embedding_model or not self.embedding_index:
-            return []
+    def _reconcile_semantic_index(self):
+        """使加载的语义索引与当前文档及其分块、配置的索引类型一致（处理上次保存后中断的增删、重新分块）"""
+        # 文档已删除或块ID区间已变化（重新分块）的旧块先移除
+        stale_ids = [doc_id for doc_id, chunk_range in self.semantic_chunk_ranges.items()
+                     if doc_id not in self.documents_by_id or self.document_chunk_ranges.get(doc_id) != chunk_range]
+        index_config = self.embedding_index.get_config()
+        
+        for doc_id in stale_ids:
+            self._remove_document_from_semantic_index(doc_id)
+        # 初始化期间删除的文档：构建时已编码加入索引的块不在 semantic_chunk_ranges 中，按记下的区间移除
+        init_deleted = self.init_deleted_chunk_ranges
+        self.init_deleted_chunk_ranges = {}
+        removed = 0
+        for doc_id, chunk_range in init_deleted.items():
+            self.semantic_chunk_ranges.pop(doc_id, None)
+            with self.vector_index_lock.write():
+                removed += self.embedding_index.remove_range(*chunk_range)
+        if removed:
+            print(f"✓ 语义索引移除初始化期间删除的 {removed} 个文档块")
+        missing_ids = [doc_id for doc_id in self.document_chunk_ranges
+                       if doc_id in self.documents_by_id and doc_id not in self.semantic_chunk_ranges]
+        for doc_id in missing_ids:
+            self._add_document_to_semantic_index(doc_id)
+        self._maintain_vector_index()
+        
+        index_path = self._semantic_index_paths(self.embedding_index.index_type)['index']
+        if (stale_ids or removed or missing_ids or self.embedding_index.get_config() != index_config
+                or not os.path.exists(index_path)):
+            self._save_semantic_index()
+    
+    def _semantic_search(self, query, k=10, nprobe=None, ef_search=None, document_ids=None):
+        """执行语义搜索
+
+        nprobe/ef_search 覆盖IVF/HNSW索引的默认检索参数；
+        document_ids 给定时只在这些文档的块中精确检索，按文档的块ID区间读取向量，代价与目标块数成正比
+        """
+        return self._semantic_search_many([query], k, nprobe, ef_search, [document_ids])[0]
+    
+    def _semantic_search_many(self, queries, k=10, nprobe=None, ef_search=None, document_ids_list=None):
+        """批量语义搜索：一次编码全部查询，全局查询合并为一次多行向量检索
+
+        document_ids_list 与 queries 一一对应，元素为None表示全局检索；返回与 queries 对应的结果列表
+        """
+        # 取索引的引用：重建时索引对象整体替换，检索继续使用取到的对象
+        embedding_index = self.embedding_index
+        if not self.semantic_ready or not self.embedding_model or not embedding_index:
+            return [[] for _ in queries]
+        document_ids_list = document_ids_list or [None] * len(queries)
         
         try:
-            # 生成查询嵌入
-            query_embedding = self.embedding_model.encode([query], normalize_embeddings=True)
+            # 生成查询嵌入（查询不写入块向量的持久化缓存）
+            query_embeddings = self.query_encoder.encode_many(queries)
             
-            # 在索引中搜索
-            scores, indices = self.embedding_index.search(query_embedding.astype('float32'), k)
+            k = max(k, 1)
+            all_scores = np.full((len(queries), k), -np.inf, dtype='float32')
+            all_indices = np.full((len(queries), k), -1, dtype='int64')
+            global_rows = [row for row, document_ids in enumerate(document_ids_list) if document_ids is None]
+            if global_rows:
+                # 在索引中搜索
+                with self.vector_index_lock.read():
+                    scores, indices = embedding_index.search(query_embeddings[global_rows], k,
+                                                             nprobe=nprobe, ef_search=ef_search)
+                all_scores[global_rows] = scores
+                all_indices[global_rows] = indices
+            for row, document_ids in enumerate(document_ids_list):
+                if document_ids is None:
+                    continue
+                chunk_ranges = [self.document_chunk_ranges[doc_id] for doc_id in document_ids
+                                if doc_id in self.document_chunk_ranges]
+                chunk_ids, vectors = self.document_store.get_chunk_embeddings_in_ranges(chunk_ranges)
+                all_scores[row:row + 1], all_indices[row:row + 1] = exact_search(
+                    vectors, chunk_ids, query_embeddings[row:row + 1], k)
             
-            # 构建结果
-            results = []
-            for i, (score, idx) in enumerate(zip(scores[0], indices[0])):
-                if idx < len(self.document_chunks):
-                    chunk_info = self.document_chunks[idx]
-                    results.append({
-                        'chunk_index': idx,
-                        'document_id': chunk_info['document_id'],
-                        'filename': chunk_info['filename'],
-                        'text': chunk_info['text'],
-                        'semantic_score': float(score),
-                        'rank': i + 1
-                    })
+            # 构建结果（块文本按需从文档存储读取）
+            chunk_infos = self.document_store.get_chunks(np.unique(all_indices[all_indices >= 0]).tolist())
+            all_results = []
+            for scores, indices in zip(all_scores, all_indices):
+                results = []
+                for score, idx in zip(scores, indices):
+                    chunk_info = chunk_infos.get(int(idx))
+                    if chunk_info:
+                        results.append({
+                            'chunk_index': int(idx),
+                            'document_id': chunk_info['document_id'],
+                            'filename': chunk_info['filename'],
+                            'text': chunk_info['text'],
+                            'semantic_score': float(score),
+                            'rank': len(results) + 1
+                        })
+                all_results.append(results)
             
-            return results
+            return all_results
             
         except Exception as e:
             print(f"语义搜索失败: {e}")
-            return []
-    
-    def save_knowledge_base(self):
-        """保存知识库"""
-        kb_file = os.path.join(self.knowledge_base_path, 'documents.json')
-        with open(kb_file, 'w', encoding='utf-8') as f:
-            json.dump(self.documents, f, ensure_ascii=False, indent=2)
+            return [[] for _ in queries]
     
     def add_document(self, filename, content):
-        """添加文档到知识库"""
-        doc = {
-            'id': len(self.documents) + 1,
-            'filename': filename,
-            'content': content,
-            'created_at': datetime.now().isoformat()
-        }
-        self.documents.append(doc)
-        self.save_knowledge_base()
-        # 重建搜索索引和文件名模式
-        self._rebuild_search_index()
-        self._build_filename_patterns()
-        
-        # 重建语义索引
-        if EMBEDDING_AVAILABLE and self.embedding_model:
-            self._build_semantic_index()
+        """添加文档到知识库：写入文档存储和词法索引后立即可以关键词检索，语义索引在后台完成"""
+        metadata = self.document_store.add_document(filename, content, datetime.now().isoformat())
+        with self.document_lock:
+            self.documents.append(metadata)
+            self.documents_by_id[metadata['id']] = metadata
+        doc = dict(metadata, content=content)
+        self._index_document_text(doc)
+        # 增量更新文件名模式
+        self._add_filename_patterns(metadata)
+        self.generation += 1
+        
+        # 块编码排入后台队列，完成后再加入向量索引（启动初始化期间也先排队）
+        if EMBEDDING_AVAILABLE and (self.embedding_model or not self.semantic_initialized.is_set()):
+            self._queue_document_embedding(doc['id'])
         
         return doc['id']
     
@@ -263,8 +1018,14 @@ class KnowledgeBase:
                 print(f"文档 ID {doc_id} 不存在")
                 return False
             
-            # 2. 从文档列表中移除
-            self.documents = [doc for doc in self.documents if doc['id'] != doc_id]
+            # 2. 从文档存储和文档列表中移除
+            self.document_store.delete_document(doc_id)
+            with self.document_lock:
+                self.documents = [doc for doc in self.documents if doc['id'] != doc_id]
+                self.documents_by_id.pop(doc_id, None)
+            with self.lexical_index_lock.write():
+                self.inverted_index.remove_document(doc_id)
+                chunk_range = self._release_document_chunks(doc_id)
             
             # 3. 删除相应的物理文件（如果存在）
             try:
@@ -276,23 +1037,26 @@ class KnowledgeBase:
                 print(f"删除物理文件失败: {e}")
                 # 即使物理文件删除失败，也继续删除数据库记录
             
-            # 4. 保存更新后的知识库
-            self.save_knowledge_base()
-            
-            # 5. 重建搜索索引
-            self._rebuild_search_index()
+            # 4. 移除文件名模式
+            self._remove_filename_patterns(doc_to_delete)
             
-            # 6. 重建文件名模式
-            self._build_filename_patterns()
-            
-            # 7. 重建语义索引（如果启用）
-            if EMBEDDING_AVAILABLE and self.embedding_model:
+            # 5. 从语义索引中移除该文档的块（如果启用）
+            self.indexing_states.pop(doc_id, None)
+            self.indexing_errors.pop(doc_id, None)
+            # （语义初始化完成前只记下块区间，初始化结束时的对账会从索引中移除）
+            if EMBEDDING_AVAILABLE:
                 try:
-                    self._build_semantic_index()
-                    print("语义索引已重建")
+                    with self.semantic_update_lock:
+                        if self.semantic_ready:
+                            self._remove_document_from_semantic_index(doc_id)
+                            self._maintain_vector_index()
+                            self._schedule_semantic_save()
+                        elif chunk_range and not self.semantic_initialized.is_set():
+                            self.init_deleted_chunk_ranges[doc_id] = chunk_range
                 except Exception as e:
-                    print(f"重建语义索引失败: {e}")
+                    print(f"更新语义索引失败: {e}")
             
+            self.generation += 1
             print(f"文档 '{doc_to_delete['filename']}' (ID: {doc_id}) 已成功删除")
             return True
             
@@ -300,6 +1064,71 @@ class KnowledgeBase:
             print(f"删除文档时发生错误: {e}")
             return False
     
+    def vector_storage_report(self, storage_modes=None, num_queries=100, k=10):
+        """向量存储报告：每个块占用的字节数，以及相对float32精确检索的 recall@k
+        
+        查询为随机抽取的块向量，参考结果为文档存储中float32块向量上的精确检索；
+        未指定存储模式时只报告当前索引，其他模式用文档存储中的块向量临时构建同类型的索引。
+        查询数和k不超过配置的上限；块数超过 VECTOR_STORAGE_REPORT_MAX_CHUNKS 时只在随机抽取的块上评估，
+        各存储模式（含当前模式）都在这些块上临时构建索引
+        """
+        if self.embedding_index is None:
+            return None
+        num_queries = max(1, min(num_queries, Config.VECTOR_STORAGE_REPORT_MAX_QUERIES))
+        k = max(1, min(k, Config.VECTOR_STORAGE_REPORT_MAX_K))
+        
+        total_chunks = self.document_store.count_chunk_embeddings()
+        sampled = total_chunks > Config.VECTOR_STORAGE_REPORT_MAX_CHUNKS
+        if sampled:
+            corpus_ids, corpus = self.document_store.sample_chunk_embeddings(
+                Config.VECTOR_STORAGE_REPORT_MAX_CHUNKS, with_ids=True)
+            rng = np.random.default_rng()
+            queries = corpus[rng.choice(len(corpus), min(num_queries, len(corpus)), replace=False)]
+            reference_scores, reference_ids = exact_search(corpus, corpus_ids, queries, k)
+        else:
+            queries = self.document_store.sample_chunk_embeddings(num_queries)
+            if queries is None:
+                return None
+            reference_scores = np.full((len(queries), k), -np.inf, dtype='float32')
+            reference_ids = np.full((len(queries), k), -1, dtype='int64')
+            for chunk_ids, vectors in self.document_store.iter_chunk_embeddings():
+                scores, labels = exact_search(vectors, chunk_ids, queries, k)
+                reference_scores, reference_ids = merge_top_k(reference_scores, reference_ids, scores, labels, k)
+        
+        index_type = self.embedding_index.index_type
+        current_storage = self.embedding_index.get_config().get('storage')
+        reports = []
+        for storage in dict.fromkeys(self._vector_storage(index_type, storage)
+                                     for storage in storage_modes or [current_storage]):
+            if sampled:
+                index = self._build_sample_vector_index(index_type, storage, corpus_ids, corpus)
+            elif storage == current_storage:
+                index = self.embedding_index
+            else:
+                index = self._train_vector_index(index_type, storage)
+            started = time.perf_counter()
+            with self.vector_index_lock.read():
+                _, found_ids = index.search(queries, k)
+            search_ms = (time.perf_counter() - started) * 1000
+            reports.append({
+                'storage': storage,
+                'index_type': index_type,
+                'bytes_per_chunk': index.memory_usage() / max(index.ntotal, 1),
+                'recall_at_k': recall_at_k(found_ids, reference_ids),
+                'search_ms_per_query': search_ms / max(len(queries), 1)
+            })
+        
+        return {
+            'chunks': self.embedding_index.ntotal,
+            'evaluated_chunks': len(corpus_ids) if sampled else total_chunks,
+            'sampled': sampled,
+            'dimension': self.embedding_index.dimension,
+            'float32_bytes_per_chunk': 4 * self.embedding_index.dimension,
+            'k': k,
+            'num_queries': len(queries),
+            'modes': reports
+        }
+    
     # 更多方法将在下一个文件中继续...
     
     def _preprocess_text(self, text):
@@ -331,54 +1160,37 @@ class KnowledgeBase:
         # 去重并返回前top_k个
         return list(set(keywords))[:top_k]
     
-    def _rebuild_search_index(self):
-        """重建搜索索引"""
-        if not self.documents:
-            return
-        
-        # 预处理所有文档内容
-        self.processed_contents = []
-        for doc in self.documents:
-            processed_content = self._preprocess_text(doc['content'])
-            self.processed_contents.append(processed_content)
-        
-        # 构建TF-IDF向量
-        self.tfidf_vectorizer = TfidfVectorizer(
-            max_features=1000,
-            ngram_range=(1, 2),  # 支持1-2gram
-            min_df=1,
-            max_df=0.95
-        )
-        
-        try:
-            self.tfidf_matrix = self.tfidf_vectorizer.fit_transform(self.processed_contents)
-        except:
-            self.tfidf_matrix = None
-    
     def _build_filename_patterns(self):
         """构建文件名匹配模式，支持多种文件名识别方式"""
-        self.filename_patterns = {}
+        self.filename_lookup = {}
         for doc in self.documents:
-            filename = doc['filename']
-            # 存储完整文件名（包含扩展名）
-            self.filename_patterns[filename.lower()] = doc['id']
-            
-            # 存储不含扩展名的文件名
-            name_without_ext = os.path.splitext(filename)[0].lower()
-            self.filename_patterns[name_without_ext] = doc['id']
-            
-            # 处理中文文件名的关键词
-            keywords = self._extract_filename_keywords(filename)
-            for keyword in keywords:
-                if keyword not in self.filename_patterns:
-                    self.filename_patterns[keyword] = []
-                if isinstance(self.filename_patterns[keyword], list):
-                    if doc['id'] not in self.filename_patterns[keyword]:
-                        self.filename_patterns[keyword].append(doc['id'])
-                else:
-                    # 转换为列表格式
-                    existing_id = self.filename_patterns[keyword]
-                    self.filename_patterns[keyword] = [existing_id, doc['id']]
+            self.filename_lookup.setdefault(doc['filename'].lower(), set()).add(doc['id'])
+        self.filename_patterns = AhoCorasick.build((doc['id'], self._filename_patterns(doc)) for doc in self.documents)
+    
+    def _filename_patterns(self, doc):
+        """文档的文件名匹配模式（同一文档的重复模式只计一次）"""
+        filename = doc['filename']
+        patterns = [
+            filename.lower(),  # 完整文件名（包含扩展名）
+            os.path.splitext(filename)[0].lower()  # 不含扩展名的文件名
+        ]
+        # 处理中文文件名的关键词
+        patterns.extend(self._extract_filename_keywords(filename))
+        return list(dict.fromkeys(patterns))
+    
+    def _add_filename_patterns(self, doc):
+        """将单个文档的文件名模式加入自动机"""
+        self.filename_patterns.add(doc['id'], self._filename_patterns(doc))
+        self.filename_lookup.setdefault(doc['filename'].lower(), set()).add(doc['id'])
+    
+    def _remove_filename_patterns(self, doc):
+        """从自动机中移除单个文档的文件名模式"""
+        self.filename_patterns.remove(doc['id'])
+        doc_ids = self.filename_lookup.get(doc['filename'].lower())
+        if doc_ids is not None:
+            doc_ids.discard(doc['id'])
+            if not doc_ids:
+                del self.filename_lookup[doc['filename'].lower()]
     
     def _extract_filename_keywords(self, filename):
         """从文件名中提取关键词"""
@@ -407,18 +1219,13 @@ class KnowledgeBase:
         detected_files = []
         confidence_scores = {}
         
-        # 1. 完全匹配检测
-        for pattern, doc_ids in self.filename_patterns.items():
-            if pattern in query_lower:
-                if isinstance(doc_ids, list):
-                    for doc_id in doc_ids:
-                        if doc_id not in detected_files:
-                            detected_files.append(doc_id)
-                            confidence_scores[doc_id] = confidence_scores.get(doc_id, 0) + len(pattern) * 2
-                else:
-                    if doc_ids not in detected_files:
-                        detected_files.append(doc_ids)
-                        confidence_scores[doc_ids] = confidence_scores.get(doc_ids, 0) + len(pattern) * 2
+        # 1. 完全匹配检测：自动机一次扫描找出查询中出现的全部文件名模式，
+        #    每个文档按命中的最长模式（完整文件名 > 去扩展名 > 关键词）计置信度
+        for pattern, doc_ids in self.filename_patterns.find(query_lower).items():
+            for doc_id in doc_ids:
+                if doc_id not in confidence_scores:
+                    detected_files.append(doc_id)
+                confidence_scores[doc_id] = max(confidence_scores.get(doc_id, 0), len(pattern) * 2)
         
         # 2. 文件扩展名检测（如果用户提到了.pdf, .doc等）
         extensions = ['.pdf', '.doc', '.docx', '.txt', '.xlsx']
@@ -430,11 +1237,10 @@ class KnowledgeBase:
                 matches = re.finditer(pattern, query_lower)
                 for match in matches:
                     potential_filename = match.group(1) + ext
-                    for doc in self.documents:
-                        if doc['filename'].lower() == potential_filename:
-                            if doc['id'] not in detected_files:
-                                detected_files.append(doc['id'])
-                                confidence_scores[doc['id']] = confidence_scores.get(doc['id'], 0) + 10
+                    for doc_id in self.filename_lookup.get(potential_filename, ()):
+                        if doc_id not in detected_files:
+                            detected_files.append(doc_id)
+                            confidence_scores[doc_id] = confidence_scores.get(doc_id, 0) + 10
         
         # 3. 按置信度排序
         if detected_files and confidence_scores:
@@ -442,14 +1248,19 @@ class KnowledgeBase:
         
         return detected_files, confidence_scores
     
-    def _rerank_results(self, query, semantic_results, keyword_results):
-        """重排序结果，融合语义搜索和关键词搜索的结果"""
+    def _rerank_results(self, query, semantic_results, keyword_results, chunk_texts=None):
+        """重排序结果，融合语义搜索和关键词搜索的结果
+        
+        两路结果共享块ID：同一个块被两路同时命中时只出现一次；chunk_texts 为关键词结果所用块的 {块ID: 文本}
+        """
+        chunk_texts = dict(chunk_texts or {})
         # 创建结果字典，以文档ID为键
         combined_results = {}
         
         # 处理语义搜索结果
         for result in semantic_results:
             doc_id = result['document_id']
+            chunk_texts.setdefault(result['chunk_index'], result['text'])
             if doc_id not in combined_results:
                 combined_results[doc_id] = {
                     'document_id': doc_id,
@@ -457,6 +1268,7 @@ class KnowledgeBase:
                     'semantic_score': 0,
                     'keyword_score': 0,
                     'semantic_chunks': [],
+                    'keyword_chunk_ids': [],
                     'keyword_content': '',
                     'combined_score': 0
                 }
@@ -464,7 +1276,7 @@ class KnowledgeBase:
             # 累积语义分数（取前3个块的平均分）
             if len(combined_results[doc_id]['semantic_chunks']) < 3:
                 combined_results[doc_id]['semantic_chunks'].append({
-                    'text': result['text'],
+                    'chunk_id': result['chunk_index'],
                     'score': result['semantic_score']
                 })
                 combined_results[doc_id]['semantic_score'] += result['semantic_score']
@@ -479,12 +1291,15 @@ class KnowledgeBase:
                     'semantic_score': 0,
                     'keyword_score': 0,
                     'semantic_chunks': [],
+                    'keyword_chunk_ids': [],
                     'keyword_content': '',
                     'combined_score': 0
                 }
             
             combined_results[doc_id]['keyword_score'] = result['score']
             combined_results[doc_id]['keyword_content'] = result['content']
+            combined_results[doc_id]['keyword_chunk_ids'] = [chunk_id for chunk_id in result.get('chunk_ids', [])
+                                                             if chunk_id in chunk_texts]
         
         # 计算综合分数并构建最终结果
         final_results = []
@@ -496,16 +1311,21 @@ class KnowledgeBase:
             # 综合评分：语义搜索权重0.6，关键词搜索权重0.4
             combined_score = semantic_score * 0.6 + keyword_score * 0.4
             
-            # 构建内容
-            content_parts = []
+            # 构建内容：分数最高的语义块在前，再补充关键词命中的块（按块ID去重）
+            chunk_ids = []
             if data['semantic_chunks']:
-                # 选择分数最高的语义块
                 best_chunks = sorted(data['semantic_chunks'], 
                                    key=lambda x: x['score'], reverse=True)[:2]
-                for chunk in best_chunks:
-                    content_parts.append(chunk['text'])
+                chunk_ids.extend(chunk['chunk_id'] for chunk in best_chunks)
+            content_parts = [chunk_texts[chunk_id] for chunk_id in chunk_ids]
             
-            if data['keyword_content']:
+            if data['keyword_chunk_ids']:
+                for chunk_id in data['keyword_chunk_ids']:
+                    if chunk_id not in chunk_ids:
+                        chunk_ids.append(chunk_id)
+                        content_parts.append(chunk_texts[chunk_id])
+            elif data['keyword_content']:
+                # 句子级片段没有块ID
                 content_parts.append(data['keyword_content'])
             
             final_content = '\n\n'.join(content_parts)
@@ -514,6 +1334,7 @@ class KnowledgeBase:
                 'document_id': doc_id,
                 'filename': data['filename'],
                 'content': final_content,
+                'chunk_ids': chunk_ids,
                 'score': combined_score,
                 'semantic_score': semantic_score,
                 'keyword_score': keyword_score,
@@ -524,34 +1345,65 @@ class KnowledgeBase:
         final_results.sort(key=lambda x: x['score'], reverse=True)
         return final_results
     
-    def _fuzzy_match_score(self, query_word, doc_words):
-        """计算模糊匹配分数"""
-        max_score = 0
-        for word in doc_words:
-            # 使用序列匹配计算相似度
-            similarity = SequenceMatcher(None, query_word, word).ratio()
-            if similarity > max_score:
-                max_score = similarity
-        return max_score
-    
-    def _calculate_keyword_match_score(self, query_keywords, doc_content):
-        """计算关键词匹配分数"""
-        content_lower = doc_content.lower()
-        doc_words = jieba.lcut(content_lower)
+    def _fuzzy_match_terms(self, query_word, threshold=0.7):
+        """在语料词表中查找与查询词相似度超过阈值的词项，返回 {词项: 相似度}"""
+        return self.inverted_index.similar_terms(query_word, threshold)
+    
+    def _match_keywords_in_index(self, query_keywords, budget=None):
+        """利用倒排索引计算每个查询关键词命中的文档
+        
+        返回 {小写关键词: (精确命中的文档ID集合, {模糊命中的文档ID: 最高相似度})}；
+        budget 不允许模糊匹配（档位关闭或已到截止时间）时只做精确匹配
+        """
+        keyword_matches = {}
+        for keyword in query_keywords:
+            keyword_lower = keyword.lower()
+            if keyword_lower in keyword_matches:
+                continue
+            
+            exact_ids = set(self.inverted_index.get_postings(keyword_lower))
+            fuzzy_scores = {}
+            if budget is not None and not budget.allows('fuzzy'):
+                keyword_matches[keyword_lower] = (exact_ids, fuzzy_scores)
+                continue
+            for term, similarity in self._fuzzy_match_terms(keyword_lower).items():
+                for doc_id in self.inverted_index.get_postings(term):
+                    if doc_id not in exact_ids and similarity > fuzzy_scores.get(doc_id, 0):
+                        fuzzy_scores[doc_id] = similarity
+            keyword_matches[keyword_lower] = (exact_ids, fuzzy_scores)
+        return keyword_matches
+    
+    def _phrase_candidate_documents(self, terms):
+        """找出包含查询全部词项（查询分词后的词项集合）的文档，只有这些文档才可能包含完整的查询原文"""
+        if not terms:
+            return set()
+        
+        postings = sorted((self.inverted_index.get_postings(term) for term in terms), key=len)
+        candidates = set(postings[0])
+        for term_postings in postings[1:]:
+            candidates.intersection_update(term_postings)
+            if not candidates:
+                break
+        return candidates
+    
+    def _calculate_keyword_match_score(self, query_keywords, doc_id, keyword_matches=None):
+        """计算关键词匹配分数（基于倒排索引，无需重新分词文档）"""
+        if keyword_matches is None:
+            keyword_matches = self._match_keywords_in_index(query_keywords)
         
         total_score = 0
         matched_keywords = 0
         
         for keyword in query_keywords:
-            keyword_lower = keyword.lower()
+            exact_ids, fuzzy_scores = keyword_matches[keyword.lower()]
             
             # 精确匹配
-            if keyword_lower in content_lower:
+            if doc_id in exact_ids:
                 total_score += 2.0
                 matched_keywords += 1
             else:
                 # 模糊匹配
-                fuzzy_score = self._fuzzy_match_score(keyword_lower, doc_words)
+                fuzzy_score = fuzzy_scores.get(doc_id, 0)
                 if fuzzy_score > 0.7:  # 相似度阈值
                     total_score += fuzzy_score
                     matched_keywords += 1
@@ -563,28 +1415,43 @@ class KnowledgeBase:
         
         return total_score
     
-    def _extract_relevant_snippets(self, content, query_keywords, max_snippets=3, snippet_length=200):
-        """提取相关文本片段"""
-        sentences = re.split(r'[。！？\n]', content)
-        scored_sentences = []
+    def _tokenize_keywords(self, query_keywords):
+        """关键词 -> 词项集合（小写），与文档无关，同一查询只需计算一次"""
+        keyword_terms = {}
+        for keyword in query_keywords:
+            keyword_lower = keyword.lower()
+            if keyword_lower not in keyword_terms:
+                keyword_terms[keyword_lower] = set(self._tokenize_for_index(keyword_lower))
+        return keyword_terms
+    
+    def _extract_relevant_snippets(self, doc_id, query_keywords, max_snippets=3, snippet_length=200,
+                                   keyword_terms=None):
+        """提取相关文本片段：用入库时预先切分的句子和句子级词项倒排找出候选句子，只对候选句子打分"""
+        # 候选句子：包含某个关键词全部词项的句子
+        if keyword_terms is None:
+            keyword_terms = self._tokenize_keywords(query_keywords)
+        
+        all_terms = set().union(*keyword_terms.values()) if keyword_terms else set()
+        term_sentences = self.document_store.get_sentence_postings(doc_id, all_terms)
+        candidate_indexes = set()
+        for terms in keyword_terms.values():
+            if terms and all(term in term_sentences for term in terms):
+                candidate_indexes.update(set.intersection(*(term_sentences[term] for term in terms)))
         
-        for sentence in sentences:
-            if len(sentence.strip()) < 10:  # 跳过过短的句子
-                continue
-                
+        scored_sentences = []
+        for _, sentence, sentence_lower in self.document_store.get_sentences(doc_id, candidate_indexes):
             score = 0
-            sentence_lower = sentence.lower()
             
             # 计算句子与查询关键词的相关性
             for keyword in query_keywords:
                 if keyword.lower() in sentence_lower:
                     score += 1
                     # 如果关键词在句子开头，给予额外分数
-                    if sentence_lower.strip().startswith(keyword.lower()):
+                    if sentence_lower.startswith(keyword.lower()):
                         score += 0.5
             
             if score > 0:
-                scored_sentences.append((sentence.strip(), score))
+                scored_sentences.append((sentence, score))
         
         # 按分数排序并选择最相关的片段
         scored_sentences.sort(key=lambda x: x[1], reverse=True)
@@ -598,19 +1465,268 @@ class KnowledgeBase:
         
         return snippets
     
-    def search(self, query, threshold=0.1, max_results=5, target_documents=None):
-        """增强的智能搜索功能，支持语义搜索和重排序"""
+    def _chunk_snippets(self, scored_chunks, max_snippets=3):
+        """按块ID直接读取得分最高的块作为片段 [(块ID, 块文本)]，scored_chunks 为按分数降序的 [(块ID, 分数)]"""
+        chunk_ids = [chunk_id for chunk_id, _ in scored_chunks[:max_snippets]]
+        chunk_infos = self.document_store.get_chunks(chunk_ids)
+        return [(chunk_id, chunk_infos[chunk_id]['text']) for chunk_id in chunk_ids if chunk_id in chunk_infos]
+    
+    def _document_excerpt(self, doc_id, max_snippets=3, snippet_length=200):
+        """文档开头的几个句子，作为跳过片段抽取时的廉价替代"""
+        snippets = []
+        for _, sentence, _ in self.document_store.get_sentences(doc_id, range(max_snippets)):
+            if len(sentence) > snippet_length:
+                sentence = sentence[:snippet_length] + "..."
+            snippets.append(sentence)
+        return snippets
+    
+    def search(self, query, threshold=0.1, max_results=5, target_documents=None, nprobe=None, ef_search=None,
+               profile=None, time_budget_ms=None):
+        """增强的智能搜索功能，支持语义搜索和重排序
+
+        nprobe/ef_search 为语义检索的精度-速度参数（IVF/HNSW索引），None时使用配置的默认值；
+        profile 为速度档位（fast/balanced/thorough），决定执行哪些可选阶段，time_budget_ms 为时间预算
+        （None时使用档位的默认预算），到达截止时间后跳过剩余的可选阶段，跳过的阶段记录在 search_info 中；
+        相同参数的重复查询直接返回缓存结果，知识库增删文档后缓存自动失效
+        """
+        budget = self._search_budget(profile, time_budget_ms)
+        query = ' '.join(query.split())
+        cache_key = self._search_cache_key(query, threshold, max_results, target_documents, nprobe, ef_search,
+                                           budget)
+        generation = self.generation
+        results = self.result_cache.get(cache_key, generation) if self.result_cache.enabled else None
+        if results is None:
+            results = self._search_uncached(query, threshold, max_results, target_documents, nprobe, ef_search,
+                                            budget)
+            # 因时间预算降级的结果不缓存
+            if not budget.degraded:
+                self.result_cache.put(cache_key, generation, results)
+        return results
+    
+    def _search_budget(self, profile=None, time_budget_ms=None):
+        """创建一次检索的时间预算，未指定时使用配置的默认档位和该档位的默认预算"""
+        profile = profile or Config.SEARCH_DEFAULT_PROFILE
+        if time_budget_ms is None:
+            time_budget_ms = Config.SEARCH_PROFILE_BUDGETS_MS.get(profile)
+        return SearchBudget(profile, time_budget_ms)
+    
+    def search_many(self, queries, threshold=0.1, max_results=5, target_documents=None, nprobe=None, ef_search=None,
+                    profile=None, time_budget_ms=None):
+        """批量检索，返回与 queries 一一对应的结果列表，每个结果与 search() 相同
+
+        全部查询统一预处理后，语义部分一次编码、一次多行向量检索，BM25以一次稀疏矩阵乘法算出；
+        time_budget_ms 是整批查询共用的时间预算
+        """
+        budget = self._search_budget(profile, time_budget_ms)
+        queries = [' '.join(query.split()) for query in queries]
+        generation = self.generation
+        results = [None] * len(queries)
+        pending = {}  # 未命中缓存的查询 -> 在输入中的位置
+        for position, query in enumerate(queries):
+            cache_key = self._search_cache_key(query, threshold, max_results, target_documents, nprobe, ef_search,
+                                               budget)
+            cached = self.result_cache.get(cache_key, generation) if self.result_cache.enabled else None
+            if cached is not None:
+                results[position] = cached
+            else:
+                pending.setdefault(query, []).append(position)
+        
+        if pending and self.documents:
+            prepared_queries = [prepared for prepared in (self._prepare_query(query, target_documents, budget.fork())
+                                                          for query in pending) if prepared is not None]
+            
+            # 语义分支（一次编码、一次多行向量检索）与词法分支（一次稀疏矩阵乘法）并行执行
+            branches = {'lexical': (lambda: self._lexical_branch_many(prepared_queries, threshold),
+                                    Config.LEXICAL_BRANCH_TIMEOUT,
+                                    [self._empty_lexical_signals(prepared) for prepared in prepared_queries])}
+            if prepared_queries and self._semantic_search_ready(budget) and budget.allows('semantic'):
+                branches['semantic'] = (
+                    lambda: self._semantic_search_many(
+                        [prepared['query'] for prepared in prepared_queries], k=max_results * 2,
+                        nprobe=nprobe, ef_search=ef_search,
+                        document_ids_list=[prepared['search_scope'] or None for prepared in prepared_queries]
+                    ),
+                    budget.timeout(Config.SEMANTIC_BRANCH_TIMEOUT),
+                    [[] for _ in prepared_queries]
+                )
+            batch_info = {}
+            branch_results = self._run_branches(branches, batch_info)
+            if 'semantic' in batch_info.get('timed_out_branches', []):
+                budget.skip('semantic', 'deadline' if budget.expired() else 'timeout')
+            semantic_results = branch_results.get('semantic', [[] for _ in prepared_queries])
+            if 'semantic' in branches:
+                print(f"批量语义搜索完成，共 {len(prepared_queries)} 个查询")
+            for prepared in prepared_queries:
+                prepared['search_info'].update(batch_info)
+                for stage, reason in budget.skipped.items():
+                    prepared['budget'].skip(stage, reason)
+            
+            for prepared, query_semantic, lexical_signals in zip(prepared_queries, semantic_results,
+                                                                 branch_results['lexical']):
+                query_results = self._score_prepared_query(prepared, threshold, max_results,
+                                                           query_semantic, lexical_signals)
+                if not prepared['budget'].degraded:
+                    cache_key = self._search_cache_key(prepared['query'], threshold, max_results,
+                                                       target_documents, nprobe, ef_search, budget)
+                    self.result_cache.put(cache_key, generation, query_results)
+                positions = pending[prepared['query']]
+                results[positions[0]] = query_results
+                for position in positions[1:]:
+                    results[position] = copy.deepcopy(query_results)
+        
+        return [result if result is not None else [] for result in results]
+    
+    def _lexical_branch_many(self, prepared_queries, threshold):
+        """批量词法分支：全局查询的文档级和块级BM25各以一次稀疏矩阵乘法算出，其余信号逐个查询计算"""
+        global_terms = [prepared['query_terms'] if not prepared['search_scope'] else []
+                        for prepared in prepared_queries]
+        with self.lexical_index_lock.read():
+            bm25_results = self.bm25_scorer.score_many(global_terms,
+                                                       min_score=self._relaxed_thresholds(threshold)[-1])
+            chunk_results = self.chunk_bm25_scorer.score_many(global_terms)
+        return [self._lexical_branch(prepared, bm25_scores,
+                                     chunk_scores if not prepared['search_scope'] else None)
+                for prepared, bm25_scores, chunk_scores in zip(prepared_queries, bm25_results, chunk_results)]
+    
+    def _search_cache_key(self, query, threshold, max_results, target_documents, nprobe, ef_search, budget):
+        """检索结果缓存的键（查询需已规范化空白）"""
+        return (query, max_results,
+                tuple(sorted(target_documents)) if target_documents else None,
+                threshold, nprobe, ef_search, budget.profile, budget.time_budget_ms)
+    
+    def _search_uncached(self, query, threshold=0.1, max_results=5, target_documents=None,
+                         nprobe=None, ef_search=None, budget=None):
+        """执行一次完整的混合检索（不经过结果缓存）"""
         if not self.documents:
             return []
         
+        budget = budget or self._search_budget()
+        prepared = self._prepare_query(query, target_documents, budget)
+        if prepared is None:
+            return []
+        
+        # 4. 语义分支与词法分支相互独立：两者都启用时在线程池中并行执行，各自有超时
+        branches = {'lexical': (lambda: self._lexical_branch(prepared),
+                                Config.LEXICAL_BRANCH_TIMEOUT, self._empty_lexical_signals(prepared))}
+        if self._semantic_search_ready(budget) and budget.allows('semantic'):
+            branches['semantic'] = (lambda: self._semantic_branch(prepared, max_results, nprobe, ef_search),
+                                    budget.timeout(Config.SEMANTIC_BRANCH_TIMEOUT), [])
+        branch_results = self._run_branches(branches, prepared['search_info'])
+        if 'semantic' in prepared['search_info'].get('timed_out_branches', []):
+            budget.skip('semantic', 'deadline' if budget.expired() else 'timeout')
+        
+        return self._score_prepared_query(prepared, threshold, max_results,
+                                          branch_results.get('semantic', []), branch_results['lexical'])
+    
+    def _semantic_search_ready(self, budget):
+        """语义分支能否参与本次检索；启动时的后台初始化完成前跳过（记为 initializing，降级结果不缓存）"""
+        if not EMBEDDING_AVAILABLE:
+            return False
+        if not self.semantic_ready:
+            if not self.semantic_initialized.is_set() and budget.stages['semantic']:
+                budget.skip('semantic', 'initializing')
+            return False
+        return self.embedding_model is not None and bool(self.embedding_index)
+    
+    def _semantic_branch(self, prepared, max_results, nprobe=None, ef_search=None):
+        """语义分支：向量检索，针对特定文档的搜索只在目标文档的块中检索"""
+        semantic_results = self._semantic_search(prepared['query'], k=max_results * 2,
+                                                 nprobe=nprobe, ef_search=ef_search,
+                                                 document_ids=prepared['search_scope'] or None)
+        print(f"语义搜索找到 {len(semantic_results)} 个结果")
+        return semantic_results
+    
+    def _lexical_branch(self, prepared, bm25_scores=None, chunk_scores=None):
+        """词法分支：BM25分数（只在全局搜索模式）、块级BM25分数、关键词的倒排命中和短语候选文档
+        
+        bm25_scores/chunk_scores 已由批量检索算好时直接使用；返回的BM25分数未经阈值过滤，
+        块级分数按文档分组为 {文档ID: [(块ID, 分数)]}（分数降序），用于选取片段和按块融合
+        """
+        # 分词不读索引，在锁外进行
+        phrase_terms = set(self._tokenize_for_index(prepared['query']))
+        with self.lexical_index_lock.read():
+            if bm25_scores is None:
+                bm25_scores = {}
+                if prepared['query_terms'] and not prepared['search_scope']:
+                    # 只遍历查询词的倒排列表
+                    bm25_scores = self.bm25_scorer.score(prepared['query_terms'])
+            if chunk_scores is None:
+                chunk_scores = {}
+                if prepared['query_terms']:
+                    scope_chunk_ids = None
+                    if prepared['search_scope']:
+                        scope_chunk_ids = {chunk_id for doc_id in prepared['search_scope']
+                                           for chunk_id in range(*self.document_chunk_ranges.get(doc_id, (0, 0)))}
+                    chunk_scores = self.chunk_bm25_scorer.score(prepared['query_terms'], scope_chunk_ids)
+            chunk_owners = [(chunk_id, score, self.chunk_documents.get(chunk_id))
+                            for chunk_id, score in chunk_scores.items()]
+            keyword_matches = self._match_keywords_in_index(prepared['query_keywords'], prepared['budget'])
+            phrase_candidates = self._phrase_candidate_documents(phrase_terms)
+        
+        document_chunks = {}
+        for chunk_id, score, doc_id in chunk_owners:
+            if doc_id is not None:
+                document_chunks.setdefault(doc_id, []).append((chunk_id, score))
+        for scored_chunks in document_chunks.values():
+            scored_chunks.sort(key=lambda item: (-item[1], item[0]))
+        
+        return {
+            'bm25_scores': bm25_scores,
+            'document_chunks': document_chunks,
+            'keyword_matches': keyword_matches,
+            'phrase_candidates': phrase_candidates
+        }
+        
+    def _empty_lexical_signals(self, prepared):
+        """词法分支超时或失败时使用的空结果"""
+        return {
+            'bm25_scores': {},
+            'document_chunks': {},
+            'keyword_matches': {keyword.lower(): (set(), {}) for keyword in prepared['query_keywords']},
+            'phrase_candidates': set()
+        }
+    
+    def _run_branches(self, branches, search_info=None):
+        """执行相互独立的检索分支 {名称: (函数, 超时秒数, 超时或失败时的默认值)}，返回 {名称: 结果}
+        
+        只有一个分支时在当前线程中直接执行；多个分支提交到共享线程池并行执行，
+        超时的分支记录在 search_info['timed_out_branches'] 中（后台任务继续运行，结果被丢弃）
+        """
+        if len(branches) == 1:
+            name, (func, _, default) = next(iter(branches.items()))
+            try:
+                return {name: func()}
+            except Exception as e:
+                print(f"{name}检索分支失败: {e}")
+                return {name: default}
+        
+        started = time.monotonic()
+        futures = {name: self.search_executor.submit(func) for name, (func, _, _) in branches.items()}
+        results = {}
+        timed_out = []
+        for name, future in futures.items():
+            _, timeout, default = branches[name]
+            try:
+                results[name] = future.result(timeout=max(0, started + timeout - time.monotonic()))
+            except FuturesTimeoutError:
+                print(f"{name}检索分支超时（{timeout}秒），跳过该分支")
+                timed_out.append(name)
+                results[name] = default
+            except Exception as e:
+                print(f"{name}检索分支失败: {e}")
+                results[name] = default
+        if timed_out and search_info is not None:
+            search_info['timed_out_branches'] = timed_out
+        return results
+    
+    def _prepare_query(self, query, target_documents=None, budget=None):
+        """查询分析：检测目标文档、预处理查询、确定检索范围，没有可检索的文档时返回None"""
         # 1. 检测查询中是否指向特定文档
         detected_files, confidence_scores = self._detect_target_filename(query)
         
         # 如果检测到特定文档引用，限制搜索范围
         search_scope = target_documents or detected_files
         
-        results = []
-        
         # 2. 预处理查询
         processed_query = self._preprocess_text(query)
         query_keywords = self._extract_keywords(query)
@@ -626,7 +1742,7 @@ class KnowledgeBase:
                 'search_mode': 'targeted',
                 'target_files': [doc['filename'] for doc in documents_to_search],
                 'detection_confidence': confidence_scores,
-                'semantic_enabled': EMBEDDING_AVAILABLE and self.embedding_model is not None
+                'semantic_enabled': self.semantic_ready
             }
         else:
             # 在所有文档中搜索
@@ -635,154 +1751,256 @@ class KnowledgeBase:
                 'search_mode': 'global',
                 'target_files': [],
                 'detection_confidence': {},
-                'semantic_enabled': EMBEDDING_AVAILABLE and self.embedding_model is not None
+                'semantic_enabled': self.semantic_ready
             }
         
         if not documents_to_search:
-            return []
-        
-        # 4. 语义搜索（如果可用）
-        semantic_results = []
-        if EMBEDDING_AVAILABLE and self.embedding_model and self.embedding_index:
-            try:
-                semantic_results = self._semantic_search(query, k=max_results * 2)
-                
-                # 如果是针对特定文档的搜索，过滤语义结果
-                if search_scope:
-                    semantic_results = [r for r in semantic_results 
-                                      if r['document_id'] in search_scope]
-                
-                print(f"语义搜索找到 {len(semantic_results)} 个结果")
-            except Exception as e:
-                print(f"语义搜索失败: {e}")
-                semantic_results = []
+            return None
+        
+        return {
+            'query': query,
+            'search_scope': search_scope,
+            'confidence_scores': confidence_scores,
+            'query_keywords': query_keywords,
+            'query_terms': [term.lower() for term in processed_query.split()] if processed_query else [],
+            'documents_to_search': documents_to_search,
+            'search_info': search_info,
+            'budget': budget or self._search_budget()
+        }
+    
+    def _score_prepared_query(self, prepared, threshold, max_results, semantic_results, lexical_signals):
+        """关键词打分与结果融合，lexical_signals 为词法分支的结果"""
+        query = prepared['query']
+        search_scope = prepared['search_scope']
+        confidence_scores = prepared['confidence_scores']
+        query_keywords = prepared['query_keywords']
+        documents_to_search = prepared['documents_to_search']
+        search_info = prepared['search_info']
+        budget = prepared['budget']
+        results = []
         
         # 5. 传统关键词搜索（作为备选和补充）
-        keyword_results = []
+        # 没有语义结果的全局搜索在无结果时逐级降低阈值；各项分数只计算一次，放宽阈值只是重新筛选
+        if search_scope or semantic_results:
+            thresholds = [threshold]
+        else:
+            thresholds = self._relaxed_thresholds(threshold)
+        min_threshold = thresholds[-1]
         
-        # TF-IDF向量搜索（如果可用且在全局搜索模式）
-        tfidf_scores = {}
-        if self.tfidf_matrix is not None and processed_query and not search_scope:
-            try:
-                query_vector = self.tfidf_vectorizer.transform([processed_query])
-                similarities = cosine_similarity(query_vector, self.tfidf_matrix).flatten()
-                
-                for i, score in enumerate(similarities):
-                    if score > threshold and i < len(self.documents):
-                        tfidf_scores[self.documents[i]['id']] = score
-            except:
-                pass
+        bm25_scores = {doc_id: score for doc_id, score in lexical_signals['bm25_scores'].items()
+                       if score > min_threshold}
         
-        # 计算关键词匹配分数
-        for doc in documents_to_search:
-            total_score = 0
-            
-            # TF-IDF分数（只在全局搜索时使用）
-            tfidf_score = tfidf_scores.get(doc['id'], 0) if not search_scope else 0
-            total_score += tfidf_score * 2  # 降低TF-IDF权重
+        # 利用倒排索引确定候选文档：只有命中查询词（精确或模糊）的文档才需要打分
+        keyword_matches = lexical_signals['keyword_matches']
+        phrase_candidates = lexical_signals['phrase_candidates']
+        document_chunks = lexical_signals['document_chunks']
+        if search_scope:
+            candidate_ids = {doc['id'] for doc in documents_to_search}
+        else:
+            candidate_ids = set(bm25_scores) | phrase_candidates
+            for exact_ids, fuzzy_scores in keyword_matches.values():
+                candidate_ids.update(exact_ids)
+                candidate_ids.update(fuzzy_scores)
+        
+        # 第一阶段：只用倒排索引上的廉价信号（BM25、关键词命中）为候选文档打分
+        scored_documents = []  # (文档, BM25分数, 关键词分数, 目标文档加分)
+        for doc_id in sorted(candidate_ids):
+            doc = self.documents_by_id.get(doc_id)
+            if doc is None:
+                continue
             
             # 关键词匹配分数
-            keyword_score = self._calculate_keyword_match_score(query_keywords, doc['content'])
-            total_score += keyword_score * 1.5  # 调整关键词匹配权重
+            keyword_score = self._calculate_keyword_match_score(query_keywords, doc['id'], keyword_matches)
             
-            # 简单文本匹配分数（兜底方案）
-            query_lower = query.lower()
-            content_lower = doc['content'].lower()
-            if query_lower in content_lower:
-                total_score += len(re.findall(re.escape(query_lower), content_lower)) * 0.3
-            
-            # 如果是针对特定文档的搜索，降低阈值并给予额外分数
+            # 如果是针对特定文档的搜索，给予额外分数
+            target_bonus = 0
             if search_scope and doc['id'] in search_scope:
-                total_score += confidence_scores.get(doc['id'], 0) * 0.1
-                effective_threshold = threshold * 0.3
-            else:
-                effective_threshold = threshold
+                target_bonus = confidence_scores.get(doc['id'], 0) * 0.1
             
-            # 如果总分数超过阈值，添加到关键词结果
-            if total_score > effective_threshold:
-                relevant_snippets = self._extract_relevant_snippets(
-                    doc['content'], 
-                    query_keywords + [query],
-                    max_snippets=2
-                )
+            # BM25分数（只在全局搜索时使用）
+            scored_documents.append((doc, bm25_scores.get(doc['id'], 0), keyword_score, target_bonus))
+        
+        # 截断为有限的候选集（稀疏得分前N个 + 语义检索命中的文档），后续的精细打分只在候选集上进行
+        scored_documents = self._select_candidates(scored_documents, semantic_results,
+                                                   max(Config.SEARCH_CANDIDATE_COUNT, max_results))
+        
+        # 第二阶段：简单文本匹配分数（兜底方案，正文只在需要时从文档存储读取）
+        query_lower = query.lower()
+        phrase_scores = {}
+        for doc, _, _, _ in scored_documents:
+            if doc['id'] in phrase_candidates:
+                content = self.document_store.get_content(doc['id'])
+                if content is None:
+                    # 检索期间文档已被删除
+                    continue
+                content_lower = content.lower()
+                if query_lower in content_lower:
+                    phrase_scores[doc['id']] = len(re.findall(re.escape(query_lower), content_lower)) * 0.3
+        
+        snippets_cache = {}  # 文档ID -> [(块ID, 片段文本)]，句子级片段的块ID为None
+        snippet_keywords = query_keywords + [query]
+        snippet_keyword_terms = self._tokenize_keywords(snippet_keywords)
+        for level, current_threshold in enumerate(thresholds):
+            if level > 0:
+                print("降低阈值重新搜索...")
+            keyword_results = []
+            for doc, raw_bm25_score, keyword_score, target_bonus in scored_documents:
+                bm25_score = raw_bm25_score if raw_bm25_score > current_threshold else 0
+                total_score = bm25_score * 2  # 降低BM25权重
+                total_score += keyword_score * 1.5  # 调整关键词匹配权重
+                total_score += phrase_scores.get(doc['id'], 0)
+                total_score += target_bonus
                 
-                if relevant_snippets:
-                    keyword_results.append({
-                        'document_id': doc['id'],
-                        'filename': doc['filename'],
-                        'content': '\n'.join(relevant_snippets),
-                        'score': total_score,
-                        'tfidf_score': tfidf_score,
-                        'keyword_score': keyword_score,
-                        'matched_keywords': query_keywords,
-                        'search_info': search_info,
-                        'file_match_confidence': confidence_scores.get(doc['id'], 0)
-                    })
+                # 针对特定文档的搜索降低阈值
+                if search_scope and doc['id'] in search_scope:
+                    effective_threshold = current_threshold * 0.3
+                else:
+                    effective_threshold = current_threshold
+                
+                # 如果总分数超过阈值，添加到关键词结果
+                if total_score > effective_threshold:
+                    if doc['id'] not in snippets_cache:
+                        if not budget.allows('snippets'):
+                            # 跳过片段抽取时使用文档开头的句子
+                            snippets_cache[doc['id']] = [
+                                (None, snippet) for snippet in self._document_excerpt(doc['id'], max_snippets=2)]
+                        elif doc['id'] in document_chunks:
+                            # 片段直接取块级BM25得分最高的块
+                            snippets_cache[doc['id']] = self._chunk_snippets(document_chunks[doc['id']],
+                                                                             max_snippets=2)
+                        else:
+                            # 只有模糊匹配或目标文档命中时没有得分的块，从句子中抽取片段
+                            snippets_cache[doc['id']] = [(None, snippet) for snippet in self._extract_relevant_snippets(
+                                doc['id'], 
+                                snippet_keywords,
+                                max_snippets=2,
+                                keyword_terms=snippet_keyword_terms
+                            )]
+                    relevant_snippets = snippets_cache[doc['id']]
+                    
+                    if relevant_snippets:
+                        keyword_results.append({
+                            'document_id': doc['id'],
+                            'filename': doc['filename'],
+                            'content': '\n'.join(snippet for _, snippet in relevant_snippets),
+                            'chunk_ids': [chunk_id for chunk_id, _ in relevant_snippets if chunk_id is not None],
+                            'score': total_score,
+                            'bm25_score': bm25_score,
+                            'keyword_score': keyword_score,
+                            'matched_keywords': query_keywords,
+                            'search_info': search_info,
+                            'file_match_confidence': confidence_scores.get(doc['id'], 0)
+                        })
+            if keyword_results:
+                break
         
         # 6. 结果融合和重排序
-        if semantic_results and keyword_results:
+        if semantic_results and keyword_results and budget.allows('rerank'):
             # 使用重排序算法融合结果
             try:
-                results = self._rerank_results(query, semantic_results, keyword_results)
+                chunk_texts = {chunk_id: snippet for snippets in snippets_cache.values()
+                               for chunk_id, snippet in snippets if chunk_id is not None}
+                results = self._rerank_results(query, semantic_results, keyword_results, chunk_texts)
                 for result in results:
                     result['search_info'] = search_info
                 print(f"重排序后得到 {len(results)} 个结果")
             except Exception as e:
                 print(f"重排序失败，使用关键词结果: {e}")
                 results = keyword_results
-                
+        
+        elif semantic_results and keyword_results:
+            # 跳过重排序：以关键词结果为主，补充只被语义检索命中的文档
+            keyword_ids = {result['document_id'] for result in keyword_results}
+            results = keyword_results + [
+                result for result in self._semantic_document_results(semantic_results, search_info,
+                                                                     confidence_scores)
+                if result['document_id'] not in keyword_ids
+            ]
+            
         elif semantic_results:
             # 只有语义搜索结果
             print("只使用语义搜索结果")
-            doc_results = {}
-            for sem_result in semantic_results:
-                doc_id = sem_result['document_id']
-                if doc_id not in doc_results:
-                    doc_results[doc_id] = {
-                        'document_id': doc_id,
-                        'filename': sem_result['filename'],
-                        'content': sem_result['text'],
-                        'score': sem_result['semantic_score'],
-                        'semantic_score': sem_result['semantic_score'],
-                        'keyword_score': 0,
-                        'search_info': search_info,
-                        'file_match_confidence': confidence_scores.get(doc_id, 0)
-                    }
-                else:
-                    # 合并多个语义块
-                    doc_results[doc_id]['content'] += '\n\n' + sem_result['text']
-                    doc_results[doc_id]['score'] = max(doc_results[doc_id]['score'], 
-                                                     sem_result['semantic_score'])
-            
-            results = list(doc_results.values())
-            results.sort(key=lambda x: x['score'], reverse=True)
+            results = self._semantic_document_results(semantic_results, search_info, confidence_scores)
             
         else:
             # 只有关键词搜索结果
             print("只使用关键词搜索结果")
             results = keyword_results
         
-        # 7. 如果没有找到结果且不是针对特定文档的搜索，降低阈值重新搜索
-        if not results and not search_scope and threshold > 0.05:
-            print("降低阈值重新搜索...")
-            return self.search(query, threshold=threshold * 0.5, max_results=max_results)
-        
-        # 8. 按综合分数排序并返回结果
+        # 7. 按综合分数排序并返回结果
         if not any('reranked' in result for result in results):
             results.sort(key=lambda x: x['score'], reverse=True)
         
+        search_info.update(budget.report())
         return results[:max_results]
     
+    def _semantic_document_results(self, semantic_results, search_info, confidence_scores):
+        """把语义检索的块结果按文档合并，按分数降序返回"""
+        doc_results = {}
+        for sem_result in semantic_results:
+            doc_id = sem_result['document_id']
+            if doc_id not in doc_results:
+                doc_results[doc_id] = {
+                    'document_id': doc_id,
+                    'filename': sem_result['filename'],
+                    'content': sem_result['text'],
+                    'chunk_ids': [sem_result['chunk_index']],
+                    'score': sem_result['semantic_score'],
+                    'semantic_score': sem_result['semantic_score'],
+                    'keyword_score': 0,
+                    'search_info': search_info,
+                    'file_match_confidence': confidence_scores.get(doc_id, 0)
+                }
+            else:
+                # 合并多个语义块
+                doc_results[doc_id]['content'] += '\n\n' + sem_result['text']
+                doc_results[doc_id]['chunk_ids'].append(sem_result['chunk_index'])
+                doc_results[doc_id]['score'] = max(doc_results[doc_id]['score'], 
+                                                 sem_result['semantic_score'])
+        
+        results = list(doc_results.values())
+        results.sort(key=lambda x: x['score'], reverse=True)
+        return results
+    
+    def _select_candidates(self, scored_documents, semantic_results, limit):
+        """候选生成：保留稀疏得分最高的limit个文档，以及语义检索命中的文档，按文档ID顺序返回"""
+        if len(scored_documents) <= limit:
+            return scored_documents
+        
+        dense_ids = {result['document_id'] for result in semantic_results}
+        ranked = sorted(scored_documents,
+                        key=lambda entry: (-(entry[1] * 2 + entry[2] * 1.5 + entry[3]), entry[0]['id']))
+        selected = ranked[:limit] + [entry for entry in ranked[limit:] if entry[0]['id'] in dense_ids]
+        selected.sort(key=lambda entry: entry[0]['id'])
+        return selected
+    
+    def _relaxed_thresholds(self, threshold, min_threshold=0.05):
+        """无结果时依次尝试的阈值：每级减半，直到不高于最低阈值"""
+        thresholds = [threshold]
+        while thresholds[-1] > min_threshold:
+            thresholds.append(thresholds[-1] * 0.5)
+        return thresholds
+    
     def _keyword_search(self, query, max_results=5):
         """纯关键词搜索方法，供对比使用"""
         results = []
         query_keywords = self._extract_keywords(query)
+        with self.lexical_index_lock.read():
+            keyword_matches = self._match_keywords_in_index(query_keywords)
         
-        for doc in self.documents:
-            score = self._calculate_keyword_match_score(query_keywords, doc['content'])
+        candidate_ids = set()
+        for exact_ids, fuzzy_scores in keyword_matches.values():
+            candidate_ids.update(exact_ids)
+            candidate_ids.update(fuzzy_scores)
+        
+        for doc_id in sorted(candidate_ids):
+            doc = self.documents_by_id.get(doc_id)
+            if doc is None:
+                continue
+            score = self._calculate_keyword_match_score(query_keywords, doc_id, keyword_matches)
             if score > 0.1:
                 relevant_snippets = self._extract_relevant_snippets(
-                    doc['content'], query_keywords, max_snippets=2
+                    doc_id, query_keywords, max_snippets=2
                 )
                 if relevant_snippets:
                     results.append({
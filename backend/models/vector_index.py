@@ -0,0 +1,432 @@
+"""
+向量索引模块
+对FAISS索引的统一封装：暴力检索(flat)、IVF-Flat、IVF-PQ 和 HNSW，按块ID增删；
+没有安装faiss时使用纯NumPy的分块暴力检索(numpy)，接口相同。
+向量的存储精度（float32 / float16 / int8标量量化 / pq乘积量化）与索引结构相互独立
+"""
+import math
+import numpy as np
+
+try:
+    import faiss
+    FAISS_AVAILABLE = True
+except ImportError:
+    FAISS_AVAILABLE = False
+
+FAISS_INDEX_TYPES = ('flat', 'ivf_flat', 'ivf_pq', 'hnsw')
+STORAGE_MODES = ('float32', 'float16', 'int8', 'pq')
+NUMPY_STORAGE_MODES = ('float32', 'float16', 'int8')
+
+# 标量量化存储对应的FAISS量化类型
+SCALAR_QUANTIZER_TYPES = {'float16': 'QT_fp16', 'int8': 'QT_8bit'}
+
+# 量化存储（int8/pq）的训练样本少于此数时随数据增长重新训练（每个PQ中心约39个样本）：
+# 量化范围和码本只反映训练样本，小样本上训练后新增的向量误差很大
+MIN_QUANTIZER_TRAIN_COUNT = 39 * 256
+
+
+# 自动选择时各类型适用的块数上限（不含），超过最后一档一律使用 IVF-PQ
+AUTO_INDEX_LIMITS = (('flat', 50000), ('ivf_flat', 1000000), ('ivf_pq', None))
+
+
+def choose_index_type(num_vectors, current_type=None):
+    """按向量数量自动选择索引类型
+
+    数量回落到阈值附近（80%以内）时保持当前类型，避免在阈值上下反复重建
+    """
+    order = [index_type for index_type, _ in AUTO_INDEX_LIMITS]
+    for index_type, limit in AUTO_INDEX_LIMITS:
+        if limit is None or num_vectors < limit:
+            break
+    if (current_type in order and order.index(current_type) > order.index(index_type)
+            and num_vectors >= 0.8 * limit):
+        return current_type
+    return index_type
+
+
+def default_nlist(num_vectors):
+    """IVF聚类中心数量：约 4*sqrt(N)"""
+    return int(min(65536, max(1, 4 * math.sqrt(max(num_vectors, 1)))))
+
+
+def default_pq_m(dimension):
+    """PQ子量化器数量：取不超过 d/4 且能整除维度的最大值（每个向量压缩为 d/4 字节）"""
+    for m in range(max(dimension // 4, 1), 0, -1):
+        if dimension % m == 0:
+            return m
+    return 1
+
+
+class VectorIndex:
+    """内积相似度向量索引，外部ID为块ID
+
+    - flat/hnsw 通过 IndexIDMap2 映射块ID；ivf_* 直接使用IVF自带的ID
+    - HNSW 不支持物理删除，删除的ID记为墓碑，在检索时通过ID选择器过滤
+    - storage 决定向量编码：float32 原样保存，float16/int8 为标量量化，pq 为乘积量化；ivf_pq 固定为 pq
+    """
+
+    def __init__(self, dimension, index_type='flat', nlist=None, pq_m=None, pq_nbits=8, hnsw_m=32,
+                 nprobe=16, ef_search=64, storage='float32'):
+        if index_type not in FAISS_INDEX_TYPES:
+            raise ValueError(f"未知的索引类型: {index_type}")
+        if storage not in STORAGE_MODES:
+            raise ValueError(f"未知的向量存储模式: {storage}")
+        self.dimension = dimension
+        self.index_type = index_type
+        self.storage = 'pq' if index_type == 'ivf_pq' else storage
+        self.nlist = nlist or 1
+        self.pq_m = pq_m or default_pq_m(dimension)
+        self.pq_nbits = pq_nbits
+        self.hnsw_m = hnsw_m
+        self.nprobe = nprobe
+        self.ef_search = ef_search
+        self.trained_count = 0  # 训练IVF时使用的样本数
+        self.deleted_ids = set()  # HNSW墓碑
+        self.index = self._create_index()
+
+    def _create_index(self):
+        d = self.dimension
+        metric = faiss.METRIC_INNER_PRODUCT
+        sq_type = (getattr(faiss.ScalarQuantizer, SCALAR_QUANTIZER_TYPES[self.storage])
+                   if self.storage in SCALAR_QUANTIZER_TYPES else None)
+        if self.index_type == 'flat':
+            if self.storage == 'pq':
+                return faiss.IndexIDMap2(faiss.IndexPQ(d, self.pq_m, self.pq_nbits, metric))
+            if sq_type is not None:
+                return faiss.IndexIDMap2(faiss.IndexScalarQuantizer(d, sq_type, metric))
+            return faiss.IndexIDMap2(faiss.IndexFlatIP(d))
+        if self.index_type == 'hnsw':
+            if self.storage == 'pq':
+                hnsw = faiss.IndexHNSWPQ(d, self.pq_m, self.hnsw_m, self.pq_nbits, metric)
+            elif sq_type is not None:
+                hnsw = faiss.IndexHNSWSQ(d, sq_type, self.hnsw_m, metric)
+            else:
+                hnsw = faiss.IndexHNSWFlat(d, self.hnsw_m, metric)
+            return faiss.IndexIDMap2(hnsw)
+        quantizer = faiss.IndexFlatIP(d)
+        if self.storage == 'pq':
+            return faiss.IndexIVFPQ(quantizer, d, self.nlist, self.pq_m, self.pq_nbits, metric)
+        if sq_type is not None:
+            return faiss.IndexIVFScalarQuantizer(quantizer, d, self.nlist, sq_type, metric)
+        return faiss.IndexIVFFlat(quantizer, d, self.nlist, metric)
+
+    @property
+    def is_trained(self):
+        return self.index.is_trained
+
+    def train(self, sample):
+        """在样本上训练（IVF类型和int8/pq存储需要），聚类中心数和PQ码本大小不超过样本数"""
+        sample = np.ascontiguousarray(sample, dtype='float32')
+        nlist = max(1, min(self.nlist, len(sample))) if self.index_type.startswith('ivf') else self.nlist
+        pq_nbits = (min(self.pq_nbits, max(1, int(math.log2(len(sample)))))
+                    if self.storage == 'pq' else self.pq_nbits)
+        if (nlist, pq_nbits) != (self.nlist, self.pq_nbits):
+            self.nlist, self.pq_nbits = nlist, pq_nbits
+            self.index = self._create_index()
+        self.index.train(sample)
+        self.trained_count = len(sample)
+
+    def add(self, vectors, ids):
+        vectors = np.ascontiguousarray(vectors, dtype='float32')
+        ids = np.asarray(ids, dtype='int64')
+        if not self.is_trained:
+            self.train(vectors)
+        self.index.add_with_ids(vectors, ids)
+        if self.deleted_ids:
+            self.deleted_ids.difference_update(ids.tolist())
+
+    def remove_range(self, start, end):
+        """删除 [start, end) 区间内的块ID，返回删除数量"""
+        if self.index_type == 'hnsw':
+            # HNSW 不支持物理删除，区间与ID映射求交后记为墓碑（在 numpy 中过滤，不构造全量ID集合）
+            ids = self.ids()
+            removed = set(ids[(ids >= start) & (ids < end)].tolist()) - self.deleted_ids
+            self.deleted_ids.update(removed)
+            return len(removed)
+        return self.index.remove_ids(faiss.IDSelectorRange(start, end))
+
+    def ids(self):
+        """索引中（含墓碑）的全部块ID"""
+        if self.index_type in ('flat', 'hnsw'):
+            return faiss.vector_to_array(self.index.id_map).astype('int64')
+        invlists = self.index.invlists
+        ids = [faiss.rev_swig_ptr(invlists.get_ids(list_no), invlists.list_size(list_no)).copy()
+               for list_no in range(self.index.nlist) if invlists.list_size(list_no)]
+        return np.concatenate(ids).astype('int64') if ids else np.zeros(0, dtype='int64')
+
+    def _search_params(self, nprobe=None, ef_search=None, selector=None):
+        kwargs = {}
+        if selector is not None:
+            kwargs['sel'] = selector
+        if self.index_type.startswith('ivf'):
+            return faiss.SearchParametersIVF(nprobe=min(nprobe or self.nprobe, self.index.nlist), **kwargs)
+        if self.index_type == 'hnsw':
+            return faiss.SearchParametersHNSW(efSearch=ef_search or self.ef_search, **kwargs)
+        return faiss.SearchParameters(**kwargs) if kwargs else None
+
+    def search(self, queries, k, nprobe=None, ef_search=None):
+        """检索最相似的k个块，返回 (分数矩阵, 块ID矩阵)，不足k个时以-1补齐"""
+        queries = np.ascontiguousarray(queries, dtype='float32')
+        selector = None
+        if self.deleted_ids:
+            selector = faiss.IDSelectorNot(
+                faiss.IDSelectorBatch(np.fromiter(self.deleted_ids, dtype='int64')))
+        params = self._search_params(nprobe, ef_search, selector)
+        if params is None:
+            return self.index.search(queries, k)
+        return self.index.search(queries, k, params=params)
+
+    @property
+    def ntotal(self):
+        return self.index.ntotal - len(self.deleted_ids)
+
+    def __len__(self):
+        return self.ntotal
+
+    def needs_rebuild(self):
+        """墓碑过多，或IVF/量化器的训练样本相对数据量过少时需要重建"""
+        if self.deleted_ids and len(self.deleted_ids) > 0.2 * max(self.index.ntotal, 1):
+            return True
+        if not self.trained_count:
+            return False
+        if self.trained_count < MIN_QUANTIZER_TRAIN_COUNT:
+            # 训练样本不足时，数据量翻倍后重新训练：int8 的各维取值范围（超出范围的分量会被截断）、
+            # pq 的逐段码本都随样本增多而更准确；不在每次新增后重训，避免每次上传都触发全量重建
+            if self.storage in ('int8', 'pq') and self.ntotal > 2 * self.trained_count:
+                return True
+        if self.index_type.startswith('ivf'):
+            return self.ntotal > 8 * self.trained_count and self.trained_count < default_nlist(self.ntotal) * 39
+        return False
+
+    def memory_usage(self):
+        """索引占用的字节数（按序列化大小估算，含块ID映射、图结构和码本）"""
+        return int(faiss.serialize_index(self.index).nbytes)
+
+    def get_config(self):
+        """持久化时保存的索引配置"""
+        return {
+            'index_type': self.index_type,
+            'dimension': self.dimension,
+            'storage': self.storage,
+            'nlist': self.nlist,
+            'pq_m': self.pq_m,
+            'pq_nbits': self.pq_nbits,
+            'hnsw_m': self.hnsw_m,
+            'trained_count': self.trained_count,
+            'deleted_ids': sorted(self.deleted_ids)
+        }
+
+    def save(self, path):
+        faiss.write_index(self.index, path)
+
+    @classmethod
+    def load(cls, path, config, nprobe=16, ef_search=64):
+        """加载索引文件；旧版文件没有配置时视为flat索引"""
+        config = config or {}
+        raw_index = faiss.read_index(path)
+        index = cls.__new__(cls)
+        index.dimension = config.get('dimension', raw_index.d)
+        index.index_type = config.get('index_type', 'flat')
+        index.storage = config.get('storage', 'pq' if index.index_type == 'ivf_pq' else 'float32')
+        index.nlist = config.get('nlist', 1)
+        index.pq_m = config.get('pq_m', default_pq_m(index.dimension))
+        index.pq_nbits = config.get('pq_nbits', 8)
+        index.hnsw_m = config.get('hnsw_m', 32)
+        index.nprobe = nprobe
+        index.ef_search = ef_search
+        index.trained_count = config.get('trained_count', 0)
+        index.deleted_ids = set(config.get('deleted_ids', []))
+        index.index = raw_index
+        return index
+
+
+class NumpyVectorIndex:
+    """纯NumPy的暴力检索索引，接口与 VectorIndex 相同
+
+    向量按行保存在一块连续矩阵中（容量按倍数增长，追加时均摊O(1)）：float32 原样保存，
+    float16 减半，int8 为逐行对称标量量化（每行另存一个float32缩放系数）；
+    检索时按行分块转换为 float32 做矩阵乘法，每块用 argpartition 取前k个后再合并，内存占用与块大小成正比
+    """
+
+    index_type = 'numpy'
+
+    def __init__(self, dimension, storage='float32', block_size=65536, **kwargs):
+        if storage not in NUMPY_STORAGE_MODES:
+            raise ValueError(f"NumPy索引不支持的向量存储模式: {storage}")
+        self.dimension = dimension
+        self.storage = storage
+        self.block_size = block_size
+        self._vectors = np.zeros((0, dimension), dtype=storage)
+        self._scales = np.zeros(0, dtype='float32')
+        self._ids = np.zeros(0, dtype='int64')
+        self._size = 0
+
+    @property
+    def is_trained(self):
+        return True
+
+    def train(self, sample):
+        """暴力检索无需训练（int8逐行量化也不需要）"""
+
+    def _reserve(self, capacity):
+        if capacity <= len(self._vectors):
+            return
+        capacity = max(capacity, 2 * len(self._vectors), 1024)
+        vectors = np.zeros((capacity, self.dimension), dtype=self.storage)
+        scales = np.zeros(capacity, dtype='float32')
+        ids = np.zeros(capacity, dtype='int64')
+        vectors[:self._size] = self._vectors[:self._size]
+        scales[:self._size] = self._scales[:self._size]
+        ids[:self._size] = self._ids[:self._size]
+        self._vectors, self._scales, self._ids = vectors, scales, ids
+
+    def add(self, vectors, ids):
+        vectors = np.asarray(vectors, dtype='float32').reshape(-1, self.dimension)
+        ids = np.asarray(ids, dtype='int64')
+        self._reserve(self._size + len(ids))
+        rows = slice(self._size, self._size + len(ids))
+        if self.storage == 'int8':
+            scales = np.abs(vectors).max(axis=1) / 127.0
+            scales[scales == 0] = 1.0
+            self._vectors[rows] = np.rint(vectors / scales[:, None])
+            self._scales[rows] = scales
+        else:
+            self._vectors[rows] = vectors
+        self._ids[rows] = ids
+        self._size += len(ids)
+
+    def remove_range(self, start, end):
+        """删除 [start, end) 区间内的块ID，后面的行前移保持矩阵连续，返回删除数量"""
+        ids = self._ids[:self._size]
+        keep = (ids < start) | (ids >= end)
+        removed = self._size - int(keep.sum())
+        if removed:
+            self._size -= removed
+            self._vectors[:self._size] = self._vectors[:len(keep)][keep]
+            self._scales[:self._size] = self._scales[:len(keep)][keep]
+            self._ids[:self._size] = ids[keep]
+        return removed
+
+    def ids(self):
+        return self._ids[:self._size].copy()
+
+    def _block(self, start, end):
+        """第 [start, end) 行解码为 float32"""
+        block = self._vectors[start:end]
+        if self.storage == 'int8':
+            return block.astype('float32') * self._scales[start:end, None]
+        if block.dtype != np.float32:
+            return block.astype('float32')
+        return block
+
+    def search(self, queries, k, nprobe=None, ef_search=None):
+        """分块矩阵乘法 + argpartition 取前k个，返回与 VectorIndex.search 相同格式的 (分数矩阵, 块ID矩阵)"""
+        queries = np.ascontiguousarray(queries, dtype='float32')
+        best_scores = np.full((len(queries), k), -np.inf, dtype='float32')
+        best_ids = np.full((len(queries), k), -1, dtype='int64')
+        for start in range(0, self._size, self.block_size):
+            end = min(start + self.block_size, self._size)
+            scores, labels = exact_search(self._block(start, end), self._ids[start:end], queries, k)
+            best_scores, best_ids = merge_top_k(best_scores, best_ids, scores, labels, k)
+        return best_scores, best_ids
+
+    @property
+    def ntotal(self):
+        return self._size
+
+    def __len__(self):
+        return self._size
+
+    def needs_rebuild(self):
+        return False
+
+    def memory_usage(self):
+        """索引占用的字节数（不含预留的空闲容量）"""
+        per_row = self._vectors.itemsize * self.dimension + self._ids.itemsize
+        if self.storage == 'int8':
+            per_row += self._scales.itemsize
+        return per_row * self._size
+
+    def get_config(self):
+        """持久化时保存的索引配置"""
+        return {
+            'index_type': self.index_type,
+            'dimension': self.dimension,
+            'storage': self.storage
+        }
+
+    def save(self, path):
+        with open(path, 'wb') as f:
+            np.save(f, self._vectors[:self._size])
+            np.save(f, self._ids[:self._size])
+            np.save(f, self._scales[:self._size])
+
+    @classmethod
+    def load(cls, path, config, **kwargs):
+        with open(path, 'rb') as f:
+            vectors = np.load(f)
+            ids = np.load(f)
+            # 早期的文件没有缩放系数（只有float32/float16存储）
+            try:
+                scales = np.load(f)
+            except (EOFError, ValueError):
+                scales = np.ones(len(ids), dtype='float32')
+        index = cls(vectors.shape[1], storage=str(vectors.dtype))
+        index._vectors, index._scales, index._ids, index._size = vectors, scales, ids, len(ids)
+        return index
+
+
+def create_vector_index(dimension, index_type, storage='float32', **kwargs):
+    """按索引类型创建空索引：numpy 为纯NumPy暴力检索，其余为FAISS索引"""
+    if index_type == 'numpy':
+        return NumpyVectorIndex(dimension, storage=storage)
+    return VectorIndex(dimension, index_type, storage=storage, **kwargs)
+
+
+def load_vector_index(path, config, nprobe=16, ef_search=64, **kwargs):
+    """按持久化的索引配置加载索引"""
+    if (config or {}).get('index_type') == 'numpy':
+        return NumpyVectorIndex.load(path, config)
+    return VectorIndex.load(path, config, nprobe, ef_search)
+
+
+def merge_top_k(scores_a, ids_a, scores_b, ids_b, k):
+    """合并两组按行的检索结果，保留每行分数最高的k个（降序）"""
+    scores = np.concatenate([scores_a, scores_b], axis=1)
+    labels = np.concatenate([ids_a, ids_b], axis=1)
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    scores = np.take_along_axis(scores, top, axis=1)
+    labels = np.take_along_axis(labels, top, axis=1)
+    order = np.argsort(-scores, axis=1, kind='stable')
+    return np.take_along_axis(scores, order, axis=1), np.take_along_axis(labels, order, axis=1)
+
+
+def recall_at_k(found_ids, reference_ids):
+    """检索结果相对参考结果（精确检索）的平均召回率，忽略-1补位"""
+    recalls = []
+    for found, reference in zip(found_ids, reference_ids):
+        reference = set(reference[reference >= 0].tolist())
+        if reference:
+            recalls.append(len(reference & set(found.tolist())) / len(reference))
+    return float(np.mean(recalls)) if recalls else 1.0
+
+
+def exact_search(vectors, ids, queries, k):
+    """在给定的一小批向量上精确检索，返回与 VectorIndex.search 相同格式的 (分数矩阵, ID矩阵)"""
+    queries = np.ascontiguousarray(queries, dtype='float32')
+    scores = np.full((len(queries), k), -np.inf, dtype='float32')
+    labels = np.full((len(queries), k), -1, dtype='int64')
+    if vectors is None or len(vectors) == 0:
+        return scores, labels
+
+    similarities = queries @ vectors.T
+    top = min(k, len(ids))
+    if top < len(ids):
+        candidates = np.argpartition(-similarities, top - 1, axis=1)[:, :top]
+    else:
+        candidates = np.tile(np.arange(len(ids)), (len(queries), 1))
+    candidate_scores = np.take_along_axis(similarities, candidates, axis=1)
+    order = np.argsort(-candidate_scores, axis=1)
+    scores[:, :top] = np.take_along_axis(candidate_scores, order, axis=1)
+    labels[:, :top] = np.asarray(ids, dtype='int64')[np.take_along_axis(candidates, order, axis=1)]
+    return scores, labels
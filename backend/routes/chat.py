@@ -4,6 +4,7 @@
 from flask import Blueprint, request, jsonify
 from services.qianwen_service import call_qianwen_api
 from stage2_config import quality_assessor
+from services.search_budget import validate_budget_params
 
 # 创建Blueprint
 chat_bp = Blueprint('chat', __name__)
@@ -16,12 +17,18 @@ def init_chat_routes(kb):
         """聊天接口 - 支持智能文档检索 - 第二阶段RAG优化版本"""
         data = request.json
         user_message = data.get('message', '')
+        # 可选的检索速度档位（fast/balanced/thorough）和时间预算（毫秒）
+        profile = data.get('profile')
+        time_budget_ms = data.get('time_budget_ms')
         
         if not user_message:
             return jsonify({'error': '消息不能为空'}), 400
+        budget_error = validate_budget_params(profile, time_budget_ms)
+        if budget_error:
+            return jsonify({'error': budget_error}), 400
         
         # 先在知识库中搜索（会自动检测是否针对特定文档）
-        search_results = kb.search(user_message)
+        search_results = kb.search(user_message, profile=profile, time_budget_ms=time_budget_ms)
         
         if search_results:
             # 使用增强的上下文质量优化
@@ -167,7 +167,9 @@ def init_document_routes(kb):
                     'filename': original_filename,
                     'safe_filename': safe_filename,
                     'document_id': doc_id,
-                    'content_length': len(content)
+                    'content_length': len(content),
+                    # 文档已可关键词检索，语义索引在后台完成（见 /api/documents 的 indexing_state）
+                    'indexing_state': kb.get_indexing_state(doc_id)
                 })
             else:
                 # 删除已保存的文件（如果内容提取失败）
@@ -198,7 +200,10 @@ def init_document_routes(kb):
                 'id': doc['id'],
                 'filename': doc['filename'],
                 'upload_time': doc.get('upload_time', ''),
-                'content_length': len(doc['content'])
+                'content_length': doc['content_length'],
+                # 语义索引状态：pending / embedding / ready / failed
+                'indexing_state': kb.get_indexing_state(doc['id']),
+                'indexing_error': kb.indexing_errors.get(doc['id'])
             }
             for doc in kb.documents
         ]
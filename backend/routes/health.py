@@ -1,21 +1,25 @@
 """
 系统健康检查路由
 """
-from flask import Blueprint, jsonify
+import threading
+from flask import Blueprint, request, jsonify
+from config import Config
+from models.vector_index import FAISS_AVAILABLE, STORAGE_MODES
 
 # 创建Blueprint
 health_bp = Blueprint('health', __name__)
 
 def init_health_routes(kb):
     """初始化健康检查路由"""
+    # 向量存储报告同一时间只生成一份
+    vector_storage_report_lock = threading.Lock()
     
     @health_bp.route('/health', methods=['GET'])
     def health_check():
         """健康检查接口"""
-        # 检查嵌入模型是否可用
+        # 检查嵌入模型是否可用（向量索引在未安装faiss时使用NumPy暴力检索，不影响语义检索）
         try:
             from sentence_transformers import SentenceTransformer
-            import faiss
             EMBEDDING_AVAILABLE = True
         except ImportError:
             EMBEDDING_AVAILABLE = False
@@ -25,7 +29,60 @@ def init_health_routes(kb):
             'knowledge_base_documents': len(kb.documents),
             'embedding_available': EMBEDDING_AVAILABLE,
             'embedding_model_loaded': kb.embedding_model is not None,
+            'semantic_ready': kb.semantic_ready,
+            'faiss_available': FAISS_AVAILABLE,
+            'vector_index': kb.embedding_index.get_config()['index_type'] if kb.embedding_index is not None else None,
+            'search_cache': kb.result_cache.get_stats(),
+            'query_encoder': kb.query_encoder.get_stats() if kb.query_encoder else None,
             'optimization_stage': 'stage2_prompt_optimization'
         })
     
+    @health_bp.route('/ready', methods=['GET'])
+    def readiness_check():
+        """就绪检查接口：词法索引加载后即可接收流量（只做关键词检索），语义检索在后台初始化完成后启用
+        
+        ?require=semantic 时语义检索就绪前返回503；响应中列出各启动阶段的状态与耗时
+        """
+        status = kb.get_startup_status()
+        if request.args.get('require') == 'semantic':
+            ready = status['semantic_ready']
+        else:
+            ready = status['lexical_ready']
+        return jsonify(dict(status, ready=ready)), 200 if ready else 503
+    
+    @health_bp.route('/health/vector_storage', methods=['GET'])
+    def vector_storage_report():
+        """向量存储报告接口：各存储模式每块字节数与相对float32的召回率
+        
+        可选参数：modes（逗号分隔，all 表示全部模式，缺省为当前模式）、queries（抽样查询数）、k；
+        需配置 VECTOR_STORAGE_REPORT_ENABLED 开启，queries 和 k 不能超过配置的上限，同一时间只生成一份报告
+        """
+        if not Config.VECTOR_STORAGE_REPORT_ENABLED:
+            return jsonify({'error': '向量存储报告未开启（VECTOR_STORAGE_REPORT_ENABLED）'}), 404
+        modes = request.args.get('modes')
+        if modes == 'all':
+            modes = list(STORAGE_MODES)
+        elif modes:
+            modes = [mode.strip() for mode in modes.split(',') if mode.strip()]
+            unknown = [mode for mode in modes if mode not in STORAGE_MODES]
+            if unknown:
+                return jsonify({'error': f"未知的存储模式: {', '.join(unknown)}，可选值: {', '.join(STORAGE_MODES)}"}), 400
+        num_queries = request.args.get('queries', 100, type=int)
+        k = request.args.get('k', 10, type=int)
+        if num_queries <= 0 or k <= 0:
+            return jsonify({'error': 'queries 和 k 必须是正整数'}), 400
+        if num_queries > Config.VECTOR_STORAGE_REPORT_MAX_QUERIES or k > Config.VECTOR_STORAGE_REPORT_MAX_K:
+            return jsonify({'error': f"queries 不能超过 {Config.VECTOR_STORAGE_REPORT_MAX_QUERIES}，"
+                                     f"k 不能超过 {Config.VECTOR_STORAGE_REPORT_MAX_K}"}), 400
+        
+        if not vector_storage_report_lock.acquire(blocking=False):
+            return jsonify({'error': '已有向量存储报告正在生成，请稍后重试'}), 429
+        try:
+            report = kb.vector_storage_report(modes or None, num_queries=num_queries, k=k)
+        finally:
+            vector_storage_report_lock.release()
+        if report is None:
+            return jsonify({'error': '语义索引尚未建立'}), 404
+        return jsonify(report)
+    
     return health_bp
@@ -2,10 +2,24 @@
 搜索相关路由
 """
 from flask import Blueprint, request, jsonify
+from config import Config
+from services.search_budget import validate_budget_params
 
 # 创建Blueprint
 search_bp = Blueprint('search', __name__)
 
+def validate_search_params(max_results, nprobe, ef_search):
+    """校验接口传入的结果数和语义检索参数（正整数且不超过配置上限），返回错误信息，合法时返回None"""
+    limits = (('max_results', max_results, Config.SEARCH_MAX_RESULTS_LIMIT),
+              ('nprobe', nprobe, Config.SEARCH_NPROBE_LIMIT),
+              ('ef_search', ef_search, Config.SEARCH_EF_SEARCH_LIMIT))
+    for name, value, limit in limits:
+        if value is None:
+            continue
+        if isinstance(value, bool) or not isinstance(value, int) or not 1 <= value <= limit:
+            return f"{name} 必须是 1 到 {limit} 之间的整数"
+    return None
+
 def init_search_routes(kb):
     """初始化搜索路由，传入知识库实例"""
     
@@ -15,11 +29,24 @@ def init_search_routes(kb):
         data = request.json
         query = data.get('query', '')
         max_results = data.get('max_results', 5)
+        # 可选的语义检索参数：IVF索引的nprobe、HNSW索引的ef_search
+        nprobe = data.get('nprobe')
+        ef_search = data.get('ef_search')
+        # 可选的速度档位（fast/balanced/thorough）和时间预算（毫秒）
+        profile = data.get('profile')
+        time_budget_ms = data.get('time_budget_ms')
         
         if not query:
             return jsonify({'error': '查询不能为空'}), 400
+        param_error = validate_search_params(max_results, nprobe, ef_search)
+        if param_error:
+            return jsonify({'error': param_error}), 400
+        budget_error = validate_budget_params(profile, time_budget_ms)
+        if budget_error:
+            return jsonify({'error': budget_error}), 400
         
-        results = kb.search(query, max_results=max_results)
+        results = kb.search(query, max_results=max_results, nprobe=nprobe, ef_search=ef_search,
+                            profile=profile, time_budget_ms=time_budget_ms)
         
         return jsonify({
             'results': results,
@@ -27,6 +54,39 @@ def init_search_routes(kb):
             'total_documents': len(kb.documents)
         })
     
+    @search_bp.route('/api/search/batch', methods=['POST'])
+    def search_knowledge_base_batch():
+        """批量搜索接口：一次请求检索多个查询"""
+        data = request.json
+        queries = data.get('queries', [])
+        max_results = data.get('max_results', 5)
+        nprobe = data.get('nprobe')
+        ef_search = data.get('ef_search')
+        profile = data.get('profile')
+        time_budget_ms = data.get('time_budget_ms')
+        
+        if not isinstance(queries, list) or not queries:
+            return jsonify({'error': '查询列表不能为空'}), 400
+        if not all(isinstance(query, str) and query.strip() for query in queries):
+            return jsonify({'error': '查询必须是非空字符串'}), 400
+        if len(queries) > Config.SEARCH_BATCH_MAX_QUERIES:
+            return jsonify({'error': f'单次最多 {Config.SEARCH_BATCH_MAX_QUERIES} 个查询'}), 400
+        param_error = validate_search_params(max_results, nprobe, ef_search)
+        if param_error:
+            return jsonify({'error': param_error}), 400
+        budget_error = validate_budget_params(profile, time_budget_ms)
+        if budget_error:
+            return jsonify({'error': budget_error}), 400
+        
+        results = kb.search_many(queries, max_results=max_results, nprobe=nprobe, ef_search=ef_search,
+                                 profile=profile, time_budget_ms=time_budget_ms)
+        
+        return jsonify({
+            'results': [{'query': query, 'results': query_results}
+                        for query, query_results in zip(queries, results)],
+            'total_documents': len(kb.documents)
+        })
+    
     @search_bp.route('/api/search_comparison', methods=['POST'])
     def search_comparison():
         """搜索方法对比接口"""
@@ -41,7 +101,7 @@ def init_search_routes(kb):
         semantic_results = []
         
         # 检查是否支持语义搜索
-        if hasattr(kb, 'embedding_model') and kb.embedding_model:
+        if kb.semantic_ready:
             semantic_results = kb._semantic_search(query)
         
         return jsonify({
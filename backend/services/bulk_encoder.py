@@ -0,0 +1,91 @@
+"""
+批量编码服务模块
+全量重建语义索引时把文档块按长度排序分批，分发给多个工作进程编码，结果按批次完成顺序流式返回
+
+工作进程以spawn方式启动，会导入本模块：本模块在导入时只依赖标准库，没有副作用；
+工作进程只从本地模型目录加载模型并编码文本，不访问文档存储，也不再创建进程池
+"""
+import os
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+# 工作进程中加载的嵌入模型（每个进程一份）
+_worker_model = None
+
+
+def _init_worker(model_path, num_threads):
+    """工作进程初始化：限制每个进程的计算线程数，避免多个进程争抢CPU，再从本地模型目录加载嵌入模型"""
+    global _worker_model
+    try:
+        import torch
+        torch.set_num_threads(num_threads)
+    except ImportError:
+        pass
+    from sentence_transformers import SentenceTransformer
+    _worker_model = SentenceTransformer(model_path, local_files_only=True)
+
+
+def _encode_batch(texts):
+    return _worker_model.encode(texts, batch_size=len(texts), show_progress_bar=False,
+                                normalize_embeddings=True).astype('float32')
+
+
+def length_sorted_batches(texts, batch_size):
+    """按文本长度排序后切分批次，返回每批的位置列表；同一批中的文本长度相近，减少填充"""
+    order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+    return [order[start:start + batch_size] for start in range(0, len(order), batch_size)]
+
+
+class BulkEncoder:
+    """多进程批量编码器
+
+    model_path 为本地模型目录（由主进程按模型清单解析），每个工作进程从该目录独立加载一份模型，
+    计算线程数为 CPU核数 / 进程数；同时在途的批次数限制为进程数的两倍，结果不会在内存中整体堆积
+    """
+
+    def __init__(self, model_path, workers, batch_size=64):
+        self.model_path = model_path
+        self.workers = max(1, workers)
+        self.batch_size = max(1, batch_size)
+
+        # 统计信息
+        self.encoded = 0
+        self.batches = 0
+        self.seconds = 0.0
+
+    def encode(self, texts):
+        """编码文本列表，按批次完成顺序生成 (位置列表, 向量矩阵)，位置对应 texts 中的下标"""
+        batches = length_sorted_batches(texts, self.batch_size)
+        num_threads = max(1, (os.cpu_count() or 1) // self.workers)
+        started = time.perf_counter()
+        # 使用spawn启动工作进程：主进程中已有后台线程，fork后的子进程可能继承被占用的锁
+        with ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'),
+                                 initializer=_init_worker,
+                                 initargs=(self.model_path, num_threads)) as pool:
+            pending = {}
+            next_batch = 0
+            while next_batch < len(batches) or pending:
+                while next_batch < len(batches) and len(pending) < self.workers * 2:
+                    positions = batches[next_batch]
+                    pending[pool.submit(_encode_batch, [texts[i] for i in positions])] = positions
+                    next_batch += 1
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    positions = pending.pop(future)
+                    embeddings = future.result()
+                    self.encoded += len(positions)
+                    self.batches += 1
+                    self.seconds = time.perf_counter() - started
+                    yield positions, embeddings
+
+    def report(self):
+        """编码统计：块数、批次数、耗时和吞吐（块/秒）"""
+        return {
+            'workers': self.workers,
+            'batch_size': self.batch_size,
+            'chunks': self.encoded,
+            'batches': self.batches,
+            'seconds': round(self.seconds, 3),
+            'chunks_per_second': round(self.encoded / self.seconds, 1) if self.seconds > 0 else None
+        }
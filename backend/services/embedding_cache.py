@@ -0,0 +1,124 @@
+"""
+嵌入向量缓存服务模块
+以(模型名, 文本哈希)为键持久化缓存嵌入向量，按最近使用时间淘汰
+"""
+import os
+import time
+import hashlib
+import sqlite3
+import threading
+import numpy as np
+
+
+def text_hash(text):
+    """计算文本的内容哈希"""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class EmbeddingCache:
+    """基于SQLite的嵌入向量缓存"""
+
+    def __init__(self, db_path, max_entries=200000):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        self._local = threading.local()
+        self._init_schema()
+        self._entry_count = self._connect().execute('SELECT COUNT(*) FROM embeddings').fetchone()[0]
+        self.hits = 0
+        self.misses = 0
+
+    def _connect(self):
+        """获取当前线程的数据库连接"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _init_schema(self):
+        conn = self._connect()
+        with conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS embeddings (
+                    model TEXT NOT NULL,
+                    text_hash TEXT NOT NULL,
+                    vector BLOB NOT NULL,
+                    last_used REAL NOT NULL,
+                    PRIMARY KEY (model, text_hash)
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings(last_used)')
+
+    def get_many(self, model, hashes, batch_size=500):
+        """批量查询缓存，返回 {文本哈希: 向量}，命中的条目刷新最近使用时间"""
+        conn = self._connect()
+        found = {}
+        unique_hashes = list(dict.fromkeys(hashes))
+        for start in range(0, len(unique_hashes), batch_size):
+            batch = unique_hashes[start:start + batch_size]
+            placeholders = ','.join('?' * len(batch))
+            rows = conn.execute(
+                f'SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({placeholders})',
+                [model] + batch
+            ).fetchall()
+            for hash_value, blob in rows:
+                found[hash_value] = np.frombuffer(blob, dtype='float32')
+
+        if found:
+            now = time.time()
+            with conn:
+                conn.executemany(
+                    'UPDATE embeddings SET last_used = ? WHERE model = ? AND text_hash = ?',
+                    [(now, model, hash_value) for hash_value in found]
+                )
+        self.hits += len(found)
+        self.misses += len(unique_hashes) - len(found)
+        return found
+
+    def put_many(self, model, hashes, vectors):
+        """批量写入缓存，超过容量时淘汰最久未使用的条目"""
+        now = time.time()
+        rows = [
+            (model, hash_value, np.asarray(vector, dtype='float32').tobytes(), now)
+            for hash_value, vector in zip(hashes, vectors)
+        ]
+        conn = self._connect()
+        with conn:
+            conn.executemany(
+                'INSERT OR REPLACE INTO embeddings (model, text_hash, vector, last_used) VALUES (?, ?, ?, ?)',
+                rows
+            )
+        self._entry_count += len(rows)
+
+        # 留出10%的余量，避免每次写入都触发淘汰
+        if self._entry_count > self.max_entries * 1.1:
+            self._evict()
+
+    def _evict(self):
+        """淘汰最久未使用的条目，直到不超过容量"""
+        conn = self._connect()
+        with conn:
+            total = conn.execute('SELECT COUNT(*) FROM embeddings').fetchone()[0]
+            overflow = total - self.max_entries
+            if overflow > 0:
+                conn.execute(
+                    'DELETE FROM embeddings WHERE rowid IN '
+                    '(SELECT rowid FROM embeddings ORDER BY last_used LIMIT ?)',
+                    (overflow,)
+                )
+                total -= overflow
+        self._entry_count = total
+
+    def get_stats(self):
+        """缓存统计信息"""
+        return {
+            'entries': self._entry_count,
+            'max_entries': self.max_entries,
+            'hits': self.hits,
+            'misses': self.misses
+        }
@@ -2,62 +2,143 @@
 嵌入模型服务模块
 """
 import os
+import json
+from datetime import datetime
 try:
     from sentence_transformers import SentenceTransformer
-    import faiss
     EMBEDDING_AVAILABLE = True
 except ImportError:
     EMBEDDING_AVAILABLE = False
 
+# 判断目录是否为完整模型快照的关键文件
+MODEL_KEY_FILES = ('config.json', 'tokenizer_config.json')
+
+def _cache_roots():
+    """Hugging Face模型缓存的可能位置（存在的目录，按优先级排列）"""
+    candidates = []
+    if os.environ.get('HF_HUB_CACHE'):
+        candidates.append(os.environ['HF_HUB_CACHE'])
+    if os.environ.get('HF_HOME'):
+        candidates.append(os.path.join(os.environ['HF_HOME'], 'hub'))
+    candidates += [
+        os.path.expanduser("~/.cache/huggingface/hub"),
+        os.path.expanduser("~/.cache/huggingface/transformers"),
+        os.path.expanduser("~/AppData/Local/huggingface/hub"),  # Windows
+    ]
+    roots = []
+    for cache_dir in candidates:
+        if cache_dir not in roots and os.path.isdir(cache_dir):
+            roots.append(cache_dir)
+    return roots
+
+def _is_model_dir(path):
+    return bool(path) and all(os.path.exists(os.path.join(path, f)) for f in MODEL_KEY_FILES)
+
+def _latest_snapshot(model_dir):
+    """模型缓存目录中的当前快照：优先读取 refs/main 指向的版本，没有时取最新修改的快照"""
+    snapshots_dir = os.path.join(model_dir, "snapshots")
+    ref_file = os.path.join(model_dir, "refs", "main")
+    if os.path.exists(ref_file):
+        with open(ref_file, 'r', encoding='utf-8') as f:
+            snapshot_path = os.path.join(snapshots_dir, f.read().strip())
+        if os.path.isdir(snapshot_path):
+            return snapshot_path
+    if not os.path.isdir(snapshots_dir):
+        return None
+    snapshots = [os.path.join(snapshots_dir, name) for name in os.listdir(snapshots_dir)]
+    return max(snapshots, key=os.path.getmtime) if snapshots else None
+
 def check_local_model_cache(model_name):
-    """检查本地是否有模型缓存"""
+    """检查本地是否有模型缓存，返回快照目录
+    
+    不带组织名的模型（如 paraphrase-multilingual-MiniLM-L12-v2）也按 sentence-transformers/ 前缀查找
+    """
     try:
-        # Hugging Face模型缓存的可能位置
-        cache_locations = [
-            os.path.expanduser("~/.cache/huggingface/hub"),
-            os.path.expanduser("~/.cache/huggingface/transformers"),
-            os.path.expanduser("~/AppData/Local/huggingface/hub"),  # Windows
-        ]
-        
-        model_cache_name = model_name.replace('/', '--')
+        repo_ids = [model_name]
+        if '/' not in model_name:
+            repo_ids.append(f"sentence-transformers/{model_name}")
         
-        for cache_dir in cache_locations:
-            if not os.path.exists(cache_dir):
-                continue
-                
-            model_dir = os.path.join(cache_dir, f"models--{model_cache_name}")
-            if os.path.exists(model_dir):
-                snapshots_dir = os.path.join(model_dir, "snapshots")
-                if os.path.exists(snapshots_dir):
-                    snapshots = os.listdir(snapshots_dir)
-                    if snapshots:
-                        # 找到最新的快照
-                        latest_snapshot = max(snapshots, key=lambda x: os.path.getctime(os.path.join(snapshots_dir, x)))
-                        snapshot_path = os.path.join(snapshots_dir, latest_snapshot)
-                        
-                        # 检查关键文件是否存在
-                        key_files = ['config.json', 'tokenizer_config.json']
-                        if all(os.path.exists(os.path.join(snapshot_path, f)) for f in key_files):
-                            print(f"✓ 发现本地模型缓存: {snapshot_path}")
-                            return snapshot_path
+        for cache_dir in _cache_roots():
+            for repo_id in repo_ids:
+                model_dir = os.path.join(cache_dir, f"models--{repo_id.replace('/', '--')}")
+                if not os.path.isdir(model_dir):
+                    continue
+                snapshot_path = _latest_snapshot(model_dir)
+                if _is_model_dir(snapshot_path):
+                    print(f"✓ 发现本地模型缓存: {snapshot_path}")
+                    return snapshot_path
         
         print(f"× 未发现本地模型缓存: {model_name}")
         return None
-        
+    
     except Exception as e:
         print(f"× 检查本地缓存时出错: {e}")
         return None
 
-def load_embedding_model_smart(model_name, fallback_models=None):
-    """智能加载嵌入模型：优先本地缓存，无缓存时在线加载"""
-    if not EMBEDDING_AVAILABLE:
+def _read_model_manifest(manifest_path):
+    """读取上次成功加载的模型清单 {model_name, path, source, resolved_at}"""
+    if not manifest_path or not os.path.exists(manifest_path):
         return None
-        
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"× 读取模型清单失败: {e}")
+        return None
+
+def manifest_model_path(manifest_path, model_name):
+    """模型清单中记录的本地模型目录：清单的模型名与 model_name 一致且目录完整时返回，否则返回None"""
+    manifest = _read_model_manifest(manifest_path)
+    if manifest and manifest.get('model_name') == model_name and _is_model_dir(manifest.get('path')):
+        return manifest['path']
+    return None
+
+def _write_model_manifest(manifest_path, model_name, path, source):
+    """记录成功加载的模型及其本地路径，下次启动直接从该路径加载（先写临时文件再替换）"""
+    if not manifest_path or not _is_model_dir(path):
+        return
+    try:
+        tmp_path = manifest_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'model_name': model_name,
+                'path': os.path.abspath(path),
+                'source': source,
+                'resolved_at': datetime.now().isoformat()
+            }, f, ensure_ascii=False)
+        os.replace(tmp_path, manifest_path)
+    except Exception as e:
+        print(f"× 保存模型清单失败: {e}")
+
+def load_embedding_model_smart(model_name, fallback_models=None, return_model_name=False, offline=False,
+                               manifest_path=None):
+    """智能加载嵌入模型：优先模型清单记录的路径，其次本地缓存，无缓存时在线加载
+    
+    return_model_name为True时返回(模型, 实际加载的模型名)，便于调用方标记依赖该模型的索引；
+    offline为True时只使用本地文件，不尝试下载。离线/在线通过 local_files_only 参数传给加载器，
+    不修改进程环境变量（HF_HUB_OFFLINE 等），可与其他线程中的 Hugging Face 代码并发；
+    manifest_path 给定时，成功加载后记录模型名与本地路径，之后启动跳过缓存目录扫描
+    """
+    if not EMBEDDING_AVAILABLE:
+        return (None, None) if return_model_name else None
+    
     if fallback_models is None:
         fallback_models = []
     
     all_models = [model_name] + fallback_models
     
+    # 0. 模型清单：上次解析到的首选模型本地路径仍然有效时直接加载
+    # （清单记录的是备选模型时不走捷径，首选模型可能已经可用，重新解析）
+    manifest_dir = manifest_model_path(manifest_path, model_name)
+    if manifest_dir:
+        try:
+            print(f"按模型清单加载: {model_name} ({manifest_dir})")
+            model = SentenceTransformer(manifest_dir, local_files_only=True)
+            print(f"✓ 成功按模型清单加载: {model_name}")
+            return (model, model_name) if return_model_name else model
+        except Exception as e:
+            print(f"× 按模型清单加载失败，重新解析模型: {e}")
+    
     for current_model in all_models:
         try:
             print(f"尝试加载模型: {current_model}")
@@ -66,52 +147,40 @@ def load_embedding_model_smart(model_name, fallback_models=None):
             local_path = check_local_model_cache(current_model)
             
             if local_path:
-                # 使用本地缓存（离线模式）
+                # 使用本地缓存（只读本地文件）
                 print(f"使用本地缓存加载: {current_model}")
-                original_offline = os.environ.get('HF_HUB_OFFLINE', '0')
-                os.environ['HF_HUB_OFFLINE'] = '1'
-                
                 try:
-                    model = SentenceTransformer(local_path)
+                    model = SentenceTransformer(local_path, local_files_only=True)
                     print(f"✓ 成功从本地缓存加载: {current_model}")
-                    return model
+                    _write_model_manifest(manifest_path, current_model, local_path, 'cache')
+                    return (model, current_model) if return_model_name else model
                 except Exception as e:
                     print(f"× 本地缓存加载失败: {e}")
                     # 尝试使用模型名称从缓存加载
                     try:
-                        model = SentenceTransformer(current_model)
+                        model = SentenceTransformer(current_model, local_files_only=True)
                         print(f"✓ 成功使用模型名称从缓存加载: {current_model}")
-                        return model
+                        _write_model_manifest(manifest_path, current_model, local_path, 'cache')
+                        return (model, current_model) if return_model_name else model
                     except Exception as e2:
                         print(f"× 缓存模型名称加载也失败: {e2}")
-                finally:
-                    # 恢复原始离线设置
-                    os.environ['HF_HUB_OFFLINE'] = original_offline
+            elif offline:
+                print(f"离线模式，跳过在线下载: {current_model}")
             else:
                 # 没有本地缓存，尝试在线下载
                 print(f"本地无缓存，尝试在线下载: {current_model}")
-                
-                # 确保在线模式
-                original_offline = os.environ.get('HF_HUB_OFFLINE', '0')
-                if 'HF_HUB_OFFLINE' in os.environ:
-                    del os.environ['HF_HUB_OFFLINE']
-                if 'TRANSFORMERS_OFFLINE' in os.environ:
-                    del os.environ['TRANSFORMERS_OFFLINE']
-                
                 try:
-                    model = SentenceTransformer(current_model)
+                    model = SentenceTransformer(current_model, local_files_only=False)
                     print(f"✓ 成功在线下载并加载: {current_model}")
-                    return model
+                    _write_model_manifest(manifest_path, current_model,
+                                          check_local_model_cache(current_model), 'download')
+                    return (model, current_model) if return_model_name else model
                 except Exception as e:
                     print(f"× 在线下载失败: {e}")
-                finally:
-                    # 恢复原始设置
-                    if original_offline != '0':
-                        os.environ['HF_HUB_OFFLINE'] = original_offline
         
         except Exception as e:
             print(f"× 模型 {current_model} 加载完全失败: {e}")
             continue
     
     print("× 所有模型都加载失败")
-    return None
+    return (None, None) if return_model_name else None
@@ -0,0 +1,199 @@
+"""
+查询编码服务模块
+在嵌入模型之前做两件事：缓存最近查询的向量；把并发请求在一个短时间窗口内合并为一次批量编码
+"""
+import time
+import queue
+import threading
+from collections import OrderedDict, deque
+import numpy as np
+
+
+class _EncodeRequest:
+    """一次待编码的查询"""
+
+    __slots__ = ('text', 'submitted_at', 'done', 'vector', 'error')
+
+    def __init__(self, text):
+        self.text = text
+        self.submitted_at = time.perf_counter()
+        self.done = threading.Event()
+        self.vector = None
+        self.error = None
+
+
+class QueryEncoder:
+    """查询向量编码器：LRU记忆 + 微批处理
+
+    batch_window_ms 为收集并发请求的最长等待时间，<=0 时不合并、在调用线程中直接编码；
+    只有存在其他正在等待编码的调用方时才会等待窗口，单个请求不增加延迟
+    """
+
+    def __init__(self, model, batch_window_ms=5, max_batch_size=32, memo_size=2048):
+        self.model = model
+        self.batch_window = batch_window_ms / 1000.0
+        self.max_batch_size = max(1, max_batch_size)
+        self.memo_size = memo_size
+        self._memo = OrderedDict()  # 查询文本 -> 向量
+        self._memo_lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._worker = None
+        self._worker_lock = threading.Lock()
+        self._pending = 0  # 记忆未命中、尚未拿到结果的调用方数量
+
+        # 统计信息
+        self._stats_lock = threading.Lock()
+        self.requests = 0
+        self.memo_hits = 0
+        self.batches = 0
+        self.batched_requests = 0
+        self.encoded_texts = 0
+        self.max_batch_seen = 0
+        self.encode_seconds = 0.0
+        self._latencies = deque(maxlen=1000)  # 最近请求的端到端延迟（秒）
+
+    def encode(self, text):
+        """编码单个查询，返回归一化的float32向量"""
+        with self._stats_lock:
+            self.requests += 1
+        vector = self._memo_get(text)
+        if vector is not None:
+            with self._stats_lock:
+                self.memo_hits += 1
+            return vector
+
+        request = _EncodeRequest(text)
+        if self.batch_window <= 0:
+            self._encode_batch([request])
+        else:
+            self._ensure_worker()
+            with self._stats_lock:
+                self._pending += 1
+            try:
+                self._queue.put(request)
+                request.done.wait()
+            finally:
+                with self._stats_lock:
+                    self._pending -= 1
+        if request.error is not None:
+            raise request.error
+        return request.vector
+
+    def encode_many(self, texts):
+        """批量编码多个查询，记忆未命中的文本在调用线程中合并为一次模型调用，返回向量矩阵"""
+        if len(texts) == 1:
+            return self.encode(texts[0]).reshape(1, -1)
+
+        with self._stats_lock:
+            self.requests += len(texts)
+        vectors = {}
+        misses = []
+        for text in texts:
+            vector = self._memo_get(text)
+            if vector is not None:
+                vectors[text] = vector
+            else:
+                misses.append(text)
+        with self._stats_lock:
+            self.memo_hits += len(texts) - len(misses)
+
+        if misses:
+            requests = [_EncodeRequest(text) for text in misses]
+            self._encode_batch(requests)
+            for request in requests:
+                if request.error is not None:
+                    raise request.error
+                vectors[request.text] = request.vector
+        return np.vstack([vectors[text] for text in texts]).astype('float32')
+
+    def _memo_get(self, text):
+        with self._memo_lock:
+            vector = self._memo.get(text)
+            if vector is not None:
+                self._memo.move_to_end(text)
+            return vector
+
+    def _memo_put(self, texts, vectors):
+        if self.memo_size <= 0:
+            return
+        with self._memo_lock:
+            for text, vector in zip(texts, vectors):
+                self._memo[text] = vector
+                self._memo.move_to_end(text)
+            while len(self._memo) > self.memo_size:
+                self._memo.popitem(last=False)
+
+    def _ensure_worker(self):
+        if self._worker is not None:
+            return
+        with self._worker_lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name='query-encoder', daemon=True)
+                self._worker.start()
+
+    def _run(self):
+        """后台线程：取到第一个请求后在时间窗口内继续收集，凑成一批编码
+
+        窗口内一旦收齐了所有正在等待的请求就立即编码
+        """
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.perf_counter() + self.batch_window
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                with self._stats_lock:
+                    pending = self._pending
+                if remaining <= 0 or (self._queue.empty() and len(batch) >= pending):
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._encode_batch(batch)
+
+    def _encode_batch(self, batch):
+        """一次模型调用编码整批请求（相同文本只编码一次），并唤醒等待的调用方"""
+        texts = list(dict.fromkeys(request.text for request in batch))
+        started = time.perf_counter()
+        try:
+            vectors = self.model.encode(texts, batch_size=len(texts), show_progress_bar=False,
+                                        normalize_embeddings=True)
+            vectors = np.asarray(vectors, dtype='float32')
+        except Exception as e:
+            for request in batch:
+                request.error = e
+                request.done.set()
+            return
+        finished = time.perf_counter()
+
+        self._memo_put(texts, vectors)
+        by_text = dict(zip(texts, vectors))
+        for request in batch:
+            request.vector = by_text[request.text]
+            request.done.set()
+
+        with self._stats_lock:
+            self.batches += 1
+            self.batched_requests += len(batch)
+            self.encoded_texts += len(texts)
+            self.max_batch_seen = max(self.max_batch_seen, len(batch))
+            self.encode_seconds += finished - started
+            self._latencies.extend(finished - request.submitted_at for request in batch)
+
+    def get_stats(self):
+        """编码统计：请求数、记忆命中、批次数与批大小、延迟（毫秒）"""
+        with self._stats_lock:
+            latencies = sorted(self._latencies)
+            return {
+                'requests': self.requests,
+                'memo_hits': self.memo_hits,
+                'memo_entries': len(self._memo),
+                'batches': self.batches,
+                'encoded_texts': self.encoded_texts,
+                'avg_batch_size': self.batched_requests / self.batches if self.batches else 0.0,
+                'max_batch_size': self.max_batch_seen,
+                'avg_encode_ms': self.encode_seconds / self.batches * 1000 if self.batches else 0.0,
+                'avg_latency_ms': sum(latencies) / len(latencies) * 1000 if latencies else 0.0,
+                'p95_latency_ms': latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000
+                if latencies else 0.0
+            }
@@ -0,0 +1,66 @@
+"""
+检索结果缓存服务模块
+LRU + TTL 的内存缓存，条目带有知识库版本号，知识库变化后旧条目自动失效
+"""
+import copy
+import time
+import threading
+from collections import OrderedDict
+
+
+class ResultCache:
+    """带版本号的LRU+TTL结果缓存"""
+
+    def __init__(self, max_entries=1000, ttl=300):
+        self.max_entries = max_entries
+        self.ttl = ttl  # 秒，<=0 表示不过期
+        self._entries = OrderedDict()  # 键 -> (版本号, 写入时间, 结果)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    def get(self, key, generation):
+        """查询缓存，版本号不一致或已过期的条目视为未命中并移除；返回结果的副本，未命中返回None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry_generation, stored_at, value = entry
+                if entry_generation == generation and (self.ttl <= 0 or time.time() - stored_at < self.ttl):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return copy.deepcopy(value)
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, generation, value):
+        """写入缓存，超过容量时淘汰最久未使用的条目"""
+        if not self.enabled:
+            return
+        value = copy.deepcopy(value)
+        with self._lock:
+            self._entries[key] = (generation, time.time(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self):
+        """缓存统计信息"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0
+            }
@@ -0,0 +1,92 @@
+"""
+检索时间预算模块
+按速度档位（fast / balanced / thorough）决定执行哪些检索阶段，并在截止时间到达后跳过剩余的可选阶段
+"""
+import time
+
+# 各档位启用的可选阶段：模糊匹配、片段抽取、语义检索、重排序融合
+SEARCH_PROFILES = {
+    'fast': {'fuzzy': False, 'snippets': False, 'semantic': False, 'rerank': False},
+    'balanced': {'fuzzy': False, 'snippets': True, 'semantic': True, 'rerank': True},
+    'thorough': {'fuzzy': True, 'snippets': True, 'semantic': True, 'rerank': True},
+}
+
+
+class SearchBudget:
+    """一次检索的档位与截止时间，记录被跳过的阶段
+
+    time_budget_ms <= 0 或为 None 表示不限时；档位关闭的阶段记为 'profile'，
+    因截止时间或超时跳过的阶段记为 'deadline' / 'timeout'，语义检索尚在启动初始化时记为 'initializing'
+    """
+
+    def __init__(self, profile='thorough', time_budget_ms=None):
+        if profile not in SEARCH_PROFILES:
+            raise ValueError(f"未知的检索档位: {profile}")
+        self.profile = profile
+        self.stages = SEARCH_PROFILES[profile]
+        self.time_budget_ms = time_budget_ms if time_budget_ms and time_budget_ms > 0 else None
+        self.deadline = (time.monotonic() + self.time_budget_ms / 1000.0
+                         if self.time_budget_ms else None)
+        self.skipped = {}  # 阶段 -> 跳过原因
+
+    def remaining(self):
+        """剩余时间（秒），不限时返回None"""
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+    def expired(self):
+        return self.deadline is not None and time.monotonic() >= self.deadline
+
+    def timeout(self, limit):
+        """分支超时：配置的超时与剩余时间中较小者"""
+        remaining = self.remaining()
+        return limit if remaining is None else min(limit, remaining)
+
+    def allows(self, stage):
+        """阶段是否应当执行；不执行时记录原因"""
+        if not self.stages[stage]:
+            self.skipped.setdefault(stage, 'profile')
+            return False
+        if self.expired():
+            self.skipped.setdefault(stage, 'deadline')
+            return False
+        return True
+
+    def skip(self, stage, reason):
+        self.skipped.setdefault(stage, reason)
+
+    @property
+    def degraded(self):
+        """是否有阶段因时间原因或尚未就绪被跳过（这样的结果不应缓存）"""
+        return any(reason != 'profile' for reason in self.skipped.values())
+
+    def fork(self):
+        """批量检索中每个查询使用的预算：共享档位和截止时间，已跳过的阶段一并继承"""
+        budget = SearchBudget.__new__(SearchBudget)
+        budget.profile = self.profile
+        budget.stages = self.stages
+        budget.time_budget_ms = self.time_budget_ms
+        budget.deadline = self.deadline
+        budget.skipped = dict(self.skipped)
+        return budget
+
+    def report(self):
+        """写入 search_info 的预算信息"""
+        return {
+            'profile': self.profile,
+            'time_budget_ms': self.time_budget_ms,
+            'skipped_stages': dict(self.skipped),
+            'deadline_exceeded': any(reason in ('deadline', 'timeout') for reason in self.skipped.values())
+        }
+
+
+def validate_budget_params(profile, time_budget_ms):
+    """校验接口传入的档位和时间预算，返回错误信息，合法时返回None"""
+    if profile is not None and profile not in SEARCH_PROFILES:
+        return f"未知的检索档位: {profile}，可选值: {', '.join(SEARCH_PROFILES)}"
+    if time_budget_ms is not None and (isinstance(time_budget_ms, bool)
+                                       or not isinstance(time_budget_ms, (int, float))
+                                       or time_budget_ms < 0):
+        return "time_budget_ms 必须是非负数"
+    return None
@@ -0,0 +1,59 @@
+"""
+启动阶段跟踪模块
+记录启动各阶段（词法索引、嵌入模型加载、语义索引加载或构建）的状态与耗时，供 /ready 接口查询
+"""
+import time
+import threading
+from datetime import datetime
+
+
+class StartupPhases:
+    """按顺序排列的启动阶段，每个阶段的状态为 pending / running / ready / failed / skipped"""
+
+    def __init__(self, names):
+        self._lock = threading.Lock()
+        self._order = list(names)
+        self._phases = {name: {'status': 'pending'} for name in names}
+        self._started = {}  # 阶段 -> 开始时刻（monotonic）
+
+    def start(self, name):
+        with self._lock:
+            self._started[name] = time.monotonic()
+            self._phases[name] = {'status': 'running', 'started_at': datetime.now().isoformat()}
+
+    def finish(self, name, **details):
+        self._end(name, 'ready', **details)
+
+    def fail(self, name, error):
+        self._end(name, 'failed', error=str(error))
+
+    def skip(self, name, reason):
+        self._end(name, 'skipped', reason=reason)
+
+    def _end(self, name, status, **details):
+        with self._lock:
+            phase = self._phases[name]
+            phase['status'] = status
+            if name in self._started:
+                phase['seconds'] = round(time.monotonic() - self._started.pop(name), 3)
+            phase.update(details)
+
+    def status(self, name):
+        with self._lock:
+            return self._phases[name]['status']
+
+    def current(self):
+        """正在进行的阶段，没有时返回None"""
+        with self._lock:
+            return next((name for name in self._order if self._phases[name]['status'] == 'running'), None)
+
+    def report(self):
+        """各阶段的状态列表，进行中的阶段附带已耗时"""
+        with self._lock:
+            report = []
+            for name in self._order:
+                phase = dict(self._phases[name], name=name)
+                if name in self._started:
+                    phase['seconds'] = round(time.monotonic() - self._started[name], 3)
+                report.append(phase)
+            return report
@@ -25,7 +25,7 @@ try:
     print("   ✓ faiss已安装")
     FAISS_OK = True
 except ImportError as e:
-    print(f"   ✗ faiss: {e}")
+    print(f"   - faiss: {e}（可选，未安装时向量检索使用NumPy暴力检索）")
     FAISS_OK = False
 
 try:
@@ -113,7 +113,7 @@ print(f"\n" + "=" * 40)
 print("测试完成!")
 
 print(f"\n功能状态:")
-print(f"- 依赖库: {'✓' if SENTENCE_TRANSFORMERS_OK and FAISS_OK else '✗'}")
+print(f"- 依赖库: {'✓' if SENTENCE_TRANSFORMERS_OK else '✗'}")
 print(f"- 嵌入功能: {'✓' if EMBEDDING_AVAILABLE else '✗'}")
 print(f"- 知识库: {'✓' if kb else '✗'}")
 print(f"- 语义模型: {'✓' if kb and kb.embedding_model else '✗'}")
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+test_scripts 下 pytest 测试共用的路径设置、假嵌入模型和知识库夹具
+"""
+
+import io
+import os
+import sys
+import hashlib
+import contextlib
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+
+import models.knowledge_base as knowledge_base_module
+from config import Config
+
+
+class FakeEmbeddingModel:
+    """按字符哈希生成归一化向量的假嵌入模型，记录编码过的文本"""
+    dimension = 16
+
+    def __init__(self):
+        self.encoded = []
+
+    def encode(self, texts, batch_size=32, show_progress_bar=False, normalize_embeddings=True, **kwargs):
+        self.encoded.extend(texts)
+        vectors = np.zeros((len(texts), self.dimension), dtype='float32')
+        for row, text in enumerate(texts):
+            for char in text:
+                vectors[row, int(hashlib.md5(char.encode()).hexdigest(), 16) % self.dimension] += 1
+        return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-6)
+
+    def get_sentence_embedding_dimension(self):
+        return self.dimension
+
+
+def fake_model_loader(model_name, fallback_models=None, return_model_name=False, **kwargs):
+    model = FakeEmbeddingModel()
+    return (model, model_name) if return_model_name else model
+
+
+@pytest.fixture
+def make_kb(tmp_path, monkeypatch):
+    """创建只做词法检索（不加载嵌入模型）的临时知识库，documents 为 [(文件名, 正文)]
+
+    构造和加入文档时的输出被屏蔽；result_cache 给定时替换默认的检索结果缓存
+    """
+    monkeypatch.setattr(knowledge_base_module, 'EMBEDDING_AVAILABLE', False)
+
+    def make(documents=(), result_cache=None):
+        with contextlib.redirect_stdout(io.StringIO()):
+            kb = knowledge_base_module.KnowledgeBase(knowledge_base_path=str(tmp_path),
+                                                     upload_folder=str(tmp_path))
+            if result_cache is not None:
+                kb.result_cache = result_cache
+            for filename, content in documents:
+                kb.add_document(filename, content)
+        return kb
+
+    return make
+
+
+@pytest.fixture
+def make_semantic_kb(tmp_path, monkeypatch):
+    """创建使用假嵌入模型和 flat 向量索引的临时知识库，启动时的语义初始化同步完成
+
+    background_embedding 为 False 时上传文档同步编码；构造和加入文档时的输出被屏蔽
+    """
+    monkeypatch.setattr(knowledge_base_module, 'EMBEDDING_AVAILABLE', True)
+    monkeypatch.setattr(knowledge_base_module, 'load_embedding_model_smart', fake_model_loader)
+    monkeypatch.setattr(Config, 'BACKGROUND_STARTUP', False)
+    monkeypatch.setattr(Config, 'SEMANTIC_INDEX_TYPE', 'flat')
+
+    def make(documents=(), background_embedding=False):
+        monkeypatch.setattr(Config, 'BACKGROUND_EMBEDDING', background_embedding)
+        with contextlib.redirect_stdout(io.StringIO()):
+            kb = knowledge_base_module.KnowledgeBase(knowledge_base_path=str(tmp_path),
+                                                     upload_folder=str(tmp_path))
+            for filename, content in documents:
+                kb.add_document(filename, content)
+        return kb
+
+    return make
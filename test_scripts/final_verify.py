@@ -146,7 +146,8 @@ def main():
     total_tests += 1
     
     try:
-        from app import app
+        from app import create_app
+        app, _ = create_app()
         print("✅ Flask应用创建成功")
         
         # 检查关键路由
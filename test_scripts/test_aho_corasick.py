@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Aho-Corasick 自动机的增删与匹配测试
+运行: python -m pytest test_scripts/test_aho_corasick.py
+"""
+
+import os
+import sys
+import random
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+
+from models.aho_corasick import AhoCorasick
+
+
+def naive_find(active, text):
+    """逐个模式做子串判断的参考实现 {模式: {键: 引用计数}}"""
+    found = {}
+    for key, patterns in active.items():
+        for pattern in patterns:
+            if pattern in text:
+                keys = found.setdefault(pattern, {})
+                keys[key] = keys.get(key, 0) + 1
+    return found
+
+
+def assert_links_consistent(automaton):
+    """失败树的反向边与失败链接一致，且每个节点的失败链接是它最长的、存在于树中的真后缀"""
+    strings = {0: ''}
+    stack = [0]
+    while stack:
+        node = stack.pop()
+        for char, child in automaton.goto[node].items():
+            strings[child] = strings[node] + char
+            stack.append(child)
+    nodes = {string: node for node, string in strings.items()}
+    assert set(strings) == set(automaton.fail)
+    for node, string in strings.items():
+        if node == 0:
+            continue
+        expected = next(nodes[string[start:]] for start in range(1, len(string) + 1) if string[start:] in nodes)
+        assert automaton.fail[node] == expected, string
+        assert node in automaton.fail_children.get(expected, ())
+    for fail_node, children in automaton.fail_children.items():
+        assert children and all(automaton.fail[child] == fail_node for child in children)
+
+
+def test_find_matches_overlapping_patterns():
+    automaton = AhoCorasick()
+    automaton.add(1, ['he', 'she', 'his', 'hers'])
+    automaton.add(2, ['she', 'report.pdf'])
+    found = automaton.find('ushers report.pdf')
+    assert found == {'he': {1: 1}, 'she': {1: 1, 2: 1}, 'hers': {1: 1}, 'report.pdf': {2: 1}}
+    assert len(automaton) == 5
+
+
+def test_random_add_remove_matches_naive():
+    """随机增删模式后，匹配结果与逐个子串判断一致，失败链接与整体重建的结果一致"""
+    rng = random.Random(7)
+    automaton = AhoCorasick()
+    active = {}
+    for step in range(400):
+        if active and rng.random() < 0.4:
+            key = rng.choice(list(active))
+            automaton.remove(key)
+            del active[key]
+        else:
+            key = step
+            patterns = [''.join(rng.choice('abc') for _ in range(rng.randint(1, 5))) for _ in range(rng.randint(1, 3))]
+            automaton.add(key, patterns)
+            active[key] = patterns
+        text = ''.join(rng.choice('abcd') for _ in range(30))
+        assert automaton.find(text) == naive_find(active, text)
+        if step % 50 == 0:
+            assert_links_consistent(automaton)
+    assert_links_consistent(automaton)
+
+
+def test_build_matches_incremental():
+    """批量构建与逐个加入得到相同的匹配结果，批量构建后仍可增量增删"""
+    rng = random.Random(3)
+    items = [(key, [''.join(rng.choice('abc') for _ in range(rng.randint(1, 6))) for _ in range(3)])
+             for key in range(200)]
+    built = AhoCorasick.build(items)
+    incremental = AhoCorasick()
+    for key, patterns in items:
+        incremental.add(key, patterns)
+    assert_links_consistent(built)
+    for _ in range(50):
+        text = ''.join(rng.choice('abcd') for _ in range(40))
+        assert built.find(text) == incremental.find(text) == naive_find(dict(items), text)
+    built.remove(0)
+    built.add(500, ['abcabc', 'd'])
+    assert_links_consistent(built)
+    active = dict(items[1:])
+    active[500] = ['abcabc', 'd']
+    assert built.find('xxabcabcd') == naive_find(active, 'xxabcabcd')
+
+
+def test_remove_prunes_nodes():
+    """删除全部模式后只剩根节点，共享前缀的节点在仍被使用时保留"""
+    automaton = AhoCorasick()
+    automaton.add(1, ['report', 'report.pdf'])
+    automaton.add(2, ['rep'])
+    nodes_before = len(automaton.goto)
+    automaton.remove(1)
+    assert len(automaton.goto) == len('rep') + 1
+    assert automaton.find('report.pdf') == {'rep': {2: 1}}
+    automaton.remove(2)
+    assert len(automaton.goto) == 1
+    assert automaton.find('report.pdf') == {}
+    assert nodes_before == len('report.pdf') + 1
+
+
+def test_shared_pattern_reference_counts():
+    """多个键共享同一模式时，只有最后一个键移除后模式才消失"""
+    automaton = AhoCorasick()
+    automaton.add(1, ['notes.txt'])
+    automaton.add(2, ['notes.txt'])
+    automaton.remove(1)
+    assert automaton.find('see notes.txt') == {'notes.txt': {2: 1}}
+    automaton.remove(2)
+    assert automaton.find('see notes.txt') == {}
+
+
+def test_concurrent_add_remove_find():
+    """增删与匹配并发执行时不出错，结束后的结果与参考实现一致"""
+    automaton = AhoCorasick()
+    errors = []
+    stop = threading.Event()
+
+    def reader():
+        try:
+            while not stop.is_set():
+                for doc_ids in automaton.find('file12.txt file7.pdf').values():
+                    list(doc_ids)
+        except Exception as e:
+            errors.append(e)
+
+    def writer():
+        for index in range(300):
+            automaton.add(index, [f'file{index}.txt', f'file{index}'])
+            if index >= 10:
+                automaton.remove(index - 10)
+        stop.set()
+
+    threads = [threading.Thread(target=reader) for _ in range(3)] + [threading.Thread(target=writer)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not errors, errors
+    active = {index: [f'file{index}.txt', f'file{index}'] for index in range(290, 300)}
+    assert automaton.find('file295.txt and file12.txt') == naive_find(active, 'file295.txt and file12.txt')
+    assert_links_consistent(automaton)
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+新上传文档后台编码的测试：逐文档的语义索引状态变化，编码期间删除文档不在向量索引中留下孤立的块，
+语义检索与向量索引增删并发执行
+使用按字符哈希生成向量的假模型，不加载真实的嵌入模型
+运行: python -m pytest test_scripts/test_background_embedding.py
+"""
+
+import io
+import time
+import threading
+import contextlib
+
+import pytest
+
+CONTENT = '机器学习是人工智能的一个重要分支，它使计算机能够从数据中学习。深度学习使用多层神经网络。' * 4
+
+
+def indexed_chunk_ids(kb):
+    return set(kb.embedding_index.ids().tolist()) if kb.embedding_index is not None else set()
+
+
+def live_chunk_ids(kb):
+    return {chunk_id for start, end in kb.document_chunk_ranges.values() for chunk_id in range(start, end)}
+
+
+def wait_for_embedding(kb):
+    with contextlib.redirect_stdout(io.StringIO()):
+        kb.embedding_queue.join()
+
+
+@pytest.fixture
+def kb(make_semantic_kb):
+    kb = make_semantic_kb([('已有文档.txt', '量子计算利用量子比特进行计算，叠加和纠缠是其核心原理。' * 3)],
+                          background_embedding=True)
+    wait_for_embedding(kb)
+    return kb
+
+
+@pytest.fixture
+def gate(kb, monkeypatch):
+    """让后台编码停在 encode 中，直到测试放行"""
+    started, release = threading.Event(), threading.Event()
+    original = kb.embedding_model.encode
+
+    def encode(texts, **kwargs):
+        started.set()
+        assert release.wait(10)
+        return original(texts, **kwargs)
+
+    monkeypatch.setattr(kb.embedding_model, 'encode', encode)
+    return started, release
+
+
+def test_state_transitions(kb, gate):
+    """上传后依次为 pending/embedding，编码完成后为 ready 且块已在向量索引中"""
+    started, release = gate
+    with contextlib.redirect_stdout(io.StringIO()):
+        doc_id = kb.add_document('新文档.txt', CONTENT)
+    assert kb.get_indexing_state(doc_id) in ('pending', 'embedding')
+    # 编码前即可关键词检索
+    assert any(result['document_id'] == doc_id for result in kb._keyword_search('机器学习'))
+
+    assert started.wait(10)
+    assert kb.get_indexing_state(doc_id) == 'embedding'
+    assert doc_id not in kb.semantic_chunk_ranges
+    release.set()
+    wait_for_embedding(kb)
+
+    assert kb.get_indexing_state(doc_id) == 'ready'
+    assert kb.semantic_chunk_ranges[doc_id] == kb.document_chunk_ranges[doc_id]
+    assert indexed_chunk_ids(kb) == live_chunk_ids(kb)
+
+
+def test_failed_embedding(kb, monkeypatch):
+    """编码失败时状态为 failed 并记录原因，文档仍可关键词检索"""
+    def encode(texts, **kwargs):
+        raise RuntimeError('模型不可用')
+
+    monkeypatch.setattr(kb.embedding_model, 'encode', encode)
+    with contextlib.redirect_stdout(io.StringIO()):
+        doc_id = kb.add_document('新文档.txt', CONTENT)
+    wait_for_embedding(kb)
+    assert kb.get_indexing_state(doc_id) == 'failed'
+    assert '模型不可用' in kb.indexing_errors[doc_id]
+    assert any(result['document_id'] == doc_id for result in kb._keyword_search('机器学习'))
+
+
+def test_synchronous_embedding(make_semantic_kb):
+    """关闭后台编码时上传返回前已收录到向量索引"""
+    kb = make_semantic_kb([('新文档.txt', CONTENT)], background_embedding=False)
+    doc_id = kb.documents[0]['id']
+    assert kb.get_indexing_state(doc_id) == 'ready'
+    assert indexed_chunk_ids(kb) == live_chunk_ids(kb)
+
+
+def test_delete_while_queued(kb, gate):
+    """排队期间删除的文档不再编码，状态被清除"""
+    started, release = gate
+    with contextlib.redirect_stdout(io.StringIO()):
+        first = kb.add_document('新文档.txt', CONTENT)
+        assert started.wait(10)
+        second = kb.add_document('排队文档.txt', CONTENT + '区块链')
+        assert kb.get_indexing_state(second) == 'pending'
+        assert kb.delete_document(second)
+    release.set()
+    wait_for_embedding(kb)
+    assert kb.get_indexing_state(first) == 'ready'
+    assert second not in kb.indexing_states
+    assert indexed_chunk_ids(kb) == live_chunk_ids(kb)
+
+
+def test_delete_during_embedding_leaves_no_orphans(kb, monkeypatch):
+    """文档在向量写入时被删除：不记为失败，删除完成后向量索引中没有该文档的块"""
+    original = kb.document_store.set_chunk_embeddings
+    deleted = []
+
+    def delete_then_store(chunk_ids, embeddings):
+        # 后台线程已持有 semantic_update_lock；删除先移除文档和块区间，再等待该锁
+        doc_id = kb.chunk_documents.get(chunk_ids[0])
+        if doc_id is not None and not deleted:
+            deleter = threading.Thread(target=kb.delete_document, args=(doc_id,))
+            deleted.append((doc_id, deleter))
+            deleter.start()
+            for _ in range(1000):
+                if doc_id not in kb.document_chunk_ranges:
+                    break
+                time.sleep(0.01)
+        return original(chunk_ids, embeddings)
+
+    monkeypatch.setattr(kb.document_store, 'set_chunk_embeddings', delete_then_store)
+    with contextlib.redirect_stdout(io.StringIO()):
+        kb.add_document('新文档.txt', CONTENT)
+        wait_for_embedding(kb)
+        doc_id, deleter = deleted[0]
+        deleter.join(10)
+    assert doc_id not in kb.documents_by_id
+    assert doc_id not in kb.indexing_states and doc_id not in kb.indexing_errors
+    assert doc_id not in kb.semantic_chunk_ranges
+    assert indexed_chunk_ids(kb) == live_chunk_ids(kb)
+
+
+def test_semantic_searches_share_vector_index(kb):
+    """向量索引的读锁被占用（另一个检索进行中）时，语义检索不被阻塞"""
+    results = []
+    with kb.vector_index_lock.read():
+        searcher = threading.Thread(target=lambda: results.append(kb._semantic_search('量子计算')))
+        searcher.start()
+        searcher.join(10)
+        assert not searcher.is_alive()
+    assert results[0] and results[0][0]['filename'] == '已有文档.txt'
+
+
+def test_semantic_search_during_updates(kb):
+    """多个线程语义检索的同时后台编码新文档并删除文档，检索不出错"""
+    errors = []
+    stop = threading.Event()
+
+    def searcher():
+        try:
+            while not stop.is_set():
+                kb._semantic_search_many(['机器学习', '量子计算', '神经网络'])
+        except Exception as e:
+            errors.append(e)
+
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        threads = [threading.Thread(target=searcher) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        try:
+            for index in range(20):
+                doc_id = kb.add_document(f'文档{index}.txt', CONTENT * (index % 3 + 1))
+                if index % 2:
+                    kb.delete_document(doc_id)
+            kb.embedding_queue.join()
+        finally:
+            stop.set()
+            for thread in threads:
+                thread.join()
+
+    # 语义检索内部捕获异常后只打印，从输出中检查
+    assert not errors and '语义搜索失败' not in output.getvalue(), errors
+    assert indexed_chunk_ids(kb) == live_chunk_ids(kb)
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+BM25打分测试：批量打分（稀疏矩阵乘法）与逐个查询打分一致，文档增删后结果随之更新
+运行: python -m pytest test_scripts/test_bm25.py
+"""
+
+import os
+import sys
+import random
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+
+import models.bm25 as bm25_module
+from models.bm25 import BM25Scorer
+from models.inverted_index import InvertedIndex
+
+VOCABULARY = ['机器学习', '深度学习', '神经网络', '数据', '量子', '计算', '区块链', '云计算', 'python', '图像']
+
+
+def make_index(num_documents, seed):
+    rng = random.Random(seed)
+    index = InvertedIndex()
+    for doc_id in range(num_documents):
+        terms = rng.sample(VOCABULARY, rng.randint(1, 5))
+        index.add_document(doc_id, {term: rng.randint(1, 6) for term in terms})
+    return index
+
+
+def random_queries(count, seed):
+    rng = random.Random(seed)
+    # 包含重复词和不存在的词
+    return [rng.sample(VOCABULARY + ['不存在'], rng.randint(1, 4)) * rng.randint(1, 2) for _ in range(count)] + [[]]
+
+
+def assert_scores_equal(batch, single):
+    assert set(batch) == set(single)
+    for doc_id, score in single.items():
+        assert batch[doc_id] == pytest.approx(score, rel=1e-9, abs=1e-12)
+
+
+@pytest.mark.parametrize('use_scipy', [True, False])
+def test_score_many_matches_score(use_scipy, monkeypatch):
+    if use_scipy and not bm25_module.SCIPY_AVAILABLE:
+        pytest.skip('未安装scipy')
+    monkeypatch.setattr(bm25_module, 'SCIPY_AVAILABLE', use_scipy)
+    scorer = BM25Scorer(make_index(200, 1))
+    queries = random_queries(40, 2)
+    for terms, batch in zip(queries, scorer.score_many(queries)):
+        assert_scores_equal(batch, scorer.score(terms))
+
+
+def test_score_many_min_score():
+    scorer = BM25Scorer(make_index(200, 3))
+    queries = random_queries(20, 4)
+    for terms, batch in zip(queries, scorer.score_many(queries, min_score=0.3)):
+        expected = {doc_id: score for doc_id, score in scorer.score(terms).items() if score > 0.3}
+        assert_scores_equal(batch, expected)
+
+
+def test_score_many_after_document_changes():
+    """删除和新增文档后，批量打分不使用过期的倒排数组缓存，结果仍与逐个打分一致"""
+    index = make_index(100, 5)
+    scorer = BM25Scorer(index)
+    queries = random_queries(20, 6)
+    scorer.score_many(queries)
+
+    for doc_id in range(0, 100, 3):
+        index.remove_document(doc_id)
+    index.add_document(500, {'机器学习': 3, '神经网络': 1})
+    results = scorer.score_many(queries)
+    for terms, batch in zip(queries, results):
+        assert_scores_equal(batch, scorer.score(terms))
+        assert not any(doc_id % 3 == 0 and doc_id < 100 for doc_id in batch)
+    assert 500 in scorer.score_many([['机器学习']])[0]
+
+
+def test_empty_index():
+    scorer = BM25Scorer(InvertedIndex())
+    assert scorer.score(['机器学习']) == {}
+    assert scorer.score_many([['机器学习'], []]) == [{}, {}]
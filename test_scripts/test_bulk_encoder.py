@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+多进程批量编码的测试：按长度分批、批次乱序完成时位置与向量的对应、全量补齐块向量的结果与逐块编码一致
+工作进程池替换为线程池，在当前进程中运行工作进程的初始化和编码函数，不加载真实模型
+运行: python -m pytest test_scripts/test_bulk_encoder.py
+"""
+
+import io
+import os
+import time
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+import services.bulk_encoder as bulk_encoder_module
+from config import Config
+from services.bulk_encoder import BulkEncoder, length_sorted_batches
+from services.embedding_service import _write_model_manifest
+
+SENTENCES = [
+    "机器学习是人工智能的一个重要分支，它使计算机能够从数据中学习。",
+    "深度学习使用多层神经网络来学习数据的表示，卷积神经网络擅长图像识别。",
+    "量子计算利用量子比特进行计算，叠加和纠缠是其核心原理。",
+    "区块链是一种分布式账本技术，云计算提供按需的计算资源。",
+]
+
+
+class ThreadPool(ThreadPoolExecutor):
+    """代替spawn进程池：接受相同的参数，在线程中运行初始化函数"""
+
+    def __init__(self, max_workers, mp_context=None, initializer=None, initargs=()):
+        super().__init__(max_workers, initializer=initializer, initargs=initargs)
+
+
+class LengthModel:
+    """向量为 [文本长度, 首字符编码]；最短的文本所在批次编码较慢，使批次乱序完成"""
+
+    def __init__(self, slow_length=None):
+        self.slow_length = slow_length
+
+    def encode(self, texts, **kwargs):
+        if self.slow_length in map(len, texts):
+            time.sleep(0.2)
+        return np.array([[len(text), ord(text[0])] for text in texts], dtype='float64')
+
+
+@pytest.fixture
+def worker_model(monkeypatch):
+    """工作进程的初始化改为设置给定的模型，返回记录初始化参数的列表和设置模型的函数"""
+    init_args = []
+    models = []
+
+    def init_worker(model_path, num_threads):
+        init_args.append((model_path, num_threads))
+        bulk_encoder_module._worker_model = models[0]
+
+    monkeypatch.setattr(bulk_encoder_module, 'ProcessPoolExecutor', ThreadPool)
+    monkeypatch.setattr(bulk_encoder_module, '_init_worker', init_worker)
+    monkeypatch.setattr(bulk_encoder_module, '_worker_model', None)
+    return init_args, models.append
+
+
+def test_length_sorted_batches():
+    texts = ['x' * length for length in (5, 1, 9, 3, 7, 2, 8)]
+    batches = length_sorted_batches(texts, 3)
+    assert [len(batch) for batch in batches] == [3, 3, 1]
+    assert sorted(position for batch in batches for position in batch) == list(range(len(texts)))
+    lengths = [len(texts[position]) for batch in batches for position in batch]
+    assert lengths == sorted(lengths)
+    assert length_sorted_batches([], 3) == []
+
+
+def test_positions_match_embeddings_out_of_order(worker_model):
+    """批次乱序完成时，产出的位置列表与向量逐行对应，每个位置恰好产出一次"""
+    init_args, set_model = worker_model
+    texts = [chr(0x4e00 + index) * ((index * 7) % 40 + 1) for index in range(40)]  # 长度为1..40的一个排列
+    set_model(LengthModel(slow_length=1))
+    encoder = BulkEncoder('/models/fake', workers=2, batch_size=4)
+    results = list(encoder.encode(texts))
+
+    assert min(map(len, (texts[i] for i in results[0][0]))) > 1  # 最短文本的批次不是最先完成的
+    yielded = [position for positions, _ in results for position in positions]
+    assert sorted(yielded) == list(range(len(texts)))
+    for positions, embeddings in results:
+        assert embeddings.dtype == np.float32
+        assert embeddings.tolist() == [[len(texts[i]), ord(texts[i][0])] for i in positions]
+    assert {model_path for model_path, _ in init_args} == {'/models/fake'}
+    report = encoder.report()
+    assert (report['chunks'], report['batches'], report['workers']) == (40, 10, 2)
+
+
+@pytest.fixture
+def kb(make_semantic_kb, tmp_path, monkeypatch):
+    """有语义索引的知识库，模型清单指向一个临时的模型目录，块向量已清除"""
+    kb = make_semantic_kb([(f'文档{index}.txt', SENTENCES[index % len(SENTENCES)] * (index % 5 + 1))
+                           for index in range(30)])
+    model_dir = tmp_path / 'model'
+    model_dir.mkdir()
+    for name in ('config.json', 'tokenizer_config.json'):
+        (model_dir / name).write_text('{}')
+    _write_model_manifest(kb._embedding_manifest_path(), kb.embedding_model_name, str(model_dir), 'cache')
+    kb.document_store.clear_chunk_embeddings()
+    monkeypatch.setattr(Config, 'BULK_ENCODE_WORKERS', 3)
+    monkeypatch.setattr(Config, 'BULK_ENCODE_MIN_CHUNKS', 1)
+    monkeypatch.setattr(Config, 'BULK_ENCODE_BATCH_SIZE', 4)
+    return kb
+
+
+def stored_embeddings(kb):
+    return {int(chunk_id): vector for chunk_ids, vectors in kb.document_store.iter_chunk_embeddings()
+            for chunk_id, vector in zip(chunk_ids, vectors)}
+
+
+def expected_embeddings(kb):
+    chunks = [chunk for doc_id in kb.document_chunk_ranges for chunk in kb.document_store.get_document_chunks(doc_id)]
+    vectors = type(kb.embedding_model)().encode([text for _, text in chunks])
+    return {chunk_id: vector for (chunk_id, _), vector in zip(chunks, vectors)}
+
+
+@pytest.mark.parametrize('use_cache', [False, True])
+def test_bulk_backfill_matches_per_chunk_encoding(kb, worker_model, use_cache):
+    """多进程补齐的块向量写回对应的块ID，与逐块编码的结果一致；嵌入缓存命中的块不再交给工作进程"""
+    init_args, set_model = worker_model
+    set_model(type(kb.embedding_model)())
+    if not use_cache:
+        kb.embedding_cache = None
+    with contextlib.redirect_stdout(io.StringIO()):
+        kb._backfill_chunk_embeddings()
+
+    stored, expected = stored_embeddings(kb), expected_embeddings(kb)
+    assert set(stored) == set(expected)
+    for chunk_id, vector in expected.items():
+        assert np.allclose(stored[chunk_id], vector, atol=1e-6)
+    if use_cache:
+        assert kb.encode_stats['cache_hits'] == len(expected)
+        assert kb.encode_stats['chunks'] == 0 and not init_args
+    else:
+        assert kb.encode_stats['chunks'] == len(expected) and kb.encode_stats['workers'] == 3
+        assert init_args and init_args[0][0] == os.path.join(kb.knowledge_base_path, 'model')
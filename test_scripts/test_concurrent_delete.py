@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+检索与增删文档并发执行的测试（只使用词法检索，不加载嵌入模型）
+运行: python -m pytest test_scripts/test_concurrent_delete.py
+"""
+
+import io
+import threading
+import contextlib
+
+import pytest
+
+SENTENCES = [
+    "机器学习是人工智能的一个重要分支，它使计算机能够从数据中学习。",
+    "深度学习使用多层神经网络来学习数据的表示，卷积神经网络擅长图像识别。",
+    "数据科学结合了统计学、计算机科学和领域知识，Python是常用的编程语言。",
+    "量子计算利用量子比特进行计算，叠加和纠缠是其核心原理。",
+    "区块链是一种分布式账本技术，云计算提供按需的计算资源。",
+]
+QUERIES = ['机器学习', '神经网络图像识别', '量子计算', 'Python', '区块链技术']
+
+
+def make_document(index):
+    content = ''.join(SENTENCES[(index + offset) % len(SENTENCES)] for offset in range(3)) * 2
+    return f'文档{index}.txt', content
+
+
+@pytest.fixture
+def kb(make_kb):
+    kb = make_kb([make_document(index) for index in range(40)])
+    kb.result_cache.max_entries = 0
+    return kb
+
+
+def test_deleted_document_not_in_results(kb):
+    """删除后的文档不再出现在检索结果中"""
+    doc_id = kb.documents[0]['id']
+    with contextlib.redirect_stdout(io.StringIO()):
+        assert any(result['document_id'] == doc_id for result in kb.search('机器学习', max_results=50))
+        assert kb.delete_document(doc_id)
+        results = kb.search('机器学习', max_results=50)
+    assert results
+    assert all(result['document_id'] != doc_id for result in results)
+    assert doc_id not in kb.inverted_index.document_terms
+
+
+def test_search_skips_document_deleted_after_candidates(kb, monkeypatch):
+    """候选文档的正文在打分前被删除（读取到None）时跳过该文档，而不是抛出异常"""
+    monkeypatch.setattr(kb.document_store, 'get_content', lambda doc_id: None)
+    with contextlib.redirect_stdout(io.StringIO()):
+        results = kb.search('机器学习是人工智能')
+    assert isinstance(results, list)
+
+
+def test_delete_during_search(kb):
+    """多个线程检索的同时增删文档，检索线程不应出错"""
+    errors = []
+    stop = threading.Event()
+
+    def searcher():
+        try:
+            while not stop.is_set():
+                for query in QUERIES:
+                    kb.search(query)
+                    kb._keyword_search(query)
+                kb.search_many(QUERIES)
+        except Exception as e:
+            errors.append(e)
+            stop.set()
+
+    def mutator():
+        try:
+            for index in range(40, 100):
+                if stop.is_set():
+                    break
+                kb.delete_document(kb.documents[0]['id'])
+                kb.add_document(*make_document(index))
+        finally:
+            stop.set()
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        threads = [threading.Thread(target=searcher) for _ in range(4)] + [threading.Thread(target=mutator)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    assert not errors, errors
+    assert len(kb.documents) == 40
+    assert set(kb.inverted_index.document_terms) == {doc['id'] for doc in kb.documents}
+
+
+def test_concurrent_uploads_get_disjoint_chunks(kb):
+    """多个线程同时上传和删除，文档列表与ID索引一致，各文档的块ID区间互不重叠"""
+    errors = []
+    deleted = [doc['id'] for doc in kb.documents[:10]]
+
+    def uploader(offset):
+        try:
+            for index in range(offset, offset + 15):
+                kb.add_document(*make_document(index))
+        except Exception as e:
+            errors.append(e)
+
+    def deleter():
+        for doc_id in deleted:
+            kb.delete_document(doc_id)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        threads = [threading.Thread(target=uploader, args=(offset,)) for offset in (100, 200, 300, 400)]
+        threads.append(threading.Thread(target=deleter))
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    assert not errors, errors
+    assert len(kb.documents) == 40 + 60 - 10
+    assert {doc['id'] for doc in kb.documents} == set(kb.documents_by_id)
+    assert not set(deleted) & set(kb.documents_by_id)
+    chunk_ids = [chunk_id for start, end in kb.document_chunk_ranges.values() for chunk_id in range(start, end)]
+    assert len(chunk_ids) == len(set(chunk_ids))
+    assert max(chunk_ids) < kb.next_chunk_id
@@ -98,7 +98,7 @@ def test_delete_functionality():
                     # 检查相关索引是否更新
                     print(f"\n   🔄 检查索引更新状态:")
                     print(f"   - 文件名模式数量: {len(kb.filename_patterns)}")
-                    print(f"   - TF-IDF矩阵: {'已更新' if kb.tfidf_matrix is not None else '未初始化'}")
+                    print(f"   - 倒排索引文档数: {len(kb.inverted_index)}")
                     if hasattr(kb, 'embedding_index') and kb.embedding_index:
                         print(f"   - 语义索引: 已更新")
                     else:
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+嵌入向量缓存（按(模型名, 文本哈希)持久化，按最近使用时间淘汰）测试
+运行: python -m pytest test_scripts/test_embedding_cache.py
+"""
+
+import numpy as np
+import pytest
+
+import services.embedding_cache as embedding_cache_module
+from services.embedding_cache import EmbeddingCache, text_hash
+
+MODEL = 'sentence-transformers/all-MiniLM-L6-v2'
+
+
+@pytest.fixture
+def now(monkeypatch):
+    """可手动推进的时钟，使最近使用时间互不相同"""
+    now = [1000.0]
+    monkeypatch.setattr(embedding_cache_module.time, 'time', lambda: now[0])
+    return now
+
+
+def vectors(count, seed=0):
+    return np.random.default_rng(seed).standard_normal((count, 8)).astype('float32')
+
+
+def test_hit_miss_and_model_key(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / 'cache.db'))
+    hashes = [text_hash(text) for text in ('机器学习', '深度学习')]
+    cache.put_many(MODEL, hashes, vectors(2))
+    found = cache.get_many(MODEL, hashes + [text_hash('量子计算'), hashes[0]])
+    assert set(found) == set(hashes)
+    assert np.array_equal(found[hashes[1]], vectors(2)[1])
+    # 不同模型的向量互不复用
+    assert cache.get_many('other-model', hashes) == {}
+    assert cache.get_stats() == {'entries': 2, 'max_entries': 200000, 'hits': 2, 'misses': 3}
+
+
+def test_persists_across_instances(tmp_path):
+    path = str(tmp_path / 'cache.db')
+    EmbeddingCache(path).put_many(MODEL, ['a', 'b'], vectors(2))
+    cache = EmbeddingCache(path)
+    assert cache.get_stats()['entries'] == 2
+    assert np.array_equal(cache.get_many(MODEL, ['b'])['b'], vectors(2)[1])
+
+
+def test_evicts_least_recently_used(tmp_path, now):
+    """超过容量（含10%余量）时淘汰最久未使用的条目，命中会刷新使用时间"""
+    cache = EmbeddingCache(str(tmp_path / 'cache.db'), max_entries=10)
+    for index in range(10):
+        now[0] += 1
+        cache.put_many(MODEL, [f'h{index}'], vectors(1, index))
+    now[0] += 1
+    cache.get_many(MODEL, ['h0', 'h1'])
+    now[0] += 1
+    cache.put_many(MODEL, ['h10'], vectors(1, 10))
+    assert cache.get_stats()['entries'] == 11  # 未超过余量，不淘汰
+    now[0] += 1
+    cache.put_many(MODEL, ['h11', 'h12'], vectors(2, 11))
+    assert cache.get_stats()['entries'] == 10
+    remaining = set(cache.get_many(MODEL, [f'h{index}' for index in range(13)]))
+    assert remaining == {'h0', 'h1'} | {f'h{index}' for index in range(5, 13)}
+
+
+def test_knowledge_base_reuses_cached_chunks(make_semantic_kb):
+    """内容相同的块再次入库时从缓存读取向量，不再调用模型编码"""
+    content = '机器学习是人工智能的一个重要分支，它使计算机能够从数据中学习。' * 4
+    kb = make_semantic_kb([('机器学习.txt', content)])
+    model = kb.embedding_model
+    assert model.encoded
+    model.encoded.clear()
+    hits = kb.embedding_cache.get_stats()['hits']
+    kb.add_document('机器学习副本.txt', content)
+    assert not model.encoded
+    assert kb.embedding_cache.get_stats()['hits'] > hits
+    first, second = (kb.document_store.get_document_chunks(doc['id']) for doc in kb.documents)
+    assert [text for _, text in first] == [text for _, text in second]
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+嵌入模型解析的测试：模型清单的使用与失效、本地缓存查找、备选模型
+使用假的 SentenceTransformer 和临时的 Hugging Face 缓存目录，不加载真实模型
+运行: python -m pytest test_scripts/test_embedding_service.py
+"""
+
+import io
+import os
+import json
+import contextlib
+
+import pytest
+
+import services.embedding_service as embedding_service
+from services.embedding_service import load_embedding_model_smart, manifest_model_path
+
+PRIMARY = 'sentence-transformers/all-MiniLM-L6-v2'
+FALLBACK = 'paraphrase-multilingual-MiniLM-L12-v2'
+
+
+class FakeLoader:
+    """假的 SentenceTransformer：记录每次加载的参数，broken 中的路径或模型名加载失败"""
+
+    def __init__(self):
+        self.calls = []
+        self.broken = set()
+
+    def __call__(self, name_or_path, local_files_only=False):
+        self.calls.append(name_or_path)
+        if name_or_path in self.broken or (os.path.isabs(name_or_path) and not os.path.isdir(name_or_path)):
+            raise OSError(f'无法加载 {name_or_path}')
+        return ('model', name_or_path)
+
+
+@pytest.fixture
+def hub(tmp_path, monkeypatch):
+    """空的 Hugging Face 缓存目录，屏蔽本机的真实缓存"""
+    hub = tmp_path / 'hub'
+    hub.mkdir()
+    monkeypatch.setenv('HOME', str(tmp_path / 'home'))
+    monkeypatch.setenv('HF_HUB_CACHE', str(hub))
+    monkeypatch.delenv('HF_HOME', raising=False)
+    return hub
+
+
+@pytest.fixture
+def loader(monkeypatch):
+    loader = FakeLoader()
+    monkeypatch.setattr(embedding_service, 'EMBEDDING_AVAILABLE', True)
+    monkeypatch.setattr(embedding_service, 'SentenceTransformer', loader, raising=False)
+    return loader
+
+
+@pytest.fixture
+def manifest_path(tmp_path):
+    return str(tmp_path / 'embedding_model.json')
+
+
+def add_snapshot(hub, repo_id, revision='abc123'):
+    """在缓存目录中放入一个模型快照（refs/main 指向它），返回快照目录"""
+    model_dir = hub / f"models--{repo_id.replace('/', '--')}"
+    snapshot = model_dir / 'snapshots' / revision
+    snapshot.mkdir(parents=True)
+    for name in embedding_service.MODEL_KEY_FILES:
+        (snapshot / name).write_text('{}')
+    (model_dir / 'refs').mkdir()
+    (model_dir / 'refs' / 'main').write_text(revision)
+    return str(snapshot)
+
+
+def load(model_name=PRIMARY, **kwargs):
+    kwargs.setdefault('fallback_models', [FALLBACK])
+    with contextlib.redirect_stdout(io.StringIO()):
+        return load_embedding_model_smart(model_name, return_model_name=True, **kwargs)
+
+
+def read_manifest(manifest_path):
+    with open(manifest_path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def test_cache_hit_writes_manifest_and_next_load_skips_scan(hub, loader, manifest_path, monkeypatch):
+    snapshot = add_snapshot(hub, PRIMARY)
+    model, name = load(manifest_path=manifest_path)
+    assert (model, name) == (('model', snapshot), PRIMARY)
+    assert read_manifest(manifest_path)['path'] == os.path.abspath(snapshot)
+    assert read_manifest(manifest_path)['source'] == 'cache'
+    assert manifest_model_path(manifest_path, PRIMARY) == os.path.abspath(snapshot)
+
+    def no_scan(model_name):
+        raise AssertionError('清单有效时不应扫描缓存目录')
+
+    monkeypatch.setattr(embedding_service, 'check_local_model_cache', no_scan)
+    assert load(manifest_path=manifest_path) == (('model', os.path.abspath(snapshot)), PRIMARY)
+
+
+def test_manifest_for_fallback_is_not_a_shortcut(hub, loader, manifest_path):
+    """清单记录的是备选模型时重新解析：首选模型已可用则改用首选模型并更新清单"""
+    add_snapshot(hub, f'sentence-transformers/{FALLBACK}')
+    assert load(manifest_path=manifest_path, offline=True)[1] == FALLBACK
+    assert read_manifest(manifest_path)['model_name'] == FALLBACK
+    assert manifest_model_path(manifest_path, PRIMARY) is None
+
+    snapshot = add_snapshot(hub, PRIMARY)
+    assert load(manifest_path=manifest_path, offline=True) == (('model', snapshot), PRIMARY)
+    assert read_manifest(manifest_path)['model_name'] == PRIMARY
+
+
+def test_manifest_invalidated_when_directory_removed(hub, loader, manifest_path):
+    """清单记录的目录不再完整时失效，不再按清单加载；离线且缓存中也没有完整快照时加载失败"""
+    snapshot = add_snapshot(hub, PRIMARY)
+    load(manifest_path=manifest_path)
+    os.remove(os.path.join(snapshot, 'config.json'))
+    assert manifest_model_path(manifest_path, PRIMARY) is None
+    loader.calls.clear()
+    assert load(manifest_path=manifest_path, fallback_models=[], offline=True) == (None, None)
+    assert not loader.calls
+
+
+def test_manifest_load_failure_falls_back_to_scan(hub, loader, manifest_path):
+    """按清单路径加载失败时重新解析模型，成功后覆盖清单"""
+    stale = add_snapshot(hub, 'someone/old-copy')
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        json.dump({'model_name': PRIMARY, 'path': stale, 'source': 'cache'}, f)
+    loader.broken.add(stale)
+    snapshot = add_snapshot(hub, PRIMARY)
+    assert load(manifest_path=manifest_path) == (('model', snapshot), PRIMARY)
+    assert loader.calls == [stale, snapshot]
+    assert read_manifest(manifest_path)['path'] == os.path.abspath(snapshot)
+
+
+def test_load_by_name_after_path_failure_writes_manifest(hub, loader, manifest_path):
+    """快照目录加载失败、按模型名从缓存加载成功时同样记录清单"""
+    snapshot = add_snapshot(hub, PRIMARY)
+    loader.broken.add(snapshot)
+    assert load(manifest_path=manifest_path) == (('model', PRIMARY), PRIMARY)
+    assert loader.calls == [snapshot, PRIMARY]
+    assert read_manifest(manifest_path)['model_name'] == PRIMARY
+
+
+def test_unreadable_manifest_is_ignored(hub, loader, manifest_path):
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        f.write('{损坏')
+    snapshot = add_snapshot(hub, PRIMARY)
+    assert load(manifest_path=manifest_path) == (('model', snapshot), PRIMARY)
+    assert read_manifest(manifest_path)['path'] == os.path.abspath(snapshot)
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+模糊词项索引（字符n-gram）测试
+运行: python -m pytest test_scripts/test_fuzzy_index.py
+"""
+
+import os
+import sys
+import random
+from difflib import SequenceMatcher
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+
+from models.fuzzy_index import NGramTermIndex
+from models.inverted_index import InvertedIndex
+
+
+def brute_force_similar(terms, query_word, threshold):
+    """对全部词项逐个计算相似度的参考实现"""
+    matches = {}
+    for term in terms:
+        if term == query_word:
+            continue
+        similarity = SequenceMatcher(None, query_word, term).ratio()
+        if similarity > threshold:
+            matches[term] = similarity
+    return matches
+
+
+def test_similar_terms_matches_brute_force():
+    """检索使用的阈值（0.7及以上）下，n-gram召回加精确验证的结果与全量比较一致"""
+    rng = random.Random(11)
+    alphabet = '机器学习深度神经网络数据'
+    terms = {''.join(rng.choice(alphabet) for _ in range(rng.randint(1, 6))) for _ in range(400)}
+    index = NGramTermIndex()
+    for term in terms:
+        index.add_term(term)
+    for _ in range(100):
+        query_word = ''.join(rng.choice(alphabet) for _ in range(rng.randint(1, 6)))
+        for threshold in (0.7, 0.8):
+            assert index.similar_terms(query_word, threshold) == brute_force_similar(terms, query_word, threshold)
+
+
+def test_removed_terms_are_not_returned():
+    index = NGramTermIndex()
+    for term in ('机器学习', '机器学', '深度学习'):
+        index.add_term(term)
+    assert set(index.similar_terms('机器学习', 0.4)) == {'机器学', '深度学习'}
+    index.remove_term('机器学')
+    assert set(index.similar_terms('机器学习', 0.4)) == {'深度学习'}
+    index.remove_term('机器学习')
+    index.remove_term('深度学习')
+    assert index.gram_terms == {}
+
+
+def test_inverted_index_keeps_vocabulary_in_sync():
+    """文档删除后只属于该文档的词项从模糊索引中消失，仍被其他文档使用的词项保留"""
+    index = InvertedIndex()
+    index.add_document(1, {'机器学习': 2, '神经网络': 1})
+    index.add_document(2, {'机器学习': 1})
+    index.remove_document(1)
+    assert index.similar_terms('神经网', 0.5) == {}
+    assert set(index.similar_terms('机器学', 0.5)) == {'机器学习'}
+    assert index.get_postings('机器学习') == {2: 1}
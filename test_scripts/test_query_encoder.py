@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+查询编码器（LRU记忆 + 微批处理）测试，使用确定性的假模型
+运行: python -m pytest test_scripts/test_query_encoder.py
+"""
+
+import os
+import sys
+import time
+import threading
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+
+from services.query_encoder import QueryEncoder
+
+
+class FakeModel:
+    """按文本哈希生成固定向量的模型，记录每次调用的文本"""
+
+    def __init__(self, delay=0.0, fail=False):
+        self.delay = delay
+        self.fail = fail
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def encode(self, texts, batch_size=32, show_progress_bar=False, normalize_embeddings=True):
+        with self._lock:
+            self.calls.append(list(texts))
+        if self.fail:
+            raise RuntimeError('模型错误')
+        time.sleep(self.delay)
+        return np.vstack([vector_of(text) for text in texts])
+
+
+def vector_of(text):
+    vector = np.random.default_rng(abs(hash(text)) % (2 ** 32)).standard_normal(8).astype('float32')
+    return vector / np.linalg.norm(vector)
+
+
+def test_memo_hit_skips_model():
+    model = FakeModel()
+    encoder = QueryEncoder(model, batch_window_ms=0)
+    first = encoder.encode('机器学习')
+    second = encoder.encode('机器学习')
+    assert np.array_equal(first, vector_of('机器学习'))
+    assert np.array_equal(first, second)
+    assert model.calls == [['机器学习']]
+    assert encoder.get_stats()['memo_hits'] == 1
+
+
+def test_memo_evicts_least_recently_used():
+    model = FakeModel()
+    encoder = QueryEncoder(model, batch_window_ms=0, memo_size=2)
+    encoder.encode('a')
+    encoder.encode('b')
+    encoder.encode('a')
+    encoder.encode('c')
+    encoder.encode('a')
+    encoder.encode('b')
+    assert model.calls == [['a'], ['b'], ['c'], ['b']]
+
+
+def test_encode_many_batches_misses():
+    """批量编码只把记忆未命中的文本（去重后）合并为一次模型调用，结果按输入顺序返回"""
+    model = FakeModel()
+    encoder = QueryEncoder(model, batch_window_ms=0)
+    encoder.encode('a')
+    vectors = encoder.encode_many(['b', 'a', 'c', 'b'])
+    assert model.calls == [['a'], ['b', 'c']]
+    assert np.array_equal(vectors, np.vstack([vector_of(text) for text in ['b', 'a', 'c', 'b']]))
+
+
+def test_concurrent_requests_are_batched():
+    """并发的单条请求在时间窗口内合并，每个调用方拿到自己文本的向量"""
+    model = FakeModel(delay=0.02)
+    encoder = QueryEncoder(model, batch_window_ms=20, max_batch_size=64)
+    texts = [f'查询{index}' for index in range(24)]
+    results = {}
+    errors = []
+
+    def worker(text):
+        try:
+            results[text] = encoder.encode(text)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker, args=(text,)) for text in texts]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not errors, errors
+    assert all(np.array_equal(results[text], vector_of(text)) for text in texts)
+    assert sorted(text for call in model.calls for text in call) == sorted(texts)
+    assert len(model.calls) < len(texts)
+    assert encoder.get_stats()['max_batch_size'] > 1
+
+
+def test_model_error_is_raised_to_callers():
+    encoder = QueryEncoder(FakeModel(fail=True), batch_window_ms=5)
+    with pytest.raises(RuntimeError):
+        encoder.encode('a')
+    with pytest.raises(RuntimeError):
+        encoder.encode_many(['a', 'b'])
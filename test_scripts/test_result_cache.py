@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+检索结果缓存（LRU + TTL + 知识库版本号）测试
+运行: python -m pytest test_scripts/test_result_cache.py
+"""
+
+import io
+import contextlib
+
+import pytest
+
+import services.result_cache as result_cache_module
+from services.result_cache import ResultCache
+
+
+def test_hit_returns_copy():
+    """命中时返回副本，调用方修改结果不影响缓存中的条目"""
+    cache = ResultCache(max_entries=10, ttl=0)
+    cache.put('q', 1, [{'score': 1.0}])
+    result = cache.get('q', 1)
+    assert result == [{'score': 1.0}]
+    result[0]['score'] = 0
+    assert cache.get('q', 1) == [{'score': 1.0}]
+    assert cache.get_stats()['hits'] == 2
+
+
+def test_generation_bump_invalidates_entry():
+    """版本号变化后旧条目视为未命中并被移除"""
+    cache = ResultCache(max_entries=10, ttl=0)
+    cache.put('q', 1, ['old'])
+    assert cache.get('q', 2) is None
+    assert cache.get_stats()['entries'] == 0
+    assert cache.get('q', 1) is None
+
+
+def test_ttl_expiry(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(result_cache_module.time, 'time', lambda: now[0])
+    cache = ResultCache(max_entries=10, ttl=5)
+    cache.put('q', 1, ['value'])
+    now[0] += 4
+    assert cache.get('q', 1) == ['value']
+    now[0] += 2
+    assert cache.get('q', 1) is None
+
+
+def test_lru_eviction():
+    """超过容量时淘汰最久未使用的条目，读取会刷新使用顺序"""
+    cache = ResultCache(max_entries=2, ttl=0)
+    cache.put('a', 1, 'A')
+    cache.put('b', 1, 'B')
+    assert cache.get('a', 1) == 'A'
+    cache.put('c', 1, 'C')
+    assert cache.get('b', 1) is None
+    assert cache.get('a', 1) == 'A'
+    assert cache.get('c', 1) == 'C'
+
+
+def test_disabled_cache_stores_nothing():
+    cache = ResultCache(max_entries=0)
+    assert not cache.enabled
+    cache.put('q', 1, ['value'])
+    assert cache.get('q', 1) is None
+
+
+@pytest.fixture
+def kb(make_kb):
+    return make_kb([('机器学习.txt', '机器学习是人工智能的一个重要分支，它使计算机能够从数据中学习。' * 3),
+                    ('量子计算.txt', '量子计算利用量子比特进行计算，叠加和纠缠是其核心原理。' * 3)],
+                   result_cache=ResultCache(max_entries=100, ttl=0))
+
+
+def test_knowledge_base_results_follow_document_changes(kb):
+    """新增和删除文档会更新知识库版本号，之后的检索不会返回缓存的旧结果"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        first = kb.search('深度学习神经网络')
+        assert kb.search('深度学习神经网络') == first
+        assert kb.result_cache.hits == 1
+
+        generation = kb.generation
+        doc_id = kb.add_document('深度学习.txt', '深度学习使用多层神经网络来学习数据的表示。' * 3)
+        assert kb.generation > generation
+        results = kb.search('深度学习神经网络')
+        assert any(result['document_id'] == doc_id for result in results)
+
+        generation = kb.generation
+        assert kb.delete_document(doc_id)
+        assert kb.generation > generation
+        results = kb.search('深度学习神经网络')
+    assert all(result['document_id'] != doc_id for result in results)
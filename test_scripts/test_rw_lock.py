@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+读写锁测试：读者之间不互相阻塞，写者独占，等待中的写者优先于新的读者
+运行: python -m pytest test_scripts/test_rw_lock.py
+"""
+
+import threading
+
+from utils.rw_lock import ReadWriteLock
+
+
+def test_readers_share_the_lock():
+    lock = ReadWriteLock()
+    inside = threading.Barrier(3, timeout=5)
+
+    def reader():
+        with lock.read():
+            # 三个读者必须同时持有读锁才能通过屏障
+            inside.wait()
+
+    threads = [threading.Thread(target=reader) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not inside.broken
+
+
+def test_writer_excludes_readers_and_is_preferred():
+    lock = ReadWriteLock()
+    events = []
+    lock.acquire_read()
+
+    def writer():
+        with lock.write():
+            events.append('writer')
+
+    def late_reader():
+        with lock.read():
+            events.append('reader')
+
+    writer_thread = threading.Thread(target=writer)
+    writer_thread.start()
+    while not lock._waiting_writers:
+        pass
+    reader_thread = threading.Thread(target=late_reader)
+    reader_thread.start()
+    reader_thread.join(0.1)
+    # 写者在等待时，新的读者也要排队
+    assert events == []
+    lock.release_read()
+    writer_thread.join(5)
+    reader_thread.join(5)
+    assert events == ['writer', 'reader']
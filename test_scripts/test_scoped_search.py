@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+限定文档范围的语义检索测试：只在目标文档的块中精确检索，不做全局top-k后过滤
+使用按字符哈希生成向量的假模型，不加载真实的嵌入模型
+运行: python -m pytest test_scripts/test_scoped_search.py
+"""
+
+import io
+import contextlib
+
+import numpy as np
+import pytest
+
+SENTENCES = [
+    "机器学习是人工智能的一个重要分支，它使计算机能够从数据中学习。",
+    "深度学习使用多层神经网络来学习数据的表示，卷积神经网络擅长图像识别。",
+    "数据科学结合了统计学、计算机科学和领域知识，Python是常用的编程语言。",
+]
+TARGET = "量子计算利用量子比特进行计算，叠加和纠缠是其核心原理。区块链是一种分布式账本技术。"
+
+
+@pytest.fixture
+def kb(make_semantic_kb):
+    """大量与查询相近的文档，加上一个与查询无关的目标文档（最后加入）"""
+    documents = [(f'学习笔记{index}.txt', SENTENCES[index % len(SENTENCES)] * (index % 4 + 2)) for index in range(30)]
+    return make_semantic_kb(documents + [('量子与区块链.txt', TARGET * 3)])
+
+
+def target_id(kb):
+    return next(doc['id'] for doc in kb.documents if doc['filename'] == '量子与区块链.txt')
+
+
+def quiet(function, *args, **kwargs):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return function(*args, **kwargs)
+
+
+def test_scoped_results_only_from_targets(kb):
+    """目标文档的块不在全局top-k中时，限定范围的检索仍能返回它们"""
+    doc_id = target_id(kb)
+    global_results = quiet(kb._semantic_search, '机器学习神经网络', k=5)
+    assert global_results and all(result['document_id'] != doc_id for result in global_results)
+
+    scoped = quiet(kb._semantic_search, '机器学习神经网络', k=5, document_ids=[doc_id])
+    start, end = kb.document_chunk_ranges[doc_id]
+    assert len(scoped) == min(5, end - start)
+    assert all(result['document_id'] == doc_id for result in scoped)
+    assert [result['rank'] for result in scoped] == list(range(1, len(scoped) + 1))
+
+
+def test_scoped_scores_are_exact(kb, monkeypatch):
+    """限定范围时按块向量精确计算，不访问向量索引"""
+    doc_id = target_id(kb)
+
+    def no_index_search(*args, **kwargs):
+        raise AssertionError('限定范围的检索不应访问向量索引')
+
+    monkeypatch.setattr(kb.embedding_index, 'search', no_index_search)
+    scoped = quiet(kb._semantic_search, '量子比特', k=3, document_ids=[doc_id])
+    chunk_ids, vectors = kb.document_store.get_chunk_embeddings_in_ranges([kb.document_chunk_ranges[doc_id]])
+    query = kb.embedding_model.encode(['量子比特'])[0]
+    expected = sorted(zip(vectors @ query, chunk_ids), key=lambda item: -item[0])[:3]
+    assert [result['chunk_index'] for result in scoped] == [int(chunk_id) for _, chunk_id in expected]
+    assert np.allclose([result['semantic_score'] for result in scoped], [score for score, _ in expected], atol=1e-5)
+
+
+def test_unknown_and_deleted_targets(kb):
+    doc_id = target_id(kb)
+    assert quiet(kb._semantic_search, '量子比特', document_ids=[999999]) == []
+    quiet(kb.delete_document, doc_id)
+    assert quiet(kb._semantic_search, '量子比特', document_ids=[doc_id]) == []
+
+
+def test_batch_mixes_global_and_scoped_queries(kb):
+    """批量检索中全局查询与限定范围的查询互不影响，与逐条检索的结果一致"""
+    doc_id = target_id(kb)
+    queries = ['机器学习', '量子比特', '神经网络']
+    scopes = [None, [doc_id], None]
+    batch = quiet(kb._semantic_search_many, queries, 4, document_ids_list=scopes)
+    for query, scope, results in zip(queries, scopes, batch):
+        assert results == quiet(kb._semantic_search, query, k=4, document_ids=scope)
+    assert all(result['document_id'] == doc_id for result in batch[1])
+
+
+def test_search_with_target_documents(kb):
+    """指定目标文档的完整检索只返回目标文档，检索模式为 targeted"""
+    doc_id = target_id(kb)
+    kb.result_cache.max_entries = 0
+    results = quiet(kb.search, '机器学习神经网络量子', target_documents=[doc_id])
+    assert results and all(result['document_id'] == doc_id for result in results)
+    assert results[0]['search_info']['search_mode'] == 'targeted'
@@ -87,7 +87,7 @@ def test_search_functionality():
                     print(f"结果 {j}:")
                     print(f"  文档: {result['filename']}")
                     print(f"  总分: {result['score']}")
-                    print(f"  TF-IDF分数: {result['tfidf_score']}")
+                    print(f"  BM25分数: {result['bm25_score']}")
                     print(f"  关键词分数: {result['keyword_score']}")
                     print(f"  匹配关键词: {result['matched_keywords']}")
                     print(f"  相关内容: {result['content'][:100]}...")
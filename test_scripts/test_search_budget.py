@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+检索时间预算（速度档位 + 截止时间）测试
+运行: python -m pytest test_scripts/test_search_budget.py
+"""
+
+import io
+import contextlib
+
+import pytest
+
+import services.search_budget as search_budget_module
+from services.result_cache import ResultCache
+from services.search_budget import SearchBudget, validate_budget_params
+
+
+class FakeClock:
+    """可手动推进的单调时钟，step 为每次读取后自动前进的秒数"""
+
+    def __init__(self, step=0.0):
+        self.now = 100.0
+        self.step = step
+
+    def __call__(self):
+        now = self.now
+        self.now += self.step
+        return now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(search_budget_module.time, 'monotonic', clock)
+    return clock
+
+
+def test_profile_disables_stages(clock):
+    budget = SearchBudget('fast')
+    assert not budget.allows('fuzzy')
+    assert not budget.allows('semantic')
+    assert budget.skipped == {'fuzzy': 'profile', 'semantic': 'profile'}
+    assert not budget.degraded
+    assert SearchBudget('thorough').allows('fuzzy')
+
+
+def test_unknown_profile():
+    with pytest.raises(ValueError):
+        SearchBudget('turbo')
+
+
+def test_deadline_skips_remaining_stages(clock):
+    """截止时间到达后可选阶段被跳过并记为 deadline，结果视为降级"""
+    budget = SearchBudget('thorough', time_budget_ms=50)
+    assert budget.allows('fuzzy')
+    assert budget.timeout(1.0) == pytest.approx(0.05)
+    clock.now += 0.03
+    assert budget.timeout(1.0) == pytest.approx(0.02)
+    assert budget.timeout(0.01) == 0.01
+    clock.now += 0.03
+    assert budget.expired()
+    assert budget.remaining() == 0.0
+    assert not budget.allows('semantic')
+    assert budget.degraded
+    assert budget.report()['deadline_exceeded']
+    assert budget.report()['skipped_stages'] == {'semantic': 'deadline'}
+
+
+def test_no_budget_never_expires(clock):
+    for time_budget_ms in (None, 0, -5):
+        budget = SearchBudget('balanced', time_budget_ms)
+        clock.now += 1000
+        assert budget.remaining() is None
+        assert not budget.expired()
+        assert budget.timeout(2.0) == 2.0
+
+
+def test_fork_shares_deadline_and_copies_skipped(clock):
+    budget = SearchBudget('balanced', time_budget_ms=100)
+    budget.skip('semantic', 'initializing')
+    forked = budget.fork()
+    assert forked.deadline == budget.deadline
+    assert forked.skipped == {'semantic': 'initializing'}
+    forked.skip('rerank', 'timeout')
+    assert 'rerank' not in budget.skipped
+    assert forked.degraded
+
+
+def test_validate_budget_params():
+    assert validate_budget_params(None, None) is None
+    assert validate_budget_params('fast', 20) is None
+    assert validate_budget_params('turbo', None)
+    assert validate_budget_params(None, -1)
+    assert validate_budget_params(None, True)
+    assert validate_budget_params(None, '20')
+
+
+@pytest.fixture
+def kb(make_kb):
+    return make_kb([('机器学习.txt', '机器学习是人工智能的一个重要分支，它使计算机能够从数据中学习。' * 3),
+                    ('深度学习.txt', '深度学习使用多层神经网络来学习数据的表示。' * 3)],
+                   result_cache=ResultCache(max_entries=100, ttl=0))
+
+
+def test_search_reports_profile(kb):
+    with contextlib.redirect_stdout(io.StringIO()):
+        results = kb.search('机器学习', profile='fast', time_budget_ms=0)
+    assert results
+    info = results[0]['search_info']
+    assert info['profile'] == 'fast'
+    assert info['skipped_stages'].get('fuzzy') == 'profile'
+    assert not info['deadline_exceeded']
+    assert kb.result_cache.get_stats()['entries'] == 1
+
+
+def test_expired_search_is_not_cached(kb, monkeypatch):
+    """预算在检索过程中耗尽时仍返回关键词结果，降级的结果不写入缓存"""
+    monkeypatch.setattr(search_budget_module.time, 'monotonic', FakeClock(step=1.0))
+    with contextlib.redirect_stdout(io.StringIO()):
+        results = kb.search('机器学习', profile='thorough', time_budget_ms=10)
+    assert results
+    info = results[0]['search_info']
+    assert info['deadline_exceeded']
+    assert info['skipped_stages'].get('fuzzy') == 'deadline'
+    assert kb.result_cache.get_stats()['entries'] == 0
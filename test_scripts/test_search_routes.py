@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+搜索接口参数校验测试：max_results / nprobe / ef_search 非法时返回400，不进入检索
+运行: python -m pytest test_scripts/test_search_routes.py
+"""
+
+import pytest
+from flask import Flask
+
+from config import Config
+from routes.search import init_search_routes, validate_search_params
+
+
+class FakeKnowledgeBase:
+    """记录检索调用的假知识库"""
+
+    def __init__(self):
+        self.documents = []
+        self.calls = []
+
+    def search(self, query, **kwargs):
+        self.calls.append(kwargs)
+        return []
+
+    def search_many(self, queries, **kwargs):
+        self.calls.append(kwargs)
+        return [[] for _ in queries]
+
+
+@pytest.fixture(scope='module')
+def app_and_kb():
+    # 蓝图是模块级对象，路由只能注册一次
+    kb = FakeKnowledgeBase()
+    app = Flask(__name__)
+    app.register_blueprint(init_search_routes(kb))
+    return app, kb
+
+
+@pytest.fixture
+def client(app_and_kb):
+    app, kb = app_and_kb
+    kb.calls.clear()
+    return app.test_client()
+
+
+def test_validate_search_params():
+    assert validate_search_params(None, None, None) is None
+    assert validate_search_params(5, 16, 64) is None
+    assert validate_search_params(Config.SEARCH_MAX_RESULTS_LIMIT, None, None) is None
+    assert validate_search_params(0, None, None)
+    assert validate_search_params(Config.SEARCH_MAX_RESULTS_LIMIT + 1, None, None)
+    assert validate_search_params(True, None, None)
+    assert validate_search_params(5.0, None, None)
+    assert validate_search_params(None, -1, None)
+    assert validate_search_params(None, '16', None)
+    assert validate_search_params(None, None, Config.SEARCH_EF_SEARCH_LIMIT + 1)
+
+
+@pytest.mark.parametrize('params', [
+    {'max_results': 0},
+    {'max_results': 10 ** 9},
+    {'max_results': 'all'},
+    {'nprobe': -4},
+    {'nprobe': 10 ** 9},
+    {'ef_search': 2.5},
+    {'ef_search': 10 ** 9},
+])
+def test_batch_rejects_invalid_params(client, app_and_kb, params):
+    response = client.post('/api/search/batch', json={'queries': ['机器学习'], **params})
+    assert response.status_code == 400
+    assert next(iter(params)) in response.get_json()['error']
+    assert not app_and_kb[1].calls
+
+
+def test_batch_accepts_valid_params(client, app_and_kb):
+    response = client.post('/api/search/batch',
+                           json={'queries': ['机器学习', '量子计算'], 'max_results': 10, 'nprobe': 8, 'ef_search': 128})
+    assert response.status_code == 200
+    assert len(response.get_json()['results']) == 2
+    assert app_and_kb[1].calls[0]['max_results'] == 10
+
+
+def test_single_search_rejects_invalid_params(client, app_and_kb):
+    response = client.post('/api/search', json={'query': '机器学习', 'nprobe': 0})
+    assert response.status_code == 400
+    assert not app_and_kb[1].calls
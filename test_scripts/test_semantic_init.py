@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+后台语义初始化期间删除文档的测试：初始化结束后向量索引中不残留已删除文档的块
+使用按字符哈希生成向量的假模型，不加载真实的嵌入模型
+运行: python -m pytest test_scripts/test_semantic_init.py
+"""
+
+import io
+import os
+import glob
+import contextlib
+
+import pytest
+
+import models.knowledge_base as knowledge_base_module
+from config import Config
+
+SENTENCES = [
+    "机器学习是人工智能的一个重要分支，它使计算机能够从数据中学习。",
+    "深度学习使用多层神经网络来学习数据的表示，卷积神经网络擅长图像识别。",
+    "量子计算利用量子比特进行计算，叠加和纠缠是其核心原理。",
+    "区块链是一种分布式账本技术，云计算提供按需的计算资源。",
+]
+
+
+@pytest.fixture
+def kb_path(tmp_path, make_semantic_kb):
+    """先同步建好一个有语义索引的知识库"""
+    kb = make_semantic_kb([(f'文档{index}.txt', SENTENCES[index % len(SENTENCES)] * (index + 1))
+                           for index in range(20)])
+    with contextlib.redirect_stdout(io.StringIO()):
+        kb.flush_semantic_index()
+    return str(tmp_path)
+
+
+def indexed_chunk_ids(kb):
+    return set(kb.embedding_index.ids().tolist()) - getattr(kb.embedding_index, 'deleted_ids', set())
+
+
+@pytest.mark.parametrize('missing_files', ['semantic_*', 'semantic_index.*'])
+def test_delete_during_build_leaves_no_orphans(kb_path, monkeypatch, missing_files):
+    """索引全量构建（或由块向量重建）期间删除的文档，其块在初始化结束后不在向量索引中"""
+    for path in glob.glob(os.path.join(kb_path, missing_files)):
+        os.remove(path)
+    original = knowledge_base_module.KnowledgeBase._chunk_ranges_below
+    deleted = []
+
+    def delete_then_collect(self, chunk_limit):
+        # 向量已全部加入索引、收录区间尚未确定时删除文档
+        if not deleted:
+            for doc in list(self.documents[:5]):
+                deleted.append(doc['id'])
+                self.delete_document(doc['id'])
+        return original(self, chunk_limit)
+
+    monkeypatch.setattr(knowledge_base_module.KnowledgeBase, '_chunk_ranges_below', delete_then_collect)
+    monkeypatch.setattr(Config, 'BACKGROUND_STARTUP', True)
+    with contextlib.redirect_stdout(io.StringIO()):
+        kb = knowledge_base_module.KnowledgeBase(knowledge_base_path=kb_path, upload_folder=kb_path)
+        assert kb.semantic_initialized.wait(30)
+    assert kb.semantic_ready and len(deleted) == 5
+    live_ids = {chunk_id for start, end in kb.document_chunk_ranges.values() for chunk_id in range(start, end)}
+    assert indexed_chunk_ids(kb) == live_ids
+    assert kb.embedding_index.ntotal == len(live_ids)
+    assert not set(deleted) & set(kb.semantic_chunk_ranges)
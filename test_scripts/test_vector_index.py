@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+向量索引（FAISS各索引类型与NumPy暴力检索）的增删与检索测试
+运行: python -m pytest test_scripts/test_vector_index.py
+"""
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+
+from models.vector_index import (FAISS_AVAILABLE, FAISS_INDEX_TYPES, create_vector_index, exact_search,
+                                 load_vector_index)
+
+DIMENSION = 16
+INDEX_TYPES = (FAISS_INDEX_TYPES if FAISS_AVAILABLE else ()) + ('numpy',)
+
+
+def random_vectors(count, seed):
+    vectors = np.random.default_rng(seed).standard_normal((count, DIMENSION)).astype('float32')
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def make_index(index_type, vectors, ids, storage='float32'):
+    kwargs = {'nlist': 4, 'nprobe': 4} if index_type.startswith('ivf') else {}
+    index = create_vector_index(DIMENSION, index_type, storage=storage, **kwargs)
+    if not index.is_trained:
+        index.train(vectors)
+    index.add(vectors, ids)
+    return index
+
+
+@pytest.mark.parametrize('index_type', INDEX_TYPES)
+def test_add_and_search_finds_itself(index_type):
+    """每个向量检索时自身排在第一位（ivf_pq 为有损编码，只检查召回在前几位）"""
+    vectors = random_vectors(300, 1)
+    ids = np.arange(1000, 1300)
+    index = make_index(index_type, vectors, ids)
+    assert index.ntotal == 300
+    scores, labels = index.search(vectors[:20], 5)
+    assert labels.shape == (20, 5)
+    top = 5 if index_type == 'ivf_pq' else 1
+    assert all(ids[row] in labels[row, :top] for row in range(20))
+    assert np.all(np.diff(scores, axis=1) <= 1e-5)
+
+
+@pytest.mark.parametrize('index_type', INDEX_TYPES)
+def test_search_after_remove_range(index_type):
+    """删除区间内的块ID后，检索结果中不再出现这些ID，其余ID不受影响"""
+    vectors = random_vectors(200, 2)
+    ids = np.arange(200)
+    index = make_index(index_type, vectors, ids)
+    assert index.remove_range(50, 100) == 50
+    assert index.ntotal == 150
+    assert index.remove_range(50, 100) == 0
+    _, labels = index.search(vectors, 20)
+    assert not np.any((labels >= 50) & (labels < 100))
+    if index_type != 'ivf_pq':
+        _, labels = index.search(vectors[100:110], 1)
+        assert labels[:, 0].tolist() == list(range(100, 110))
+
+
+@pytest.mark.parametrize('index_type', INDEX_TYPES)
+def test_add_after_remove(index_type):
+    """删除后新增的块（新ID，块ID不复用）可以检索到，已删除的ID不受影响"""
+    vectors = random_vectors(110, 3)
+    index = make_index(index_type, vectors[:100], np.arange(100))
+    index.remove_range(0, 10)
+    index.add(vectors[100:], np.arange(100, 110))
+    assert index.ntotal == 100
+    _, labels = index.search(vectors[100:], 5)
+    assert all(100 + row in labels[row] for row in range(10))
+    assert not np.any((labels >= 0) & (labels < 10))
+
+
+@pytest.mark.skipif(not FAISS_AVAILABLE, reason='未安装faiss')
+@pytest.mark.parametrize('storage', ('float32', 'float16', 'int8'))
+def test_flat_matches_numpy(storage):
+    """相同存储精度下，FAISS暴力检索与NumPy暴力检索的结果一致"""
+    vectors = random_vectors(500, 4)
+    ids = np.arange(500)
+    queries = random_vectors(30, 5)
+    flat = make_index('flat', vectors, ids, storage)
+    numpy_index = make_index('numpy', vectors, ids, storage)
+    flat_scores, flat_labels = flat.search(queries, 10)
+    numpy_scores, numpy_labels = numpy_index.search(queries, 10)
+    if storage == 'float32':
+        assert np.array_equal(flat_labels, numpy_labels)
+        assert np.allclose(flat_scores, numpy_scores, atol=1e-5)
+    else:
+        # 量化方式不同，只要求前几名基本一致
+        overlap = np.mean([len(set(a[:5]) & set(b[:5])) / 5 for a, b in zip(flat_labels, numpy_labels)])
+        assert overlap > 0.8
+
+
+@pytest.mark.skipif(not FAISS_AVAILABLE, reason='未安装faiss')
+def test_int8_retrains_after_data_doubles():
+    """训练样本不足的 int8 索引不因每次新增而重建，数据量超过训练样本的两倍后才需要重建"""
+    vectors = random_vectors(300, 9)
+    index = make_index('flat', vectors[:100], np.arange(100), 'int8')
+    assert not index.needs_rebuild()
+    index.add(vectors[100:150], np.arange(100, 150))
+    assert not index.needs_rebuild()
+    index.add(vectors[150:201], np.arange(150, 201))
+    assert index.needs_rebuild()
+
+
+@pytest.mark.parametrize('index_type', INDEX_TYPES)
+def test_save_and_load_keeps_removals(index_type, tmp_path):
+    """保存后重新加载的索引与原索引检索结果相同，已删除的ID（含HNSW墓碑）不会复活"""
+    vectors = random_vectors(200, 6)
+    index = make_index(index_type, vectors, np.arange(200))
+    index.remove_range(0, 40)
+    path = str(tmp_path / 'index.bin')
+    index.save(path)
+    loaded = load_vector_index(path, index.get_config())
+    assert loaded.ntotal == index.ntotal == 160
+    queries = random_vectors(10, 7)
+    assert np.array_equal(loaded.search(queries, 10)[1], index.search(queries, 10)[1])
+    _, labels = loaded.search(vectors[:40], 10)
+    assert not np.any((labels >= 0) & (labels < 40))
+
+
+def test_exact_search_pads_missing_results():
+    """候选少于k个时以-1和-inf补齐"""
+    vectors = random_vectors(3, 8)
+    scores, labels = exact_search(vectors, np.array([7, 8, 9]), vectors[:1], 5)
+    assert labels[0, 0] == 7
+    assert labels[0, 3:].tolist() == [-1, -1]
+    assert np.all(np.isinf(scores[0, 3:]))
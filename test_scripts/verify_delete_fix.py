@@ -52,7 +52,7 @@ def check_delete_method():
         print(f"\n📊 当前知识库状态:")
         print(f"   - 文档数量: {len(kb.documents)}")
         print(f"   - 文件名模式: {len(kb.filename_patterns)}")
-        print(f"   - TF-IDF矩阵: {'已构建' if kb.tfidf_matrix is not None else '未构建'}")
+        print(f"   - 倒排索引文档数: {len(kb.inverted_index)}")
         print(f"   - 语义索引: {'已构建' if hasattr(kb, 'embedding_index') and kb.embedding_index else '未构建'}")
         
     except Exception as e: